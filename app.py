@@ -1,71 +1,241 @@
 from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
-import sys
+from werkzeug.wsgi import wrap_file, FileWrapper
 import os
 import uuid
 import threading
 import time
 import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import downloader
+import cache
+import storage
+from scheduler import JobScheduler, QueueFullError, PRIORITY_SINGLE, PRIORITY_PLAYLIST
+from progress import ProgressBus, TERMINAL_STATUSES
+import state
+from janitor import Janitor
+import metrics
 
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'downloads'
 app.config['FFMPEG_FOLDER'] = 'ffmpeg_local'
+app.config['CACHE_FOLDER'] = 'cache'
+app.config['CACHE_MAX_BYTES'] = 5 * 1024 * 1024 * 1024  # 5GB
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024 * 1024  # 16GB max
+app.config['JOB_WORKERS'] = os.cpu_count() or 2  # Conversions simultanées
+# Pistes téléchargées en parallèle par un job playlist ou lot: au plus
+# JOB_WORKERS × PLAYLIST_WORKERS téléchargements (et encodages FFmpeg) simultanés
+app.config['PLAYLIST_WORKERS'] = 4
+app.config['JOB_QUEUE_SIZE'] = 50  # Au-delà: HTTP 429
+app.config['RESULT_RETENTION'] = 3600  # Durée de conservation des fichiers convertis (secondes)
+app.config['PROGRESS_TTL'] = 3600  # Conservation d'une progression terminée (secondes)
+app.config['STALE_PROGRESS_TTL'] = 6 * 3600  # Progression sans mise à jour (job interrompu)
+app.config['TEMP_FILE_TTL'] = 3600  # Fragments .part/.ytdl et dossiers de travail abandonnés
+app.config['JANITOR_INTERVAL'] = 60
+app.config['BATCH_MAX_ITEMS'] = 50  # Nombre maximum d'URLs par lot
+app.config['STATE_BACKEND'] = os.environ.get('STATE_BACKEND', 'memory')
+app.config['STORAGE_MAX_BYTES'] = 20 * 1024 * 1024 * 1024  # 20GB pour UPLOAD_FOLDER (résultats + dossiers de travail)
+app.config['STORAGE_HIGH_WATER'] = 0.9  # Éviction LRU des résultats au-delà de 90% du quota...
+app.config['STORAGE_LOW_WATER'] = 0.75  # ...jusqu'à redescendre sous 75%
+app.config['STORAGE_MIN_FREE'] = 1024 * 1024 * 1024  # Espace toujours laissé libre sur le disque
+
+# État des jobs (progressions, archives en construction): 'memory' pour un seul processus,
+# 'sqlite:///state.db' ou 'redis://...' pour plusieurs workers (gunicorn -w N)
+state_backend = state.create_backend(app.config['STATE_BACKEND'])
+
+# Progression des téléchargements: les workers y écrivent, les flux SSE s'y abonnent.
+# Les mises à jour des hooks sont fusionnées avant d'atteindre le backend (au plus une écriture
+# par progression toutes les 250 ms, états finaux immédiats)
+download_progress = ProgressBus(backend=state_backend, publish_interval=0.25)
+archive_state = ProgressBus(backend=state_backend, namespace='archives')
+# Conversions en cours par clé (média canonique + options) -> progress_id, pour regrouper les demandes identiques
+inflight = ProgressBus(backend=state_backend, namespace='inflight')
 
 # Configurer le module downloader
-downloader.setup(app.config['UPLOAD_FOLDER'], app.config['FFMPEG_FOLDER'])
+# Un worker du scheduler peut toujours lancer son job Spotify sans attendre les autres
+downloader.setup(app.config['UPLOAD_FOLDER'], app.config['FFMPEG_FOLDER'], archive_state=archive_state,
+                 playlist_workers=app.config['PLAYLIST_WORKERS'], spotdl_workers=app.config['JOB_WORKERS'])
+cache.setup(app.config['CACHE_FOLDER'], app.config['CACHE_MAX_BYTES'])
+# Une archive encore en construction n'est jamais évincée
+storage.setup(
+    app.config['UPLOAD_FOLDER'],
+    app.config['STORAGE_MAX_BYTES'],
+    app.config['STORAGE_HIGH_WATER'],
+    app.config['STORAGE_LOW_WATER'],
+    app.config['STORAGE_MIN_FREE'],
+    is_evictable=lambda path: not downloader.archive_in_progress(path)
+)
+
+# Pool de workers partagé par toutes les conversions
+scheduler = JobScheduler(app.config['JOB_WORKERS'], app.config['JOB_QUEUE_SIZE'], download_progress)
+
+# Nettoyage périodique: progressions expirées, résultats jamais récupérés, fragments abandonnés
+janitor = Janitor(app.config['JANITOR_INTERVAL'])
+janitor.add_task('progress', lambda: download_progress.expire(app.config['PROGRESS_TTL'], app.config['STALE_PROGRESS_TTL']))
+janitor.add_task('archives', lambda: archive_state.expire(app.config['PROGRESS_TTL'], app.config['STALE_PROGRESS_TTL']))
+janitor.add_task('inflight', lambda: inflight.expire(app.config['PROGRESS_TTL'], app.config['STALE_PROGRESS_TTL']))
+janitor.add_task('results', lambda: downloader.purge_expired_results(app.config['UPLOAD_FOLDER'], app.config['RESULT_RETENTION']))
+janitor.add_task('temp_files', lambda: downloader.cleanup_all_temp_files(app.config['UPLOAD_FOLDER'], app.config['TEMP_FILE_TTL']))
+janitor.add_task('storage', storage.enforce)
+janitor.start()
 
-# Dictionnaire pour stocker les progressions des téléchargements
-download_progress = {}
+metrics.Gauge('musicdl_queue_depth', "Conversions en attente dans la file", lambda: scheduler.stats()['queued'])
+metrics.Gauge('musicdl_active_jobs', "Conversions en cours d'exécution", lambda: scheduler.stats()['active'])
+metrics.Gauge('musicdl_progress_entries', "Entrées de progression conservées", lambda: len(download_progress))
+metrics.Gauge('musicdl_storage_used_bytes', "Octets occupés dans UPLOAD_FOLDER", lambda: storage.stats()['used_bytes'])
+metrics.Gauge('musicdl_storage_reserved_bytes', "Octets réservés par les jobs en cours et pas encore écrits", lambda: storage.stats()['reserved_bytes'])
 
 @app.route('/')
 def index():
     """Page d'accueil"""
     return render_template('index.html')
 
-@app.route('/convert', methods=['POST'])
-def convert_video():
-    """Endpoint principal de conversion"""
-    data = request.json
+SOURCE_ERROR = 'Source non reconnue. Veuillez utiliser une URL YouTube, SoundCloud, Spotify ou Instagram.'
+
+def detect_source_type(url, source_type='auto'):
+    """Retourne la source de l'URL ('youtube', 'soundcloud', ...) ou None si elle n'est pas reconnue"""
+    if source_type != 'auto':
+        return source_type
+    if downloader.is_youtube_url(url):
+        return 'youtube'
+    elif downloader.is_soundcloud_url(url):
+        return 'soundcloud'
+    elif downloader.is_spotify_url(url):
+        return 'spotify'
+    elif downloader.is_instagram_url(url):
+        return 'instagram'
+    return None
+
+def result_expiry():
+    """Date (timestamp) jusqu'à laquelle un résultat terminé reste téléchargeable, sauf manque de place"""
+    return time.time() + app.config['RESULT_RETENTION']
+
+def convert_item(url, source_type, custom_filename, audio_format, file_id, progress_id=None, progress_dict=None, check_cache=True):
+    """Convertit un fichier unique vers UPLOAD_FOLDER/<file_id>.<ext> (cache consulté d'abord).
+
+    check_cache=False quand l'appelant a déjà consulté le cache pour cette demande
+    (une seule consultation, donc un seul succès/échec compté par conversion).
+    Retourne (chemin du fichier, nom à proposer au téléchargement).
+    """
+    output_path = os.path.join(app.config['UPLOAD_FOLDER'], f'{file_id}.mp3')
+    cache_key = cache.make_key(url, source_type, audio_format)
+    cached = cache.lookup(cache_key, output_path) if check_cache else None
+    if cached is not None:
+        storage.added(cached['path'])
+        filename = downloader.sanitize_filename(custom_filename) if custom_filename else (cached.get('filename') or 'audio')
+        return cached['path'], filename
+    
+    final_path, final_filename = downloader.download_track(url, source_type, output_path, custom_filename, progress_id, progress_dict, audio_format)
+    # Le titre d'origine n'est pas connu si un nom personnalisé a été fourni
+    cache.store(cache_key, final_path, None if custom_filename else final_filename)
+    return final_path, final_filename
+
+def join_inflight(key, progress_id):
+    """Retourne le progress_id d'une conversion identique en cours, ou inscrit progress_id comme telle.
+
+    L'inscription passe par le backend (claim): atomique entre les workers gunicorn.
+    """
+    if key is None:
+        return None
+    for _ in range(3):
+        if inflight.claim(key, {'progress_id': progress_id, 'status': 'running'}):
+            return None
+        version, entry = inflight.entry(key)
+        if entry is None:
+            continue
+        if entry['progress_id'] == progress_id:
+            return None
+        progress = download_progress.get(entry['progress_id'])
+        if progress and progress.get('status') not in TERMINAL_STATUSES:
+            return entry['progress_id']
+        # Entrée dont la progression est terminée ou disparue (worker arrêté): retirée
+        # seulement si personne ne l'a remplacée entre-temps, puis nouvelle tentative
+        inflight.discard(key, version)
+    # Inscription disputée: conversion indépendante
+    return None
+
+def leave_inflight(key, progress_id):
+    if key is None:
+        return
+    version, entry = inflight.entry(key)
+    if entry and entry['progress_id'] == progress_id:
+        inflight.discard(key, version)
+
+def start_conversion(data):
+    """Valide une demande de conversion et la met en file d'attente.
+
+    Partagé par les modes WSGI (Flask) et ASGI; retourne (corps JSON, code HTTP, en-têtes).
+    """
     url = data.get('url')
     custom_filename = data.get('filename')
     source_type = data.get('source_type', 'auto')
+    audio_format = data.get('format') or 'mp3'
     
     if not url:
-        return jsonify({'error': 'URL manquante'}), 400
+        return {'error': 'URL manquante'}, 400, {}
+    
+    if audio_format not in downloader.AUDIO_FORMATS:
+        return {'error': f"Format non supporté. Formats disponibles: {', '.join(downloader.AUDIO_FORMATS)}"}, 400, {}
     
     # Auto-détection de la source
-    if source_type == 'auto':
-        if downloader.is_youtube_url(url):
-            source_type = 'youtube'
-        elif downloader.is_soundcloud_url(url):
-            source_type = 'soundcloud'
-        elif downloader.is_spotify_url(url):
-            source_type = 'spotify'
-        elif downloader.is_instagram_url(url):
-            source_type = 'instagram'
-        else:
-            return jsonify({'error': 'Source non reconnue. Veuillez utiliser une URL YouTube, SoundCloud, Spotify ou Instagram.'}), 400
+    source_type = detect_source_type(url, source_type)
+    if not source_type:
+        return {'error': SOURCE_ERROR}, 400, {}
     
     # Générer un ID unique pour suivre la progression
     progress_id = str(uuid.uuid4())
+    
+    # Consulter le cache avant tout accès réseau (fichiers uniques seulement)
+    if not downloader.is_playlist(url):
+        cached_path = os.path.join(app.config['UPLOAD_FOLDER'], f'{progress_id}.mp3')
+        cached = cache.lookup(cache.make_key(url, source_type, audio_format), cached_path)
+        if cached is not None:
+            storage.added(cached['path'])
+            download_progress[progress_id] = {
+                'percent': 100,
+                'status': 'completed',
+                'file_id': progress_id,
+                'filename': downloader.sanitize_filename(custom_filename) if custom_filename else (cached.get('filename') or 'audio'),
+                'is_zip': False,
+                'expires_at': result_expiry()
+            }
+            return {'success': True, 'progress_id': progress_id}, 200, {}
+    
+    # Refuser tout de suite si le quota est atteint et que rien ne peut être évincé
+    # (la place exacte est réservée par le job une fois la durée du média connue)
+    try:
+        storage.ensure_space()
+    except storage.StorageFullError as e:
+        return {'error': str(e)}, 507, {}
+
     download_progress[progress_id] = {
         'percent': 0,
         'status': 'starting'
     }
     
+    # Même média avec les mêmes options déjà en cours: suivre ce job plutôt qu'en lancer un second
+    flight_key = None if downloader.is_playlist(url) else cache.make_key(url, source_type, audio_format)
+    leader_id = join_inflight(flight_key, progress_id)
+    if leader_id:
+        download_progress.pop(progress_id, None)
+        metrics.COALESCED.inc(interface='web')
+        body = {'success': True, 'progress_id': leader_id, 'coalesced': True}
+        if custom_filename:
+            body['filename'] = downloader.sanitize_filename(custom_filename)
+        return body, 200, {}
+    
     def process_download():
         try:
             # Vérifier si c'est une playlist
             if downloader.is_playlist(url):
                 try:
-                    zip_path, zip_filename = downloader.process_playlist(url, source_type, progress_id, download_progress)
+                    zip_path, zip_filename = downloader.process_playlist(url, source_type, progress_id, download_progress, audio_format)
                     download_progress[progress_id] = {
                         'percent': 100,
                         'status': 'completed',
                         'file_id': os.path.basename(zip_path).replace('.zip', ''),
                         'filename': zip_filename,
-                        'is_zip': True
+                        'is_zip': True,
+                        'expires_at': result_expiry()
                     }
                 except Exception as e:
                     download_progress[progress_id] = {
@@ -74,19 +244,9 @@ def convert_video():
                     }
                 return
 
-            # Traitement fichier unique
-            output_path = os.path.join(app.config['UPLOAD_FOLDER'], f'{progress_id}.mp3')
-            
-            if source_type == 'youtube':
-                final_path, final_filename = downloader.download_youtube(url, output_path, custom_filename, progress_id, download_progress)
-            elif source_type == 'soundcloud':
-                final_path, final_filename = downloader.download_soundcloud(url, output_path, custom_filename, progress_id, download_progress)
-            elif source_type == 'spotify':
-                final_path, final_filename = downloader.download_spotify(url, output_path, custom_filename, progress_id, download_progress)
-            elif source_type == 'instagram':
-                final_path, final_filename = downloader.download_instagram(url, output_path, custom_filename, progress_id, download_progress)
-            else:
-                raise Exception("Type de source non supporté")
+            # Traitement fichier unique (cache déjà consulté par start_conversion)
+            final_path, final_filename = convert_item(url, source_type, custom_filename, audio_format, progress_id, progress_id, download_progress,
+                                                      check_cache=False)
             
             # Succès
             download_progress[progress_id] = {
@@ -94,7 +254,8 @@ def convert_video():
                 'status': 'completed',
                 'file_id': progress_id,
                 'filename': final_filename,
-                'is_zip': False
+                'is_zip': False,
+                'expires_at': result_expiry()
             }
             
         except Exception as e:
@@ -103,94 +264,383 @@ def convert_video():
                 'status': 'error',
                 'message': str(e)
             }
-            # Nettoyage en cas d'erreur
-            if 'output_path' in locals() and os.path.exists(output_path):
+        finally:
+            leave_inflight(flight_key, progress_id)
+
+    # Mettre le téléchargement en file d'attente (fichier unique prioritaire sur les playlists)
+    priority = PRIORITY_PLAYLIST if downloader.is_playlist(url) else PRIORITY_SINGLE
+    try:
+        scheduler.submit(progress_id, process_download, priority)
+    except QueueFullError as e:
+        leave_inflight(flight_key, progress_id)
+        download_progress.pop(progress_id, None)
+        return (
+            {'error': 'Serveur surchargé: trop de conversions en attente. Réessayez dans quelques instants.'},
+            429,
+            {'Retry-After': str(e.retry_after)}
+        )
+    
+    return {'success': True, 'progress_id': progress_id}, 200, {}
+
+@app.route('/convert', methods=['POST'])
+def convert_video():
+    """Endpoint principal de conversion"""
+    body, status, headers = start_conversion(request.json)
+    return jsonify(body), status, headers
+
+class BatchProgress:
+    """Progression d'un lot: un état par élément, publié en bloc dans progress_dict[batch_id].
+
+    Passé comme progress_dict aux fonctions de downloader (clé = index de l'élément).
+    """
+
+    def __init__(self, batch_id, items, progress_dict):
+        self.batch_id = batch_id
+        self.progress_dict = progress_dict
+        self.states = [{'index': i, 'url': item['url'], 'percent': 0, 'status': 'queued'} for i, item in enumerate(items)]
+        self.extra = {}
+        self._lock = threading.Lock()
+
+    def __setitem__(self, index, item_state):
+        with self._lock:
+            index = int(index)
+            # Les hooks de progression yt-dlp n'ont pas de 'status': élément en cours de téléchargement
+            self.states[index] = {'index': index, 'url': self.states[index]['url'], 'status': 'downloading', **item_state}
+            self._publish('downloading')
+
+    def finish(self, status='completed'):
+        with self._lock:
+            self._publish(status)
+
+    def _publish(self, status):
+        completed = sum(1 for item in self.states if item.get('status') == 'completed')
+        failed = sum(1 for item in self.states if item.get('status') == 'error')
+        total_percent = sum(100 if item.get('status') in ('completed', 'error') else item.get('percent', 0) for item in self.states)
+        self.progress_dict[self.batch_id] = {
+            'percent': 100 if status != 'downloading' else min(100, total_percent / len(self.states)),
+            'status': status,
+            'message': f'{completed + failed}/{len(self.states)} éléments traités ({failed} en échec)',
+            'completed_items': completed,
+            'failed_items': failed,
+            'total_items': len(self.states),
+            'items': [dict(item) for item in self.states],
+            **self.extra
+        }
+
+def process_batch(batch_id, items, archive_name=None):
+    """Convertit les éléments d'un lot en parallèle (un seul job pour le scheduler).
+
+    Sans archive_name, chaque élément reste téléchargeable sous son propre file_id;
+    sinon les fichiers sont ajoutés au fil de l'eau à une archive ZIP diffusable.
+    """
+    tracker = BatchProgress(batch_id, items, download_progress)
+    archive = None
+    reservation = None
+    if archive_name:
+        zip_path = os.path.join(app.config['UPLOAD_FOLDER'], f'{batch_id}.zip')
+        # Place de l'archive réservée comme pour une playlist (chaque élément réserve
+        # en plus son propre dossier de travail pendant sa conversion)
+        try:
+            reservation = storage.reserve(sum(downloader.estimate_output_bytes(None, item['format']) for item in items), zip_path)
+        except storage.StorageFullError as e:
+            download_progress[batch_id] = {'status': 'error', 'message': str(e)}
+            return
+        archive = downloader.StreamingZip(zip_path)
+        tracker.extra = {'file_id': batch_id, 'filename': archive_name, 'is_zip': True, 'streaming': True}
+
+    def run_item(i, item):
+        file_id = f'{batch_id}_{i}'
+        try:
+            tracker[i] = {'percent': 0, 'status': 'downloading'}
+            final_path, final_filename = convert_item(item['url'], item['source_type'], item.get('filename'), item['format'], file_id, str(i), tracker)
+            item_state = {'percent': 100, 'status': 'completed', 'filename': final_filename, 'is_zip': False}
+            if archive is None:
+                item_state['file_id'] = file_id
+                item_state['expires_at'] = result_expiry()
+            tracker[i] = item_state
+            return final_path, final_filename
+        except Exception as e:
+            # Un élément en échec n'interrompt pas les autres
+            print(f"Erreur sur l'élément {i} du lot {batch_id}: {e}")
+            tracker[i] = {'status': 'error', 'message': str(e)}
+            return None
+
+    try:
+        used_names = set()
+        with ThreadPoolExecutor(max_workers=downloader.PLAYLIST_WORKERS) as executor:
+            futures = [executor.submit(run_item, i, item) for i, item in enumerate(items)]
+            for future in as_completed(futures):
+                result = future.result()
+                if archive is None or result is None:
+                    continue
+                final_path, final_filename = result
+                ext = os.path.splitext(final_path)[1]
+                arcname = f'{final_filename}{ext}'
+                suffix = 2
+                while arcname in used_names:
+                    arcname = f'{final_filename} ({suffix}){ext}'
+                    suffix += 1
+                used_names.add(arcname)
+                archive.add(final_path, arcname)
+                storage.remove(final_path)
+
+        succeeded = any(item_state['status'] == 'completed' for item_state in tracker.states)
+        if archive is not None:
+            archive.close(failed=not succeeded)
+            if succeeded:
+                storage.added(archive.path)
+            tracker.extra['streaming'] = False
+            tracker.extra['expires_at'] = result_expiry()
+            if not succeeded:
                 try:
-                    os.remove(output_path)
-                except:
+                    os.remove(archive.path)
+                except OSError:
                     pass
+    finally:
+        if reservation is not None:
+            reservation.release()
+    tracker.finish('completed' if succeeded else 'error')
 
-    # Lancer le téléchargement en arrière-plan
-    thread = threading.Thread(target=process_download)
-    thread.daemon = True
-    thread.start()
-    
-    return jsonify({'success': True, 'progress_id': progress_id})
+def start_batch(data):
+    """Valide un lot d'URLs et le met en file d'attente comme un seul job.
+
+    data: {'items': [{'url', 'filename', 'format', 'source_type'}, ...], 'format', 'archive', 'archive_name'}
+    Retourne (corps JSON, code HTTP, en-têtes).
+    """
+    raw_items = data.get('items')
+    if not isinstance(raw_items, list) or not raw_items:
+        return {'error': 'Liste "items" manquante ou vide'}, 400, {}
+    if len(raw_items) > app.config['BATCH_MAX_ITEMS']:
+        return {'error': f"Trop d'éléments dans le lot (maximum {app.config['BATCH_MAX_ITEMS']})"}, 400, {}
+
+    default_format = data.get('format') or 'mp3'
+    items = []
+    for i, raw in enumerate(raw_items):
+        if isinstance(raw, str):
+            raw = {'url': raw}
+        url = raw.get('url') if isinstance(raw, dict) else None
+        if not url:
+            return {'error': f'Élément {i}: URL manquante'}, 400, {}
+        audio_format = raw.get('format') or default_format
+        if audio_format not in downloader.AUDIO_FORMATS:
+            return {'error': f"Élément {i}: format non supporté. Formats disponibles: {', '.join(downloader.AUDIO_FORMATS)}"}, 400, {}
+        source_type = detect_source_type(url, raw.get('source_type', 'auto'))
+        if not source_type:
+            return {'error': f'Élément {i}: {SOURCE_ERROR}'}, 400, {}
+        if downloader.is_playlist(url):
+            return {'error': f'Élément {i}: les playlists ne sont pas acceptées dans un lot'}, 400, {}
+        items.append({'url': url, 'filename': raw.get('filename'), 'format': audio_format, 'source_type': source_type})
+
+    archive_name = None
+    if data.get('archive'):
+        archive_name = downloader.sanitize_filename(data.get('archive_name') or '') or 'lot'
+
+    try:
+        storage.ensure_space()
+    except storage.StorageFullError as e:
+        return {'error': str(e)}, 507, {}
+
+    batch_id = str(uuid.uuid4())
+    download_progress[batch_id] = {'percent': 0, 'status': 'starting', 'total_items': len(items)}
+    try:
+        scheduler.submit(batch_id, lambda: process_batch(batch_id, items, archive_name), PRIORITY_PLAYLIST)
+    except QueueFullError as e:
+        download_progress.pop(batch_id, None)
+        return (
+            {'error': 'Serveur surchargé: trop de conversions en attente. Réessayez dans quelques instants.'},
+            429,
+            {'Retry-After': str(e.retry_after)}
+        )
+
+    return {'success': True, 'batch_id': batch_id, 'total_items': len(items)}, 200, {}
+
+def batch_sse_messages(data, sent, version):
+    """Messages SSE d'un nouvel état de lot: un événement 'item' par élément modifié, puis 'batch'.
+
+    sent mémorise ce qui a déjà été envoyé à ce client; version sert d'identifiant d'événement.
+    """
+    messages = []
+    for item in data.get('items', []):
+        if sent.get(item['index']) != item:
+            sent[item['index']] = item
+            messages.append(f"id: {version}\nevent: item\ndata: {json.dumps(item)}\n\n")
+    summary = {key: value for key, value in data.items() if key != 'items'}
+    if sent.get('batch') != summary:
+        sent['batch'] = summary
+        messages.append(f"id: {version}\nevent: batch\ndata: {json.dumps(summary)}\n\n")
+    return messages
+
+# Délai de reconnexion suggéré aux navigateurs (ms), envoyé en tête de chaque flux SSE
+SSE_RETRY_MS = 3000
+
+def last_event_id(value):
+    """Version reçue en dernier par un client SSE qui se reconnecte (en-tête Last-Event-ID)"""
+    try:
+        return max(0, int(value or 0))
+    except ValueError:
+        return 0
+
+@app.route('/batch', methods=['POST'])
+def convert_batch():
+    """Conversion d'un lot d'URLs"""
+    body, status, headers = start_batch(request.json or {})
+    return jsonify(body), status, headers
+
+@app.route('/batch-progress/<batch_id>')
+def batch_progress(batch_id):
+    """Flux SSE unique pour tous les éléments d'un lot"""
+    last_version = last_event_id(request.headers.get('Last-Event-ID'))
+
+    def generate():
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        sent = {}
+        for event in download_progress.subscribe(batch_id, timeout=150, last_version=last_version):
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                for message in batch_sse_messages(event[1], sent, event[0]):
+                    yield message
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream')
+
+def find_result_file(file_id):
+    """Retourne (chemin, mimetype) du fichier converti, ou (None, None)"""
+    for ext in downloader.AUDIO_EXTENSIONS + ['zip']:
+        path = os.path.join(app.config['UPLOAD_FOLDER'], f'{file_id}.{ext}')
+        if os.path.exists(path):
+            mimetype = 'application/zip' if ext == 'zip' else downloader.AUDIO_MIMETYPES.get(ext, 'application/octet-stream')
+            return path, mimetype
+    return None, None
+
+class MeteredFile:
+    """Fichier servi par /download: enregistre la durée et le volume de l'envoi à sa fermeture.
+
+    expected: octets annoncés (Content-Length), comptés quand le serveur envoie le fichier
+    par sendfile sans passer par read(); ce qui est lu au-delà (fin de plage) n'est pas compté.
+    """
+
+    def __init__(self, file, started):
+        self._file = file
+        self._started = started
+        self._sent = 0
+        self._closed = False
+        self.expected = 0
+
+    def read(self, *args):
+        data = self._file.read(*args)
+        self._sent += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            # Envoi par sendfile: rien ne passe par read(), la réponse annoncée a été transmise
+            sent = self._sent or self.expected
+            if self.expected:
+                sent = min(sent, self.expected)
+            if sent:
+                metrics.STAGE_SECONDS.observe(time.perf_counter() - self._started, stage='send')
+                metrics.BYTES_SERVED.inc(sent, interface='web')
+        self._file.close()
+
+def download_name_for(file_path, requested_filename=None):
+    """Nom proposé au navigateur: celui demandé (avec la bonne extension) ou celui du fichier sur disque"""
+    if requested_filename:
+        # S'assurer que l'extension est correcte
+        ext = os.path.splitext(file_path)[1]
+        if not requested_filename.lower().endswith(ext):
+            requested_filename += ext
+        return requested_filename
+    return os.path.basename(file_path)
 
 @app.route('/download/<file_id>')
 def download_file(file_id):
     """Télécharge le fichier converti"""
-    mp3_path = os.path.join(app.config['UPLOAD_FOLDER'], f'{file_id}.mp3')
-    zip_path = os.path.join(app.config['UPLOAD_FOLDER'], f'{file_id}.zip')
-    
-    if os.path.exists(mp3_path):
-        file_path = mp3_path
-        mimetype = 'audio/mpeg'
-    elif os.path.exists(zip_path):
-        file_path = zip_path
-        mimetype = 'application/zip'
-    else:
+    file_path, mimetype = find_result_file(file_id)
+    if not file_path:
         return jsonify({'error': 'Fichier non trouvé'}), 404
     
-    # Obtenir la taille du fichier pour estimer le temps de téléchargement
-    file_size = os.path.getsize(file_path)
-    
+    storage.mark_used(file_path)
     # Utiliser le nom du fichier passé en paramètre ou le nom du fichier sur disque
-    requested_filename = request.args.get('filename')
-    if requested_filename:
-        # S'assurer que l'extension est correcte
-        if not requested_filename.lower().endswith(('.mp3', '.zip')):
-            ext = os.path.splitext(file_path)[1]
-            requested_filename += ext
-        download_name = requested_filename
-    else:
-        download_name = os.path.basename(file_path)
+    download_name = download_name_for(file_path, request.args.get('filename'))
     
-    # Utiliser un générateur pour streamer le fichier et le supprimer à la fin
-    def generate():
-        try:
-            with open(file_path, "rb") as f:
-                while True:
-                    chunk = f.read(8192) # 8KB chunks
-                    if not chunk:
-                        break
-                    yield chunk
-        finally:
-            # Cette partie s'exécute après la fin du stream (ou si le client déconnecte)
+    # Archive de playlist encore en construction: on la diffuse au fil de l'eau
+    started = time.perf_counter()
+    if downloader.archive_in_progress(file_path):
+        def generate():
+            sent = 0
             try:
-                if os.path.exists(file_path):
-                    os.remove(file_path)
-                    print(f"Fichier supprimé après téléchargement: {file_path}")
-            except Exception as e:
-                print(f"Erreur lors du suppression du fichier: {e}")
-
-    response = Response(stream_with_context(generate()), mimetype=mimetype)
-    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
-    response.headers['Content-Length'] = file_size
-    return response
+                for chunk in downloader.iter_growing_file(file_path):
+                    sent += len(chunk)
+                    yield chunk
+            finally:
+                metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage='send')
+                metrics.BYTES_SERVED.inc(sent, interface='web')
 
-@app.route('/delete/<file_id>', methods=['POST'])
-def delete_file(file_id):
-    """Supprime un fichier du serveur"""
-    mp3_path = os.path.join(app.config['UPLOAD_FOLDER'], f'{file_id}.mp3')
-    zip_path = os.path.join(app.config['UPLOAD_FOLDER'], f'{file_id}.zip')
+        response = Response(stream_with_context(generate()), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+        return response
     
+    # Fichier terminé: send_file fournit les en-têtes (nom, taille, ETag, Last-Modified),
+    # le fichier est enveloppé pour mesurer l'envoi à sa fermeture, puis make_conditional
+    # gère Range / If-Range / If-None-Match. Une réponse complète est confiée au
+    # wsgi.file_wrapper du serveur (sendfile); une plage garde le FileWrapper de werkzeug,
+    # qui se positionne par seek() et se ferme avec la réponse. Le fichier reste disponible
+    # jusqu'à expiration (RESULT_RETENTION) ou /delete, ce qui permet de reprendre un téléchargement.
+    response = send_file(
+        os.path.abspath(file_path),
+        mimetype=mimetype,
+        as_attachment=True,
+        download_name=download_name,
+        conditional=False,
+        etag=True,
+        max_age=0
+    )
+    size = response.content_length
+    response.response.close()
+    metered = MeteredFile(open(file_path, 'rb'), started)
+    response.response = FileWrapper(metered)
+    try:
+        response = response.make_conditional(request.environ, accept_ranges=True, complete_length=size)
+    except Exception:
+        # 416 (plage hors du fichier): la réponse d'erreur ne lira jamais le fichier
+        metered.close()
+        raise
+    if response.status_code not in (200, 206):
+        # 304: pas de corps, le fichier est fermé tout de suite
+        metered.close()
+        response.response = []
+        return response
+    if response.status_code == 200:
+        response.response = wrap_file(request.environ, metered)
+    metered.expected = response.content_length or 0
+    return response
+
+def delete_result(file_id):
+    """Supprime les fichiers d'un résultat; retourne (corps JSON, code HTTP)"""
     try:
         deleted = False
-        if os.path.exists(mp3_path):
-            os.remove(mp3_path)
-            deleted = True
-        
-        if os.path.exists(zip_path):
-            os.remove(zip_path)
+        file_path, _ = find_result_file(file_id)
+        while file_path:
+            storage.remove(file_path)
             deleted = True
+            file_path, _ = find_result_file(file_id)
             
         if deleted:
-            return jsonify({'success': True, 'message': 'Fichier supprimé'})
+            return {'success': True, 'message': 'Fichier supprimé'}, 200
         else:
-            return jsonify({'error': 'Fichier non trouvé'}), 404
+            return {'error': 'Fichier non trouvé'}, 404
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return {'error': str(e)}, 500
+
+@app.route('/delete/<file_id>', methods=['POST'])
+def delete_file(file_id):
+    """Supprime un fichier du serveur"""
+    body, status = delete_result(file_id)
+    return jsonify(body), status
 
 @app.route('/check-progress/<progress_id>')
 def check_progress(progress_id):
@@ -201,41 +651,43 @@ def check_progress(progress_id):
     else:
         return jsonify({'status': 'not_found'}), 404
 
+def server_stats():
+    """État de la file de conversion et bilan du nettoyage"""
+    return {
+        'scheduler': scheduler.stats(),
+        'progress_entries': len(download_progress),
+        'storage': storage.stats(),
+        'janitor': janitor.stats()
+    }
+
+@app.route('/stats')
+def stats():
+    """État de la file de conversion et bilan du nettoyage"""
+    return jsonify(server_stats())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Métriques au format Prometheus"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/progress/<progress_id>')
 def progress(progress_id):
     """
     Flux SSE pour suivre la progression d'un téléchargement / conversion.
     """
+    # Reconnexion (réseau mobile instable): le navigateur renvoie l'id du dernier événement reçu
+    last_version = last_event_id(request.headers.get('Last-Event-ID'))
+
     def generate():
-        last_state = None
-        max_wait = 300  # Maximum 5 minutes d'attente (300 * 0.5s)
-        wait_count = 0
-
-        while wait_count < max_wait:
-            data = download_progress.get(progress_id)
-
-            if not data:
-                wait_count += 1
-                time.sleep(0.5)
-                continue
-
-            # Comparer les états de manière plus fiable
-            current_state_key = json.dumps(data, sort_keys=True)
-            last_state_key = json.dumps(last_state, sort_keys=True) if last_state else None
-
-            if current_state_key != last_state_key:
-                # on envoie les données au client
-                yield f"data: {json.dumps(data)}\n\n"
-                last_state = data.copy() if isinstance(data, dict) else data
-
-            # si terminé ou erreur, on envoie un dernier message et on sort
-            if data.get('status') in ('completed', 'error'):
-                # S'assurer que le dernier message est bien envoyé
-                yield f"data: {json.dumps(data)}\n\n"
-                break
-
-            time.sleep(0.5)
-            wait_count += 1
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        # Bloque sur le bus jusqu'au prochain changement (pas de polling);
+        # abandon si la conversion reste introuvable 2min30
+        for event in download_progress.subscribe(progress_id, timeout=150, last_version=last_version):
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                version, data = event
+                yield f"id: {version}\ndata: {json.dumps(data)}\n\n"
 
     return Response(stream_with_context(generate()), mimetype='text/event-stream')
 
@@ -0,0 +1,289 @@
+"""Mode ASGI de l'interface Web (mêmes routes que app.py).
+
+Les flux SSE et les téléchargements sont des coroutines: un navigateur qui suit
+une conversion ou une archive en construction n'occupe plus de thread pendant les
+attentes. Les conversions restent exécutées par le JobScheduler de app.py et les
+petites opérations bloquantes (cache, disque, backend d'état) passent par le pool
+de threads de Starlette.
+
+Lancement: uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import os
+import json
+import time
+import asyncio
+from email.utils import formatdate
+from urllib.parse import quote
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.responses import JSONResponse, Response, StreamingResponse, FileResponse
+from starlette.concurrency import run_in_threadpool
+import app as web
+import downloader
+import metrics
+import storage
+
+CHUNK_SIZE = 256 * 1024
+ARCHIVE_POLL_INTERVAL = 0.5  # Relecture d'une archive en construction (secondes)
+
+def content_disposition(download_name):
+    """En-tête Content-Disposition compatible avec les noms non ASCII"""
+    try:
+        download_name.encode('ascii')
+        return f'attachment; filename="{download_name}"'
+    except UnicodeEncodeError:
+        return f"attachment; filename*=UTF-8''{quote(download_name)}"
+
+def parse_range(range_header, size):
+    """Retourne (début, fin) inclus pour un en-tête Range à un seul intervalle.
+
+    None si l'en-tête est absent ou non géré (réponse complète), ValueError si hors limites.
+    """
+    if not range_header or not range_header.startswith('bytes=') or ',' in range_header:
+        return None
+    start, _, end = range_header[6:].strip().partition('-')
+    try:
+        if start:
+            start = int(start)
+            end = min(int(end), size - 1) if end else size - 1
+        else:
+            # bytes=-N: les N derniers octets
+            start = max(0, size - int(end))
+            end = size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise ValueError(range_header)
+    return start, end
+
+async def metered(chunks, started):
+    """Comptabilise les octets envoyés et la durée d'un envoi (étape 'send')"""
+    sent = 0
+    try:
+        async for chunk in chunks:
+            sent += len(chunk)
+            yield chunk
+    finally:
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage='send')
+        metrics.BYTES_SERVED.inc(sent, interface='web')
+
+class MeteredFileResponse(FileResponse):
+    """FileResponse qui comptabilise l'envoi d'un fichier complet (étape 'send').
+
+    Le fichier est lu par blocs de CHUNK_SIZE; un serveur qui gère l'extension ASGI
+    http.response.pathsend l'envoie lui-même (Starlette récent): seule la taille annoncée est comptée.
+    """
+    chunk_size = CHUNK_SIZE
+
+    def __init__(self, *args, started, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.started = started
+
+    async def __call__(self, scope, receive, send):
+        sent = 0
+
+        async def metered_send(message):
+            nonlocal sent
+            if message['type'] == 'http.response.body':
+                sent += len(message.get('body', b''))
+            elif message['type'] == 'http.response.pathsend':
+                sent += int(self.headers['content-length'])
+            await send(message)
+
+        try:
+            await super().__call__(scope, receive, metered_send)
+        finally:
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - self.started, stage='send')
+            metrics.BYTES_SERVED.inc(sent, interface='web')
+
+async def iter_file_range(path, start, end):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await run_in_threadpool(f.read, min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+async def iter_growing_file(path):
+    """Suit une archive en construction jusqu'à sa fermeture (voir downloader.iter_growing_file).
+
+    L'attente de nouvelles entrées est un asyncio.sleep: aucun thread n'est bloqué entre deux lectures.
+    """
+    archive = downloader.STREAMING_ARCHIVES.get(path)
+    idle_since = time.time()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = await run_in_threadpool(f.read, CHUNK_SIZE)
+            if chunk:
+                idle_since = time.time()
+                yield chunk
+                continue
+            if archive is not None:
+                done, failed = downloader.archive_status(path, archive)
+            else:
+                done, failed = await run_in_threadpool(downloader.archive_status, path)
+            if done:
+                # Dernières données écrites juste avant la fermeture
+                chunk = await run_in_threadpool(f.read)
+                if chunk and not failed:
+                    yield chunk
+                break
+            # Archive d'un autre processus qui n'avance plus (worker arrêté)
+            if archive is None and time.time() - idle_since > downloader.ARCHIVE_IDLE_TIMEOUT:
+                break
+            await asyncio.sleep(ARCHIVE_POLL_INTERVAL)
+
+async def index(request):
+    """Page d'accueil"""
+    return FileResponse(os.path.join(web.app.root_path, web.app.template_folder, 'index.html'))
+
+async def convert_video(request):
+    """Endpoint principal de conversion"""
+    try:
+        data = await request.json()
+    except ValueError:
+        return JSONResponse({'error': 'Requête JSON invalide'}, status_code=400)
+    body, status, headers = await run_in_threadpool(web.start_conversion, data)
+    return JSONResponse(body, status_code=status, headers=headers)
+
+async def convert_batch(request):
+    """Conversion d'un lot d'URLs"""
+    try:
+        data = await request.json()
+    except ValueError:
+        return JSONResponse({'error': 'Requête JSON invalide'}, status_code=400)
+    body, status, headers = await run_in_threadpool(web.start_batch, data or {})
+    return JSONResponse(body, status_code=status, headers=headers)
+
+async def download_file(request):
+    """Télécharge le fichier converti (Range, If-Range et If-None-Match gérés)"""
+    file_path, mimetype = await run_in_threadpool(web.find_result_file, request.path_params['file_id'])
+    if not file_path:
+        return JSONResponse({'error': 'Fichier non trouvé'}, status_code=404)
+
+    await run_in_threadpool(storage.mark_used, file_path)
+    download_name = web.download_name_for(file_path, request.query_params.get('filename'))
+    headers = {'Content-Disposition': content_disposition(download_name)}
+
+    # Archive de playlist encore en construction: on la diffuse au fil de l'eau
+    started = time.perf_counter()
+    if await run_in_threadpool(downloader.archive_in_progress, file_path):
+        return StreamingResponse(
+            metered(iter_growing_file(file_path), started),
+            media_type=mimetype,
+            headers=headers
+        )
+
+    stat = await run_in_threadpool(os.stat, file_path)
+    etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    headers.update({
+        'ETag': etag,
+        'Last-Modified': formatdate(stat.st_mtime, usegmt=True),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'no-cache'
+    })
+
+    if etag in request.headers.get('if-none-match', ''):
+        return Response(status_code=304, headers=headers)
+
+    # If-Range: la reprise n'est valable que si le fichier n'a pas changé
+    range_header = request.headers.get('range')
+    if_range = request.headers.get('if-range')
+    if if_range and if_range != etag:
+        range_header = None
+
+    try:
+        byte_range = parse_range(range_header, stat.st_size)
+    except ValueError:
+        headers['Content-Range'] = f'bytes */{stat.st_size}'
+        return Response(status_code=416, headers=headers)
+
+    if byte_range is None:
+        # Fichier complet: FileResponse (en-têtes de taille depuis le stat déjà fait)
+        return MeteredFileResponse(file_path, media_type=mimetype, headers=headers, stat_result=stat, started=started)
+
+    # Reprise: seule la plage demandée est lue
+    start, end = byte_range
+    headers['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    headers['Content-Length'] = str(end - start + 1)
+    return StreamingResponse(
+        metered(iter_file_range(file_path, start, end), started),
+        status_code=206,
+        media_type=mimetype,
+        headers=headers
+    )
+
+async def delete_file(request):
+    """Supprime un fichier du serveur"""
+    body, status = await run_in_threadpool(web.delete_result, request.path_params['file_id'])
+    return JSONResponse(body, status_code=status)
+
+async def check_progress(request):
+    """Endpoint simple pour vérifier le statut d'une conversion"""
+    data = await run_in_threadpool(web.download_progress.get, request.path_params['progress_id'])
+    if data:
+        return JSONResponse(data)
+    return JSONResponse({'status': 'not_found'}, status_code=404)
+
+async def stats(request):
+    """État de la file de conversion et bilan du nettoyage"""
+    return JSONResponse(await run_in_threadpool(web.server_stats))
+
+async def metrics_endpoint(request):
+    """Métriques au format Prometheus"""
+    return Response(await run_in_threadpool(metrics.render), headers={'Content-Type': metrics.CONTENT_TYPE})
+
+async def progress(request):
+    """Flux SSE pour suivre la progression d'un téléchargement / conversion"""
+    progress_id = request.path_params['progress_id']
+    last_version = web.last_event_id(request.headers.get('last-event-id'))
+
+    async def generate():
+        yield f"retry: {web.SSE_RETRY_MS}\n\n"
+        async for event in web.download_progress.subscribe_async(progress_id, timeout=150, last_version=last_version):
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                version, data = event
+                yield f"id: {version}\ndata: {json.dumps(data)}\n\n"
+
+    return StreamingResponse(generate(), media_type='text/event-stream')
+
+async def batch_progress(request):
+    """Flux SSE unique pour tous les éléments d'un lot"""
+    batch_id = request.path_params['batch_id']
+    last_version = web.last_event_id(request.headers.get('last-event-id'))
+
+    async def generate():
+        yield f"retry: {web.SSE_RETRY_MS}\n\n"
+        sent = {}
+        async for event in web.download_progress.subscribe_async(batch_id, timeout=150, last_version=last_version):
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                for message in web.batch_sse_messages(event[1], sent, event[0]):
+                    yield message
+
+    return StreamingResponse(generate(), media_type='text/event-stream')
+
+routes = [
+    Route('/', index),
+    Route('/convert', convert_video, methods=['POST']),
+    Route('/download/{file_id}', download_file),
+    Route('/delete/{file_id}', delete_file, methods=['POST']),
+    Route('/check-progress/{progress_id}', check_progress),
+    Route('/stats', stats),
+    Route('/metrics', metrics_endpoint),
+    Route('/progress/{progress_id}', progress),
+    Route('/batch', convert_batch, methods=['POST']),
+    Route('/batch-progress/{batch_id}', batch_progress),
+]
+
+app = Starlette(routes=routes)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=5000)
@@ -3,8 +3,17 @@ import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 import downloader
+import cache
+import storage
+from janitor import Janitor
+import metrics
 import asyncio
 import shutil
+import uuid
+import io
+import tracklist
+import fingerprint
+from singleflight import SingleFlight
 
 # Charger les variables d'environnement
 load_dotenv()
@@ -13,7 +22,34 @@ TOKEN = os.getenv('DISCORD_TOKEN')
 # Configuration
 UPLOAD_FOLDER = 'downloads_bot'
 FFMPEG_FOLDER = 'ffmpeg_local'
+CACHE_FOLDER = 'cache'  # Partagé avec l'interface Web
 downloader.setup(UPLOAD_FOLDER, FFMPEG_FOLDER)
+cache.setup(CACHE_FOLDER)
+
+# Index local des empreintes déjà identifiées par !find (consulté avant Shazam)
+FINGERPRINT_INDEX = 'fingerprints.db'
+fingerprint.setup(FINGERPRINT_INDEX)
+
+# Quota de downloads_bot: les jobs réservent leur place et sont refusés si le disque est plein
+STORAGE_MAX_BYTES = 10 * 1024 * 1024 * 1024  # 10 Go
+storage.setup(UPLOAD_FOLDER, STORAGE_MAX_BYTES, is_evictable=lambda path: not downloader.archive_in_progress(path))
+
+# Fichiers laissés dans downloads_bot après un crash (résultats non envoyés, fragments, dossiers de travail)
+LEFTOVER_TTL = 3600
+janitor = Janitor(interval=300)
+janitor.add_task('results', lambda: downloader.purge_expired_results(UPLOAD_FOLDER, LEFTOVER_TTL))
+janitor.add_task('temp_files', lambda: downloader.cleanup_all_temp_files(UPLOAD_FOLDER, LEFTOVER_TTL))
+janitor.add_task('storage', storage.enforce)
+janitor.start()
+
+# Métriques Prometheus sur un port dédié (optionnel): METRICS_PORT=9100 dans .env
+METRICS_PORT = os.getenv('METRICS_PORT')
+if METRICS_PORT:
+    metrics.start_http_server(int(METRICS_PORT))
+
+# Téléchargements en cours par clé de cache: un même lien demandé par plusieurs
+# utilisateurs en même temps n'est téléchargé qu'une fois
+inflight = SingleFlight()
 
 # Configuration du bot
 intents = discord.Intents.default()
@@ -61,7 +97,8 @@ async def convert(ctx, url: str, *args):
             value=(
                 "`!convert <url>`\n"
                 "`!convert <url> -debut 1.30 -fin 2.45` (Coupe de 1m30 à 2m45)\n"
-                "`!convert <url> -debut 10` (Commence à 10 min)"
+                "`!convert <url> -debut 10` (Commence à 10 min)\n"
+                "`!convert <url> -format m4a` (Formats: mp3, m4a, opus, original — sans réencodage sauf mp3)"
             ),
             inline=False
         )
@@ -73,6 +110,7 @@ async def convert(ctx, url: str, *args):
     # Parser les arguments de découpage
     start_time = None
     end_time = None
+    audio_format = 'mp3'
     
     if args:
         for i, arg in enumerate(args):
@@ -89,6 +127,11 @@ async def convert(ctx, url: str, *args):
                 except Exception as e:
                     await ctx.send(f"❌ Format de temps invalide pour -fin: {e}")
                     return
+            elif arg in ['-format', '--format'] and i + 1 < len(args):
+                audio_format = args[i+1].lower()
+                if audio_format not in downloader.AUDIO_FORMATS:
+                    await ctx.send(f"❌ Format non supporté: {audio_format} (formats: {', '.join(downloader.AUDIO_FORMATS)})")
+                    return
 
     # Vérifier si on est dans le bon channel ou rediriger
     target_channel_name = "musique"
@@ -103,7 +146,8 @@ async def convert(ctx, url: str, *args):
 
     # Dictionnaire de progression (non utilisé pour l'affichage temps réel ici pour simplifier)
     progress_dict = {}
-    progress_id = "bot_task"
+    # Identifiant propre à la commande: les fichiers de deux demandes simultanées ne se mélangent pas
+    progress_id = f"bot_{uuid.uuid4().hex}"
 
     try:
         # Exécuter le téléchargement dans un thread séparé pour ne pas bloquer le bot
@@ -133,42 +177,70 @@ async def convert(ctx, url: str, *args):
             # Playlist
             zip_path, zip_filename = await loop.run_in_executor(
                 None, 
-                lambda: downloader.process_playlist(url, source_type, progress_id, progress_dict)
+                lambda: downloader.process_playlist(url, source_type, progress_id, progress_dict, audio_format)
             )
             file_path = zip_path
             filename = zip_filename + ".zip"
         else:
             # Fichier unique
             output_path = os.path.join(UPLOAD_FOLDER, f"{progress_id}.mp3")
+            is_trimmed = start_time is not None or end_time is not None
             
-            if source_type == 'youtube':
-                final_path, final_filename = await loop.run_in_executor(None, lambda: downloader.download_youtube(url, output_path, None, progress_id, progress_dict))
-            elif source_type == 'soundcloud':
-                final_path, final_filename = await loop.run_in_executor(None, lambda: downloader.download_soundcloud(url, output_path, None, progress_id, progress_dict))
-            elif source_type == 'spotify':
-                final_path, final_filename = await loop.run_in_executor(None, lambda: downloader.download_spotify(url, output_path, None, progress_id, progress_dict))
-            elif source_type == 'instagram':
-                final_path, final_filename = await loop.run_in_executor(None, lambda: downloader.download_instagram(url, output_path, None, progress_id, progress_dict))
+            # Consulter le cache (version découpée puis version complète) avant tout accès réseau
+            full_key = cache.make_key(url, source_type, audio_format)
+            trimmed_key = cache.make_key(url, source_type, audio_format, start_time=start_time, end_time=end_time) if is_trimmed else None
+            trimmed_path = os.path.join(UPLOAD_FOLDER, f"{progress_id}_trimmed.mp3")
+            
+            cached_trimmed = cache.lookup(trimmed_key, trimmed_path) if is_trimmed else None
+            cached = None if cached_trimmed is not None else cache.lookup(full_key, output_path)
+            
+            if cached_trimmed is not None:
+                final_path, final_filename = cached_trimmed['path'], cached_trimmed.get('filename') or 'audio'
+                storage.added(final_path)
+            elif cached is not None:
+                final_path, final_filename = cached['path'], cached.get('filename') or 'audio'
+                storage.added(final_path)
+            else:
+                async def fetch():
+                    result = await loop.run_in_executor(None, lambda: downloader.download_track(url, source_type, output_path, None, progress_id, progress_dict, audio_format))
+                    # Mis en cache avant de réveiller les demandes rattachées: elles en obtiennent leur propre copie
+                    cache.store(full_key, result[0], result[1])
+                    return result
+
+                if inflight.running(full_key):
+                    await status_msg.edit(content="Ce lien est déjà en cours de téléchargement, en attente du résultat...")
+                (final_path, final_filename), shared = await inflight.do(full_key, fetch)
+                if shared:
+                    metrics.COALESCED.inc(interface='discord')
+                    cached = cache.lookup(full_key, output_path)
+                    if cached is not None:
+                        final_path, final_filename = cached['path'], cached.get('filename') or 'audio'
+                        storage.added(final_path)
+                    else:
+                        # Copie absente du cache (écriture impossible, éviction): téléchargement indépendant
+                        final_path, final_filename = await fetch()
             
             file_path = final_path
-            filename = final_filename + ".mp3"
+            filename = final_filename + os.path.splitext(file_path)[1]
             
             # Appliquer le découpage si demandé
-            if start_time is not None or end_time is not None:
+            if is_trimmed and cached_trimmed is None:
                 await status_msg.edit(content="✂️ Découpage du fichier audio...")
-                trimmed_path = os.path.join(UPLOAD_FOLDER, f"{progress_id}_trimmed.mp3")
+                trimmed_path = os.path.join(UPLOAD_FOLDER, f"{progress_id}_trimmed{os.path.splitext(file_path)[1]}")
                 try:
                     await loop.run_in_executor(None, lambda: downloader.trim_audio(file_path, trimmed_path, start_time, end_time))
+                    storage.added(trimmed_path)
+                    cache.store(trimmed_key, trimmed_path, final_filename)
                     
                     # Remplacer le fichier original par le fichier coupé
                     if os.path.exists(file_path):
-                        os.remove(file_path)
+                        storage.remove(file_path)
                     file_path = trimmed_path
                     
                 except Exception as e:
                     await status_msg.edit(content=f"❌ Erreur lors du découpage: {e}")
                     if os.path.exists(file_path):
-                        os.remove(file_path)
+                        storage.remove(file_path)
                     return
 
         # Vérifier que le fichier existe
@@ -185,7 +257,7 @@ async def convert(ctx, url: str, *args):
         except OSError as e:
             await status_msg.edit(content=f"Erreur lors de la lecture du fichier: {str(e)}")
             if os.path.exists(file_path):
-                os.remove(file_path)
+                storage.remove(file_path)
             return
         
         limit_bytes = 25 * 1024 * 1024 # 25 MB
@@ -201,10 +273,12 @@ async def convert(ctx, url: str, *args):
             
             try:
                 # Envoyer le fichier
-                sent_message = await target_channel.send(
-                    f"Conversion demandée par {ctx.author.mention}", 
-                    file=discord.File(file_path, filename=filename)
-                )
+                with metrics.STAGE_SECONDS.time(stage='send'):
+                    sent_message = await target_channel.send(
+                        f"Conversion demandée par {ctx.author.mention}", 
+                        file=discord.File(file_path, filename=filename)
+                    )
+                metrics.BYTES_SERVED.inc(file_size, interface='discord')
                 print(f"[DEBUG] Message envoyé avec succès! ID: {sent_message.id}")
                 await status_msg.edit(content="Fichier envoyé avec succès !")
             except discord.errors.HTTPException as http_error:
@@ -223,7 +297,7 @@ async def convert(ctx, url: str, *args):
         # Nettoyage
         if os.path.exists(file_path):
             print(f"[DEBUG] Nettoyage du fichier: {file_path}")
-            os.remove(file_path)
+            storage.remove(file_path)
 
     except Exception as e:
         print(f"[ERROR] Exception globale: {str(e)}")
@@ -232,7 +306,7 @@ async def convert(ctx, url: str, *args):
         await status_msg.edit(content=f"Erreur lors de la conversion : {str(e)}")
         # Nettoyage en cas d'erreur
         if 'file_path' in locals() and os.path.exists(file_path):
-            os.remove(file_path)
+            storage.remove(file_path)
 
 @bot.command(name='find')
 async def find_music(ctx, url: str = None, *args):
@@ -262,7 +336,8 @@ async def find_music(ctx, url: str = None, *args):
             value=(
                 "`!find <url>` - Analyse aux positions par défaut (30s, 60s, 90s)\n"
                 "`!find <url> -t <timecodes>` - Analyse aux timecodes spécifiés\n"
-                "`!find <url> -no_delete` - Garde le fichier téléchargé après analyse"
+                "`!find <url> -no_delete` - Garde le fichier téléchargé après analyse\n"
+                "`!find <url> -scan` - Analyse le mix entier et renvoie la tracklist horodatée"
             ),
             inline=False
         )
@@ -286,7 +361,8 @@ async def find_music(ctx, url: str = None, *args):
             value=(
                 "`!find https://youtube.com/watch?v=...`\n"
                 "`!find https://instagram.com/reel/... -t 15`\n"
-                "`!find <url> -t 19.30;1.00.00;1h11.30`"
+                "`!find <url> -t 19.30;1.00.00;1h11.30`\n"
+                "`!find <url> -scan`"
             ),
             inline=False
         )
@@ -298,12 +374,17 @@ async def find_music(ctx, url: str = None, *args):
     # Parser les arguments pour extraire les timecodes et l'option no_delete
     timecodes = None
     keep_file = False
+    scan = False
     
     if args:
         # Chercher l'option -no_delete
         if '-no_delete' in args or '--no-delete' in args:
             keep_file = True
         
+        # Chercher l'option -scan (mix complet)
+        if '-scan' in args or '--scan' in args:
+            scan = True
+        
         # Chercher l'option -t ou --time
         for i, arg in enumerate(args):
             if arg in ['-t', '--time'] and i + 1 < len(args):
@@ -332,18 +413,53 @@ async def find_music(ctx, url: str = None, *args):
         # Exécuter la reconnaissance dans un thread séparé pour ne pas bloquer Discord
         loop = asyncio.get_event_loop()
         
-        await status_msg.edit(content="⬇️ Téléchargement de l'audio complet...")
+        if scan:
+            await status_msg.edit(content="🔎 Analyse du mix complet (cela peut prendre quelques minutes)...")
+        else:
+            await status_msg.edit(content="⬇️ Récupération de l'audio...")
         
         # Appeler la fonction de reconnaissance dans un executor pour éviter de bloquer
         result = await loop.run_in_executor(
             None,
-            lambda: downloader.recognize_music_from_url_sync(url, timecodes, keep_file=keep_file)
+            lambda: downloader.recognize_music_from_url_sync(url, timecodes, keep_file=keep_file, scan=scan)
         )
         
         if not result['found']:
             await status_msg.edit(content=f"❌ {result['message']}")
             return
         
+        # Mode scan: tracklist horodatée (fichier texte joint si elle dépasse la taille d'un embed)
+        if result.get('tracklist'):
+            lines = []
+            for entry in result['tracklist']:
+                line = f"`{tracklist.format_timestamp(entry['start'])} - {tracklist.format_timestamp(entry['end'])}` **{entry['title']}** - {entry['artist']}"
+                if 'youtube' in entry['links']:
+                    line += f" [🎥]({entry['links']['youtube']})"
+                lines.append(line)
+            
+            description = "\n".join(lines)
+            attachment = None
+            if len(description) > 4000:
+                text = "\n".join(
+                    f"{tracklist.format_timestamp(entry['start'])} - {tracklist.format_timestamp(entry['end'])}  {entry['artist']} - {entry['title']}"
+                    for entry in result['tracklist']
+                )
+                attachment = discord.File(io.BytesIO(text.encode('utf-8')), filename="tracklist.txt")
+                description = description[:description.rfind("\n", 0, 3900)] + "\n… (tracklist complète en pièce jointe)"
+            
+            embed = discord.Embed(
+                title=f"🎧 Tracklist : {len(result['tracklist'])} morceaux identifiés",
+                description=description,
+                color=discord.Color.green()
+            )
+            embed.set_footer(text=f"Demandé par {ctx.author.name}")
+            await status_msg.delete()
+            if attachment:
+                await target_channel.send(f"Tracklist demandée par {ctx.author.mention}", embed=embed, file=attachment)
+            else:
+                await target_channel.send(f"Tracklist demandée par {ctx.author.mention}", embed=embed)
+            return
+        
         # Vérifier si on a plusieurs résultats
         if 'results' in result and len(result['results']) > 1:
             embed = discord.Embed(
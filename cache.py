@@ -0,0 +1,181 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import threading
+from urllib.parse import urlparse, parse_qs
+import metrics
+
+# Configuration par défaut (partagée entre app.py et bot.py)
+CACHE_FOLDER = 'cache'
+MAX_CACHE_BYTES = 5 * 1024 * 1024 * 1024  # 5 Go
+
+_lock = threading.Lock()
+
+def setup(cache_folder, max_bytes=None):
+    global CACHE_FOLDER, MAX_CACHE_BYTES
+    CACHE_FOLDER = cache_folder
+    if max_bytes is not None:
+        MAX_CACHE_BYTES = max_bytes
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+
+def canonical_media_id(url, source_type):
+    """Retourne un identifiant stable du média à partir de l'URL (sans accès réseau), ou None"""
+    parsed = urlparse(url)
+    path = parsed.path.strip('/')
+    parts = path.split('/') if path else []
+
+    if source_type == 'youtube':
+        video_id = None
+        if 'youtu.be' in parsed.netloc and parts:
+            video_id = parts[0]
+        elif parts and parts[0] in ('shorts', 'embed', 'live', 'v') and len(parts) > 1:
+            video_id = parts[1]
+        else:
+            video_id = parse_qs(parsed.query).get('v', [None])[0]
+        if video_id and re.fullmatch(r'[A-Za-z0-9_-]{11}', video_id):
+            return video_id
+        return None
+
+    if source_type == 'soundcloud':
+        # soundcloud.com/<artiste>/<titre> (les sets ne sont pas mis en cache)
+        if len(parts) >= 2 and 'sets' not in parts:
+            return '/'.join(parts[:2]).lower()
+        return None
+
+    if source_type == 'spotify':
+        # Gère aussi les URLs localisées (/intl-fr/track/<id>)
+        if 'track' in parts:
+            index = parts.index('track')
+            if index + 1 < len(parts):
+                return parts[index + 1]
+        return None
+
+    if source_type == 'instagram':
+        for i, part in enumerate(parts[:-1]):
+            if part in ('reel', 'reels', 'p', 'tv'):
+                return parts[i + 1]
+        return None
+
+    return None
+
+def cache_key(source_type, media_id, audio_format='mp3', bitrate='320', start_time=None, end_time=None):
+    """Calcule la clé de cache pour (source, média, format, débit, plage de découpage)"""
+    raw = json.dumps([source_type, media_id, audio_format, str(bitrate), start_time, end_time])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32]
+
+def make_key(url, source_type, audio_format='mp3', bitrate='320', start_time=None, end_time=None):
+    """Clé de cache pour une URL, ou None si le média n'a pas d'identifiant canonique"""
+    media_id = canonical_media_id(url, source_type)
+    if not media_id:
+        return None
+    return cache_key(source_type, media_id, audio_format, bitrate, start_time, end_time)
+
+def _meta_path(key):
+    return os.path.join(CACHE_FOLDER, f'{key}.json')
+
+def _link_or_copy(src, dest):
+    """Crée dest à partir de src par lien physique, ou par copie si impossible"""
+    tmp_path = f'{dest}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        os.link(src, tmp_path)
+    except OSError:
+        shutil.copy2(src, tmp_path)
+    os.replace(tmp_path, dest)
+
+def lookup(key, dest_path):
+    """Place l'entrée en cache à dest_path et retourne ses métadonnées, ou None.
+    
+    L'extension de dest_path est remplacée par celle du fichier en cache;
+    le chemin effectif est renvoyé dans meta['path'].
+    """
+    if not key:
+        # Pas de clé (cache non applicable): ni hit ni miss
+        return None
+    meta = _lookup(key, dest_path)
+    metrics.CACHE_REQUESTS.inc(result='hit' if meta is not None else 'miss')
+    return meta
+
+def _lookup(key, dest_path):
+    if not key:
+        return None
+    try:
+        with open(_meta_path(key), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        data_path = os.path.join(CACHE_FOLDER, f"{key}.{meta['ext']}")
+        if not os.path.exists(data_path):
+            return None
+
+        dest_path = f"{os.path.splitext(dest_path)[0]}.{meta['ext']}"
+        _link_or_copy(data_path, dest_path)
+        # Marquer l'entrée comme récemment utilisée (LRU)
+        now = time.time()
+        os.utime(data_path, (now, now))
+        print(f"[Cache] Hit: {meta.get('filename')} ({key})")
+        meta['path'] = dest_path
+        return meta
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"[Cache] Erreur de lecture ({key}): {e}")
+        return None
+
+def store(key, src_path, filename=None):
+    """Ajoute un fichier converti au cache puis applique la limite de taille"""
+    if not key or not os.path.exists(src_path):
+        return
+    try:
+        ext = os.path.splitext(src_path)[1].lstrip('.') or 'mp3'
+        os.makedirs(CACHE_FOLDER, exist_ok=True)
+        _link_or_copy(src_path, os.path.join(CACHE_FOLDER, f'{key}.{ext}'))
+
+        meta_tmp = f'{_meta_path(key)}.{os.getpid()}.tmp'
+        with open(meta_tmp, 'w', encoding='utf-8') as f:
+            json.dump({'filename': filename, 'ext': ext, 'created': time.time()}, f)
+        os.replace(meta_tmp, _meta_path(key))
+
+        evict()
+    except Exception as e:
+        print(f"[Cache] Erreur d'écriture ({key}): {e}")
+
+def evict(max_bytes=None):
+    """Supprime les entrées les moins récemment utilisées au-delà de la taille maximale"""
+    if max_bytes is None:
+        max_bytes = MAX_CACHE_BYTES
+
+    with _lock:
+        entries = []
+        total = 0
+        try:
+            for f in os.listdir(CACHE_FOLDER):
+                if f.endswith('.json') or f.endswith('.tmp'):
+                    continue
+                file_path = os.path.join(CACHE_FOLDER, f)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, f))
+                total += stat.st_size
+        except FileNotFoundError:
+            return 0
+
+        removed = 0
+        entries.sort()
+        for mtime, size, f in entries:
+            if total <= max_bytes:
+                break
+            key = os.path.splitext(f)[0]
+            for path in (os.path.join(CACHE_FOLDER, f), _meta_path(key)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            removed += 1
+
+        if removed:
+            print(f"[Cache] {removed} entrée(s) évincée(s)")
+        return removed
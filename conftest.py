@@ -0,0 +1,56 @@
+"""Exécution des scripts de test par pytest.
+
+Les test_*.py sont des scripts autonomes (python test_xxx.py) qui affichent [OK] / [FAIL]
+et se terminent par [SUCCESS] ou [FAILED]. pytest ne les importe pas (ce qui les
+exécuterait pendant la collecte): chaque script devient un test lancé dans un
+sous-processus, en échec si le script se termine en erreur ou affiche un échec.
+Les scripts qui ont besoin du réseau (YouTube, Shazam) ne sont lancés qu'avec --network.
+"""
+import os
+import sys
+import subprocess
+import pytest
+
+NETWORK_SCRIPTS = {'test_download.py', 'test_recognition.py'}
+FAILURE_MARKERS = ('[FAIL]', '[FAILED]', '[ERROR]', '✗')
+SCRIPT_TIMEOUT = 600
+
+def pytest_addoption(parser):
+    parser.addoption('--network', action='store_true', help="lance aussi les scripts qui accèdent au réseau")
+
+def pytest_pycollect_makemodule(module_path, parent):
+    return ScriptFile.from_parent(parent, path=module_path)
+
+class ScriptFailed(Exception):
+    pass
+
+class ScriptFile(pytest.File):
+    def collect(self):
+        yield ScriptItem.from_parent(self, name=self.path.name)
+
+class ScriptItem(pytest.Item):
+    def runtest(self):
+        if self.path.name in NETWORK_SCRIPTS and not self.config.getoption('network'):
+            pytest.skip("accès réseau nécessaire (--network)")
+        result = subprocess.run(
+            [sys.executable, self.path.name],
+            cwd=str(self.path.parent),
+            capture_output=True,
+            text=True,
+            encoding='utf-8',
+            errors='replace',
+            timeout=SCRIPT_TIMEOUT,
+            env={**os.environ, 'PYTHONIOENCODING': 'utf-8'}
+        )
+        output = result.stdout + result.stderr
+        failures = [line for line in output.splitlines() if line.lstrip().startswith(FAILURE_MARKERS)]
+        if result.returncode != 0 or failures:
+            raise ScriptFailed(output)
+
+    def repr_failure(self, excinfo):
+        if isinstance(excinfo.value, ScriptFailed):
+            return f"{self.path.name} a échoué:\n{excinfo.value}"
+        return super().repr_failure(excinfo)
+
+    def reportinfo(self):
+        return self.path, None, self.path.name
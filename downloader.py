@@ -10,15 +10,55 @@ import requests
 import zipfile
 import time
 import json
+import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import spotdl_engine
+import metrics
+import storage
+import pcm
+import ratelimit
+import tracklist
+import fingerprint
 
 # Configuration par défaut
 UPLOAD_FOLDER = 'downloads'
 FFMPEG_FOLDER = 'ffmpeg_local'
-
-def setup(upload_folder, ffmpeg_folder):
-    global UPLOAD_FOLDER, FFMPEG_FOLDER
+# Nombre de pistes d'une playlist traitées en parallèle (téléchargement réseau + encodage FFmpeg)
+PLAYLIST_WORKERS = min(8, os.cpu_count() or 2)
+# Flux réseau envoyé directement à FFmpeg pendant le téléchargement (pas de fichier intermédiaire)
+PIPELINED_DOWNLOADS = True
+# Moteur spotdl persistant dans le processus (sinon: un sous-processus `python -m spotdl` par job)
+SPOTDL_IN_PROCESS = True
+# Jobs Spotify exécutés en parallèle par ce moteur (app.py: autant que de workers du scheduler)
+SPOTDL_WORKERS = os.cpu_count() or 2
+# Délai maximal d'un téléchargement spotdl (secondes): piste seule / playlist ou album
+SPOTDL_TIMEOUT = 600
+SPOTDL_PLAYLIST_TIMEOUT = 3 * 3600
+# État des archives en construction visible des autres processus (chemin -> {'status': ...}),
+# fourni par app.py avec un backend d'état partagé; None: seul STREAMING_ARCHIVES est consulté
+ARCHIVE_STATE = None
+
+# Descripteur FFmpeg résolu une seule fois par processus (voir get_ffmpeg_info)
+_ffmpeg_info = None
+_ffmpeg_lock = threading.Lock()
+
+def setup(upload_folder, ffmpeg_folder, playlist_workers=None, pipelined=None, spotdl_in_process=None, archive_state=None,
+          spotdl_workers=None):
+    global UPLOAD_FOLDER, FFMPEG_FOLDER, PLAYLIST_WORKERS, PIPELINED_DOWNLOADS, SPOTDL_IN_PROCESS, SPOTDL_WORKERS, ARCHIVE_STATE, _ffmpeg_info
     UPLOAD_FOLDER = upload_folder
     FFMPEG_FOLDER = ffmpeg_folder
+    _ffmpeg_info = None
+    if playlist_workers:
+        PLAYLIST_WORKERS = max(1, int(playlist_workers))
+    if pipelined is not None:
+        PIPELINED_DOWNLOADS = pipelined
+    if spotdl_in_process is not None:
+        SPOTDL_IN_PROCESS = spotdl_in_process
+    if spotdl_workers:
+        SPOTDL_WORKERS = max(1, int(spotdl_workers))
+    if archive_state is not None:
+        ARCHIVE_STATE = archive_state
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
     os.makedirs(FFMPEG_FOLDER, exist_ok=True)
 
@@ -135,7 +175,7 @@ def download_ffmpeg_windows():
     
     return True
 
-def ensure_ffmpeg():
+def _locate_ffmpeg():
     """S'assure que FFmpeg est disponible, le télécharge si nécessaire (synchrone)"""
     # Vérifier d'abord si FFmpeg existe
     ffmpeg_location = check_ffmpeg()
@@ -159,6 +199,68 @@ def ensure_ffmpeg():
     
     raise Exception("FFmpeg n'est pas installé. Sur Linux/Mac, installez-le avec: sudo apt-get install ffmpeg ou brew install ffmpeg")
 
+def _probe_ffmpeg(ffmpeg_exe):
+    """Interroge FFmpeg une seule fois: version, encodeurs disponibles, support du multithread"""
+    capabilities = {'version': None, 'encoders': set(), 'threads': False}
+    try:
+        result = subprocess.run([ffmpeg_exe, '-hide_banner', '-version'],
+                                capture_output=True, text=True, timeout=10)
+        match = re.search(r'ffmpeg version (\S+)', result.stdout)
+        if match:
+            capabilities['version'] = match.group(1)
+        capabilities['threads'] = '--disable-pthreads' not in result.stdout and '--disable-w32threads' not in result.stdout
+        
+        result = subprocess.run([ffmpeg_exe, '-hide_banner', '-encoders'],
+                                capture_output=True, text=True, timeout=10)
+        # Lignes du type " A..... libmp3lame           libmp3lame MP3 (MPEG audio layer 3)"
+        for line in result.stdout.splitlines():
+            parts = line.split()
+            if len(parts) >= 2 and len(parts[0]) == 6 and parts[0][0] in 'AVS' and parts[1] != '=':
+                capabilities['encoders'].add(parts[1])
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"[FFmpeg] Impossible d'interroger {ffmpeg_exe}: {e}")
+    return capabilities
+
+def get_ffmpeg_info(refresh=False):
+    """Retourne le descripteur FFmpeg mis en cache pour le processus.
+    
+    {'location', 'ffmpeg', 'ffprobe', 'version', 'encoders', 'threads'}
+    Utiliser refresh=True (ou refresh_ffmpeg()) pour forcer une nouvelle détection.
+    """
+    global _ffmpeg_info
+    info = _ffmpeg_info
+    if info is not None and not refresh:
+        return info
+    
+    with _ffmpeg_lock:
+        if _ffmpeg_info is not None and not refresh:
+            return _ffmpeg_info
+        
+        location = _locate_ffmpeg()
+        exe_suffix = '.exe' if os.name == 'nt' else ''
+        ffmpeg_exe = os.path.join(location, 'ffmpeg' + exe_suffix)
+        info = {
+            'location': location,
+            'ffmpeg': ffmpeg_exe,
+            'ffprobe': os.path.join(location, 'ffprobe' + exe_suffix),
+            **_probe_ffmpeg(ffmpeg_exe)
+        }
+        print(f"[FFmpeg] {ffmpeg_exe} (version {info['version']}, {len(info['encoders'])} encodeurs)")
+        _ffmpeg_info = info
+        return info
+
+def refresh_ffmpeg():
+    """Oublie le FFmpeg détecté et relance la détection"""
+    return get_ffmpeg_info(refresh=True)
+
+def ensure_ffmpeg():
+    """Retourne le dossier de FFmpeg (résolu une seule fois par processus)"""
+    return get_ffmpeg_info()['location']
+
+def has_encoder(name):
+    """Indique si l'encodeur FFmpeg (ex: libmp3lame, libopus) est disponible"""
+    return name in get_ffmpeg_info()['encoders']
+
 def is_youtube_url(url):
     parsed = urlparse(url)
     return 'youtube.com' in parsed.netloc or 'youtu.be' in parsed.netloc
@@ -190,38 +292,354 @@ def sanitize_filename(filename):
     filename = "".join(x for x in filename if x.isprintable())
     return filename.strip()
 
-def cleanup_temp_files(directory, base_path):
+# Formats de sortie proposés. 'original' conserve le codec de la source et, comme
+# m4a/opus lorsque la source est déjà en AAC/Opus, copie le flux sans réencodage.
+AUDIO_FORMATS = {
+    'mp3': {'ext': 'mp3', 'format': 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best', 'codec': 'mp3'},
+    'm4a': {'ext': 'm4a', 'format': 'bestaudio[ext=m4a]/bestaudio/best', 'codec': 'm4a'},
+    'opus': {'ext': 'opus', 'format': 'bestaudio[acodec=opus]/bestaudio/best', 'codec': 'opus'},
+    'original': {'ext': None, 'format': 'bestaudio/best', 'codec': 'best'},
+}
+AUDIO_EXTENSIONS = ['mp3', 'm4a', 'opus', 'ogg', 'aac', 'flac', 'wav']
+AUDIO_MIMETYPES = {
+    'mp3': 'audio/mpeg',
+    'm4a': 'audio/mp4',
+    'aac': 'audio/aac',
+    'opus': 'audio/ogg',
+    'ogg': 'audio/ogg',
+    'flac': 'audio/flac',
+    'wav': 'audio/wav',
+}
+
+# Options spotdl (--format, --bitrate) par format de sortie; 'disable' évite le réencodage
+SPOTDL_FORMATS = {
+    'mp3': ('mp3', '320k'),
+    'm4a': ('m4a', 'disable'),
+    'opus': ('opus', 'disable'),
+    'original': ('opus', 'disable'),
+}
+
+def _audio_postprocessor(audio_format):
+    """Postprocesseur yt-dlp pour le format demandé (copie de flux si le codec correspond)"""
+    if audio_format not in AUDIO_FORMATS:
+        raise Exception(f"Format de sortie non supporté: {audio_format}")
+    return {
+        'key': 'FFmpegExtractAudio',
+        'preferredcodec': AUDIO_FORMATS[audio_format]['codec'],
+        'preferredquality': '320',
+    }
+
+# Débit approximatif des fichiers produits (kbit/s), pour estimer la place disque d'un job
+OUTPUT_KBPS = {'mp3': 320, 'm4a': 256, 'opus': 192, 'original': 256}
+# Durée supposée quand l'info dict n'en donne pas (secondes)
+DEFAULT_DURATION = 600
+
+def estimate_output_bytes(info, audio_format='mp3'):
+    """Taille estimée du fichier converti d'après la durée de l'info dict yt-dlp"""
+    duration = (info or {}).get('duration') or DEFAULT_DURATION
+    return int(duration * OUTPUT_KBPS.get(audio_format, 320) * 125)
+
+def estimate_job_bytes(info, audio_format='mp3'):
+    """Place disque estimée d'un job: flux source (si le pipeline retombe sur un fichier) + fichier converti"""
+    info = info or {}
+    source = info.get('filesize') or info.get('filesize_approx')
+    if not source:
+        duration = info.get('duration') or DEFAULT_DURATION
+        source = duration * (info.get('abr') or info.get('tbr') or 160) * 125
+    return int(source) + estimate_output_bytes(info, audio_format)
+
+def _find_output_file(base_path, audio_format):
+    """Retourne le fichier audio produit pour base_path selon le format demandé"""
+    ext = AUDIO_FORMATS[audio_format]['ext']
+    if ext and os.path.exists(f"{base_path}.{ext}"):
+        return f"{base_path}.{ext}"
+    
+    directory = os.path.dirname(base_path)
+    extensions = [ext] if ext else AUDIO_EXTENSIONS
+    files = [f for f in os.listdir(directory)
+             if f.startswith(os.path.basename(base_path)) and f.rsplit('.', 1)[-1] in extensions]
+    if not files:
+        raise Exception(f"Fichier {(ext or 'audio').upper()} non créé après conversion")
+    files.sort(key=lambda f: os.path.getmtime(os.path.join(directory, f)), reverse=True)
+    return os.path.join(directory, files[0])
+
+# Extension du conteneur quand le flux audio est copié tel quel (codec yt-dlp -> extension)
+COPY_EXTENSIONS = {'mp4a': 'm4a', 'aac': 'm4a', 'opus': 'opus', 'vorbis': 'ogg', 'mp3': 'mp3'}
+
+def _pipeline_encoder_args(acodec, audio_format):
+    """Retourne (arguments FFmpeg, extension) pour encoder/copier le flux, ou None si non géré"""
+    acodec = (acodec or '').split('.')[0].lower()
+    copy_ext = COPY_EXTENSIONS.get(acodec)
+    
+    if audio_format == 'original':
+        return (['-c:a', 'copy'], copy_ext) if copy_ext else None
+    if audio_format == 'm4a':
+        return (['-c:a', 'copy'], 'm4a') if copy_ext == 'm4a' else (['-c:a', 'aac', '-b:a', '256k'], 'm4a')
+    if audio_format == 'opus':
+        if copy_ext == 'opus':
+            return ['-c:a', 'copy'], 'opus'
+        return (['-c:a', 'libopus', '-b:a', '160k'], 'opus') if has_encoder('libopus') else None
+    if not has_encoder('libmp3lame'):
+        return None
+    return ['-c:a', 'libmp3lame', '-b:a', '320k'], 'mp3'
+
+def _pipe_to_ffmpeg(ydl, info, base_path, audio_format, progress_id=None, progress_dict=None):
+    """Envoie le flux distant directement à FFmpeg: téléchargement et encodage se chevauchent.
+    
+    Le téléchargement reste celui de yt-dlp (requêtes par plages http_chunk_size de
+    downloader_options, en-têtes du format, cookies de ydl), lancé avec `-o -` sur l'info
+    dict déjà résolu: sa sortie standard alimente l'entrée de FFmpeg et aucun fichier
+    intermédiaire n'est écrit. Retourne le chemin du fichier produit, ou None si la source
+    ne s'y prête pas (formats séparés à fusionner, protocole non géré...) et qu'il faut
+    utiliser le téléchargement classique.
+    """
+    # Recherche "ytsearch1:" (fallback Spotify): une seule entrée déjà résolue
+    entries = info.get('entries')
+    if info.get('_type') == 'playlist' and isinstance(entries, list) and len(entries) == 1:
+        info = entries[0]
+    if info.get('_type', 'video') != 'video' or info.get('requested_formats'):
+        return None
+    if info.get('protocol') not in ('http', 'https', 'm3u8', 'm3u8_native') or not info.get('url'):
+        return None
+    
+    encoder = _pipeline_encoder_args(info.get('acodec'), audio_format)
+    if not encoder:
+        return None
+    encoder_args, ext = encoder
+    output_path = f"{base_path}.{ext}"
+    
+    # Info dict et cookies passés au yt-dlp qui télécharge: pas de seconde extraction
+    info_path = f"{base_path}.info.json"
+    with open(info_path, 'w', encoding='utf-8') as f:
+        json.dump(yt_dlp.YoutubeDL.sanitize_info(info), f)
+    fetch_cmd = [sys.executable, '-m', 'yt_dlp', '--ignore-config', '--quiet', '--no-warnings',
+                 '--no-part', '--fixup', 'never', '--load-info-json', info_path, '--output', '-']
+    if info.get('format_id'):
+        fetch_cmd.extend(['--format', info['format_id']])
+    cookie_path = f"{base_path}.cookies.txt"
+    if len(ydl.cookiejar):
+        ydl.cookiejar.save(cookie_path)
+        fetch_cmd.extend(['--cookies', cookie_path])
+    
+    encode_cmd = [get_ffmpeg_info()['ffmpeg'], '-hide_banner', '-nostats', '-loglevel', 'error',
+                  '-i', 'pipe:0', '-vn'] + encoder_args + ['-progress', 'pipe:1', '-y', output_path]
+    
+    print(f"[Pipeline] {info.get('title')} -> {output_path}")
+    duration = info.get('duration') or 0
+    fetch = subprocess.Popen(fetch_cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     try:
-        base_name = os.path.basename(base_path)
-        temp_extensions = ['.m4a', '.webm', '.mp4', '.opus', '.ogg', '.flac', '.wav', '.mkv', '.avi']
-        
-        for file in os.listdir(directory):
-            file_path = os.path.join(directory, file)
-            if file.startswith(base_name) and any(file.endswith(ext) for ext in temp_extensions):
-                try:
-                    os.remove(file_path)
-                except Exception as e:
-                    print(f"Impossible de supprimer {file}: {e}")
-    except Exception as e:
-        print(f"Erreur lors du nettoyage des fichiers temporaires: {e}")
+        encode = subprocess.Popen(encode_cmd, stdin=fetch.stdout, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                  text=True, encoding='utf-8', errors='replace')
+    except Exception:
+        fetch.kill()
+        fetch.wait()
+        raise
+    finally:
+        # FFmpeg détient seul l'extrémité lecture: s'il s'arrête, yt-dlp reçoit une erreur d'écriture
+        fetch.stdout.close()
+    
+    # Lire les stderr en parallèle pour éviter qu'un tampon plein bloque un des processus
+    fetch_errors = []
+    encode_errors = []
+    readers = [threading.Thread(target=lambda: fetch_errors.extend(
+                   line.decode('utf-8', 'replace') for line in fetch.stderr)),
+               threading.Thread(target=lambda: encode_errors.extend(encode.stderr))]
+    for reader in readers:
+        reader.daemon = True
+        reader.start()
+    
+    for line in encode.stdout:
+        key, _, value = line.strip().partition('=')
+        if key == 'out_time_us' and duration and progress_id and progress_dict is not None:
+            try:
+                percent = int(value) / 1_000_000 / duration * 100
+            except ValueError:
+                continue
+            progress_dict[progress_id] = {
+                'percent': min(100, max(0, percent)),
+                'status': 'downloading',
+                'message': 'Téléchargement et conversion en continu'
+            }
+    
+    encode.wait()
+    if encode.returncode != 0 and fetch.poll() is None:
+        fetch.kill()
+    fetch.wait()
+    for reader in readers:
+        reader.join(timeout=5)
+    for path in (info_path, cookie_path):
+        if os.path.exists(path):
+            os.remove(path)
+    if fetch.returncode != 0 or encode.returncode != 0 or not os.path.exists(output_path):
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise Exception(f"Pipeline yt-dlp -> FFmpeg a échoué: {''.join(fetch_errors + encode_errors).strip()[-500:]}")
+    
+    if progress_id and progress_dict is not None:
+        progress_dict[progress_id] = {'percent': 100, 'status': 'converting'}
+    return output_path
 
-def cleanup_all_temp_files(directory):
+def _download_with_info(ydl, info, base_path, audio_format, progress_id=None, progress_dict=None, source='youtube'):
+    """Télécharge à partir d'un info dict déjà résolu, en pipeline vers FFmpeg si possible"""
+    if PIPELINED_DOWNLOADS:
+        try:
+            # Réseau et encodage se chevauchent: une seule mesure 'download'
+            started = time.perf_counter()
+            final_path = _pipe_to_ffmpeg(ydl, info, base_path, audio_format, progress_id, progress_dict)
+            if final_path:
+                metrics.STAGE_SECONDS.observe(time.perf_counter() - started, stage='download', source=source)
+                metrics.BYTES_DOWNLOADED.inc(info.get('filesize') or info.get('filesize_approx') or 0, source=source)
+                return final_path
+        except Exception as e:
+            print(f"[Pipeline] {e}. Utilisation du téléchargement classique.")
+    
+    # Téléchargement classique: les hooks yt-dlp séparent réseau et encodage
+    timings = {'download': time.perf_counter()}
+
+    def download_hook(d):
+        if d.get('status') == 'finished':
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - timings['download'], stage='download', source=source)
+            metrics.BYTES_DOWNLOADED.inc(d.get('total_bytes') or d.get('downloaded_bytes') or 0, source=source)
+
+    def postprocessor_hook(d):
+        if d.get('postprocessor') != 'ExtractAudio':
+            return
+        if d.get('status') == 'started':
+            timings['transcode'] = time.perf_counter()
+        elif d.get('status') == 'finished' and 'transcode' in timings:
+            metrics.STAGE_SECONDS.observe(time.perf_counter() - timings['transcode'], stage='transcode', source=source)
+
+    ydl.add_progress_hook(download_hook)
+    ydl.add_postprocessor_hook(postprocessor_hook)
+    
+    # Réutiliser l'info dict déjà résolu au lieu d'une seconde extraction
+    ydl.process_ie_result(info, download=True)
+    return _find_output_file(base_path, audio_format)
+
+def create_job_workspace(prefix='job'):
+    """Crée un dossier de travail isolé pour un job (sous UPLOAD_FOLDER/.jobs)"""
+    workdir = os.path.join(UPLOAD_FOLDER, '.jobs', f"{prefix}_{uuid.uuid4().hex}")
+    os.makedirs(workdir)
+    return workdir
+
+def remove_job_workspace(workdir):
+    """Supprime le dossier de travail d'un job et tout son contenu (fichiers intermédiaires compris)"""
+    try:
+        shutil.rmtree(workdir)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Erreur lors du nettoyage du dossier de travail {workdir}: {e}")
+
+def publish_result(src_path, output_path):
+    """Déplace atomiquement le résultat vers output_path (l'extension réelle est conservée)"""
+    final_path = os.path.splitext(output_path)[0] + os.path.splitext(src_path)[1]
+    os.replace(src_path, final_path)
+    storage.added(final_path)
+    return final_path
+
+def kept_files_folder(directory=None):
+    """Dossier des fichiers conservés à la demande (!find -no_delete).
+
+    Ni la purge des résultats ni le nettoyage des fragments ne le parcourent, et le
+    quota n'évince que les fichiers à la racine de UPLOAD_FOLDER.
+    """
+    return os.path.join(directory or UPLOAD_FOLDER, 'kept')
+
+def _tree_stats(path):
+    """Retourne (taille totale en octets, date de dernière modification) d'un dossier"""
+    total = 0
+    newest = os.path.getmtime(path)
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except OSError:
+                continue
+            total += stat.st_size
+            newest = max(newest, stat.st_mtime)
+    return total, newest
+
+def cleanup_all_temp_files(directory, max_age=None):
+    """Supprime les fragments temporaires (.part, .ytdl, ...) et les dossiers de travail abandonnés.
+
+    Les résultats (AUDIO_EXTENSIONS, zip) ne sont pas concernés, voir purge_expired_results.
+    Avec max_age, seuls les éléments inactifs depuis plus de max_age secondes sont supprimés.
+    Retourne (nombre d'éléments supprimés, octets libérés).
+    """
+    removed = 0
+    freed = 0
+    now = time.time()
     try:
-        temp_extensions = ['.m4a', '.webm', '.mp4', '.opus', '.ogg', '.flac', '.wav', '.mkv', '.avi', '.part', '.ytdl']
+        temp_extensions = ['.webm', '.mp4', '.mkv', '.avi', '.part', '.ytdl']
         for file in os.listdir(directory):
             file_path = os.path.join(directory, file)
             if any(file.endswith(ext) for ext in temp_extensions) and os.path.isfile(file_path):
                 try:
+                    stat = os.stat(file_path)
+                    if max_age is not None and now - stat.st_mtime <= max_age:
+                        continue
                     os.remove(file_path)
-                except PermissionError:
+                    removed += 1
+                    freed += stat.st_size
+                except (PermissionError, FileNotFoundError):
                     pass
                 except Exception as e:
                     print(f"Impossible de supprimer {file}: {e}")
+
+        # Dossiers de travail laissés par un job interrompu (crash, arrêt du serveur)
+        jobs_dir = os.path.join(directory, '.jobs')
+        if os.path.isdir(jobs_dir):
+            for name in os.listdir(jobs_dir):
+                workdir = os.path.join(jobs_dir, name)
+                try:
+                    size, last_modified = _tree_stats(workdir)
+                except OSError:
+                    continue
+                if max_age is not None and now - last_modified <= max_age:
+                    continue
+                remove_job_workspace(workdir)
+                removed += 1
+                freed += size
     except Exception as e:
         print(f"Erreur lors du nettoyage général: {e}")
+    return removed, freed
+
+def purge_expired_results(directory, max_age):
+    """Supprime les résultats (audio / zip) plus vieux que max_age secondes.
+
+    Seule la racine de directory est parcourue: les fichiers conservés (kept_files_folder) restent.
+    Retourne (nombre de fichiers supprimés, octets libérés).
+    """
+    removed = 0
+    freed = 0
+    now = time.time()
+    result_extensions = tuple(f'.{ext}' for ext in AUDIO_EXTENSIONS + ['zip'])
+    try:
+        for file in os.listdir(directory):
+            file_path = os.path.join(directory, file)
+            # Une archive encore en construction n'expire pas
+            if not file.endswith(result_extensions) or archive_in_progress(file_path):
+                continue
+            try:
+                stat = os.stat(file_path)
+                if now - stat.st_mtime > max_age:
+                    os.remove(file_path)
+                    removed += 1
+                    freed += stat.st_size
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Impossible de supprimer {file}: {e}")
+    except Exception as e:
+        print(f"Erreur lors de la purge des résultats: {e}")
+    return removed, freed
 
-def get_playlist_title(url, source_type):
+def get_playlist_title(url, source_type, info=None):
+    """Retourne le titre de la playlist (réutilise l'info dict de l'énumération s'il est fourni)"""
     try:
+        if info is not None:
+            return info.get('title', 'Playlist')
         if source_type == 'spotify':
             headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'}
             response = requests.get(url, headers=headers)
@@ -241,17 +659,210 @@ def get_playlist_title(url, source_type):
         print(f"Erreur titre playlist: {e}")
         return "Playlist"
 
-def process_playlist(url, source_type, progress_id=None, progress_dict=None):
-    raw_title = get_playlist_title(url, source_type)
+# Archives de playlist en cours d'écriture (chemin -> StreamingZip)
+STREAMING_ARCHIVES = {}
+# Lecture d'une archive construite par un autre processus: abandon sans nouvelles données
+# ni changement d'état pendant ce délai (processus arrêté en cours de construction)
+ARCHIVE_IDLE_TIMEOUT = 600
+
+class _AppendOnlyWriter:
+    """Enveloppe sans tell/seek: zipfile écrit alors en ajout seul (descripteurs de données)"""
+    
+    def __init__(self, fileobj):
+        self._fileobj = fileobj
+    
+    def write(self, data):
+        return self._fileobj.write(data)
+    
+    def flush(self):
+        self._fileobj.flush()
+
+class StreamingZip:
+    """Archive ZIP écrite au fil de l'eau, lisible par un client HTTP pendant sa construction.
+    
+    Les MP3 sont déjà compressés: les entrées sont stockées (ZIP_STORED) sans
+    recompression, et ajoutées dès qu'une piste est terminée.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.done = False
+        self.failed = False
+        self._file = open(path, 'wb', buffering=1024 * 1024)
+        self._zip = zipfile.ZipFile(_AppendOnlyWriter(self._file), 'w', compression=zipfile.ZIP_STORED)
+        self._changed = threading.Condition()
+        self._entries = 0
+        STREAMING_ARCHIVES[path] = self
+        self._publish('building')
+    
+    def _publish(self, status):
+        if ARCHIVE_STATE is not None:
+            ARCHIVE_STATE[self.path] = {'status': status, 'entries': self._entries}
+    
+    def add(self, file_path, arcname):
+        with self._changed, metrics.STAGE_SECONDS.time(stage='zip'):
+            self._zip.write(file_path, arcname)
+            self._file.flush()
+            self._entries += 1
+            self._changed.notify_all()
+        self._publish('building')
+    
+    def close(self, failed=False):
+        with self._changed:
+            try:
+                # Même abandonnée, l'archive est fermée: sinon ZipFile écrirait son
+                # répertoire central plus tard (ramasse-miettes), dans un fichier déjà fermé
+                self._zip.close()
+            except Exception:
+                if not failed:
+                    raise
+            finally:
+                self._file.close()
+                self.done = True
+                self.failed = failed
+                STREAMING_ARCHIVES.pop(self.path, None)
+                self._changed.notify_all()
+        self._publish('error' if failed else 'completed')
+    
+    def wait(self, timeout=1.0):
+        """Attend l'ajout d'une entrée ou la fin de l'archive"""
+        with self._changed:
+            if not self.done:
+                self._changed.wait(timeout)
+
+def archive_in_progress(path):
+    """Vrai si l'archive path est encore en construction, dans ce processus ou dans un autre"""
+    archive = STREAMING_ARCHIVES.get(path)
+    if archive is not None:
+        return not archive.done
+    if ARCHIVE_STATE is not None:
+        return (ARCHIVE_STATE.get(path) or {}).get('status') == 'building'
+    return False
+
+def archive_status(path, archive=None):
+    """(terminée, échouée) pour l'archive path; archive est le StreamingZip de ce processus s'il y en a un"""
+    if archive is not None:
+        return archive.done, archive.failed
+    # Archive construite par un autre processus: son état est dans ARCHIVE_STATE
+    status = ((ARCHIVE_STATE.get(path) if ARCHIVE_STATE is not None else None) or {}).get('status')
+    return status != 'building', status == 'error'
+
+def iter_growing_file(path, chunk_size=256 * 1024):
+    """Lit un fichier, en suivant l'archive en streaming associée jusqu'à sa fermeture"""
+    archive = STREAMING_ARCHIVES.get(path)
+    version = 0
+    idle_since = time.time()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if chunk:
+                idle_since = time.time()
+                yield chunk
+                continue
+            done, failed = archive_status(path, archive)
+            if done:
+                # Dernières données écrites juste avant la fermeture
+                chunk = f.read()
+                if chunk and not failed:
+                    yield chunk
+                break
+            if archive is not None:
+                archive.wait()
+                continue
+            new_version, _ = ARCHIVE_STATE.wait(path, version, timeout=1.0)
+            if new_version != version:
+                version = new_version
+                idle_since = time.time()
+            elif time.time() - idle_since > ARCHIVE_IDLE_TIMEOUT:
+                break
+
+class PlaylistProgress(dict):
+    """Agrège la progression des pistes d'une playlist dans progress_dict[progress_id].
+    
+    Passé comme progress_dict aux fonctions de téléchargement (une clé par piste).
+    """
+    
+    def __init__(self, total, progress_id=None, progress_dict=None):
+        super().__init__()
+        self.total = max(1, total)
+        self.progress_id = progress_id
+        self.progress_dict = progress_dict
+        self.completed = 0
+        self.failed = 0
+        self.extra = {}
+        self._lock = threading.Lock()
+    
+    def __setitem__(self, track_id, state):
+        with self._lock:
+            super().__setitem__(track_id, state)
+            self._publish()
+    
+    def finish(self, track_id, success):
+        with self._lock:
+            if success:
+                self.completed += 1
+            else:
+                self.failed += 1
+            super().__setitem__(track_id, {'percent': 100, 'status': 'completed' if success else 'error'})
+            self._publish()
+    
+    def _publish(self):
+        if not self.progress_id or self.progress_dict is None:
+            return
+        
+        total_percent = 0
+        active_tracks = []
+        for track_id, state in dict.items(self):
+            status = state.get('status')
+            # Une piste en conversion a fini son téléchargement
+            percent = 100 if status in ('completed', 'error', 'converting') else state.get('percent', 0)
+            total_percent += percent
+            if status not in ('completed', 'error'):
+                active_tracks.append({'track': int(track_id) + 1, 'percent': percent, 'status': status})
+        
+        finished = self.completed + self.failed
+        self.progress_dict[self.progress_id] = {
+            'percent': min(100, total_percent / self.total),
+            'status': 'downloading',
+            'message': f'Téléchargement pistes {finished}/{self.total} ({len(active_tracks)} en cours)',
+            'completed_tracks': self.completed,
+            'failed_tracks': self.failed,
+            'total_tracks': self.total,
+            'active_tracks': active_tracks,
+            **self.extra
+        }
+
+def process_playlist(url, source_type, progress_id=None, progress_dict=None, audio_format='mp3'):
+    # Une seule énumération de la playlist: elle sert aussi à obtenir le titre
+    playlist_info = None
+    if source_type != 'spotify':
+        with yt_dlp.YoutubeDL({'extract_flat': True, 'quiet': True}) as ydl:
+            with metrics.STAGE_SECONDS.time(stage='extract', source=source_type):
+                playlist_info = ydl.extract_info(url, download=False)
+    
+    raw_title = get_playlist_title(url, source_type, playlist_info)
     playlist_name = sanitize_filename(raw_title)
     if not playlist_name:
         playlist_name = "Playlist"
         
     temp_uuid = str(uuid.uuid4())
-    base_temp_dir = os.path.join(UPLOAD_FOLDER, temp_uuid)
+    zip_path = os.path.join(UPLOAD_FOLDER, f"{temp_uuid}.zip")
+
+    # Place de l'archive réservée d'après la durée des pistes (chaque piste réserve
+    # en plus son propre dossier de travail pendant son téléchargement)
+    entries = list((playlist_info or {}).get('entries') or [])
+    archive_bytes = sum(estimate_output_bytes(entry, audio_format) for entry in entries) or estimate_output_bytes(None, audio_format)
+    reservation = storage.reserve(archive_bytes, zip_path)
+
+    base_temp_dir = create_job_workspace('playlist')
     playlist_dir = os.path.join(base_temp_dir, playlist_name)
     os.makedirs(playlist_dir, exist_ok=True)
     
+    # L'archive est ouverte dès le départ pour que /download puisse la servir pendant sa construction
+    zip_filename = f"{playlist_name}_compress"
+    archive = StreamingZip(zip_path)
+    archive_info = {'file_id': temp_uuid, 'filename': zip_filename, 'is_zip': True, 'streaming': True}
+    
     try:
         downloaded_files = []
 
@@ -265,49 +876,30 @@ def process_playlist(url, source_type, progress_id=None, progress_dict=None):
                 progress_dict[progress_id] = {
                     'percent': 0,
                     'status': 'downloading',
-                    'message': f'Démarrage du téléchargement de la playlist "{playlist_name}"...'
+                    'message': f'Démarrage du téléchargement de la playlist "{playlist_name}"...',
+                    **archive_info
                 }
 
-            ffmpeg_location = ensure_ffmpeg()
-            if os.name == 'nt':
-                ffmpeg_exe = os.path.join(ffmpeg_location, 'ffmpeg.exe')
-            else:
-                ffmpeg_exe = os.path.join(ffmpeg_location, 'ffmpeg')
-
-            cmd = [
-                sys.executable, '-m', 'spotdl',
-                url,
-                '--output', playlist_dir,
-                '--format', 'mp3',
-                '--bitrate', '320k',
-                '--simple-tui',
-            ]
-            
-            if os.path.exists(ffmpeg_exe):
-                cmd.extend(['--ffmpeg', ffmpeg_exe])
-
-            print(f"[Spotify Playlist] Exécution: {' '.join(cmd)}")
-            
-            process = subprocess.Popen(
-                cmd,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='utf-8',
-                errors='replace'
-            )
-            
-            stdout, stderr = process.communicate()
-            
-            if process.returncode != 0:
-                raise Exception(f"Erreur spotdl: {stderr}")
-
-            for f in os.listdir(playlist_dir):
-                if f.endswith('.mp3'):
-                    downloaded_files.append(os.path.join(playlist_dir, f))
+            # Avancement par piste, remonté par le moteur spotdl
+            song_progress = {}
+
+            def on_progress(song_name, percent, message):
+                song_progress[song_name] = percent
+                if progress_id and progress_dict is not None:
+                    completed = sum(1 for p in song_progress.values() if p >= 100)
+                    progress_dict[progress_id] = {
+                        'percent': int(sum(song_progress.values()) / len(song_progress)),
+                        'status': 'downloading',
+                        'message': f"{completed}/{len(song_progress)} pistes terminées - {song_name}: {message}",
+                        **archive_info
+                    }
+
+            for file_path in run_spotdl(url, playlist_dir, audio_format, on_progress, timeout=SPOTDL_PLAYLIST_TIMEOUT):
+                downloaded_files.append(file_path)
+                archive.add(file_path, os.path.join(playlist_name, os.path.basename(file_path)))
             
             if not downloaded_files:
-                raise Exception("Aucun fichier MP3 trouvé.")
+                raise Exception(f"Aucun fichier {SPOTDL_FORMATS[audio_format][0].upper()} trouvé.")
 
         else:
             download_func = None
@@ -319,58 +911,69 @@ def process_playlist(url, source_type, progress_id=None, progress_dict=None):
             if not download_func:
                 raise Exception("Type de source non supporté pour les playlists (hors Spotify)")
 
-            ydl_opts = {'extract_flat': True, 'quiet': True}
+            if not playlist_info or 'entries' not in playlist_info:
+                raise Exception("Impossible de récupérer les éléments de la playlist")
             
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(url, download=False)
-                if 'entries' not in info:
-                    raise Exception("Impossible de récupérer les éléments de la playlist")
-                
-                entries = list(info['entries'])
-                total_items = len(entries)
-                
-                for i, entry in enumerate(entries):
-                    try:
-                        if progress_id and progress_dict is not None:
-                            progress_dict[progress_id] = {
-                                'percent': (i / total_items) * 100,
-                                'status': 'downloading',
-                                'message': f'Téléchargement piste {i+1}/{total_items}'
-                            }
-                        
-                        item_url = entry.get('url') or entry.get('webpage_url')
-                        if not item_url:
-                            if source_type == 'youtube':
-                                item_url = f"https://www.youtube.com/watch?v={entry['id']}"
-                            else:
-                                continue
-
-                        item_path, item_filename = download_func(item_url, os.path.join(playlist_dir, f"{i:03d}_{entry['title']}.mp3"))
-                        downloaded_files.append(item_path)
-                        
-                    except Exception as e:
-                        print(f"Erreur sur l'élément {i}: {e}")
-                        continue
-        
+            total_items = len(entries)
+            tracker = PlaylistProgress(total_items, progress_id, progress_dict)
+            tracker.extra = archive_info
+            
+            def download_entry(i, entry):
+                track_id = f"{i:03d}"
+                try:
+                    item_url = entry.get('url') or entry.get('webpage_url')
+                    if not item_url:
+                        if source_type == 'youtube':
+                            item_url = f"https://www.youtube.com/watch?v={entry['id']}"
+                        else:
+                            tracker.finish(track_id, False)
+                            return None
+                    
+                    tracker[track_id] = {'percent': 0, 'status': 'downloading'}
+                    item_path, item_filename = download_func(item_url, os.path.join(playlist_dir, f"{i:03d}_{entry['title']}.mp3"), None, track_id, tracker, audio_format)
+                    tracker.finish(track_id, True)
+                    return item_path
+                    
+                except Exception as e:
+                    # Une piste en échec n'interrompt pas les autres
+                    print(f"Erreur sur l'élément {i}: {e}")
+                    metrics.ERRORS.inc(source=source_type)
+                    tracker.finish(track_id, False)
+                    return None
+            
+            results = [None] * total_items
+            with ThreadPoolExecutor(max_workers=PLAYLIST_WORKERS) as executor:
+                futures = {executor.submit(download_entry, i, entry): i for i, entry in enumerate(entries)}
+                for future in as_completed(futures):
+                    item_path = future.result()
+                    results[futures[future]] = item_path
+                    # Ajouter la piste à l'archive dès qu'elle est prête
+                    if item_path:
+                        archive.add(item_path, os.path.join(playlist_name, os.path.basename(item_path)))
+                        storage.remove(item_path)
+            
+            downloaded_files = [path for path in results if path]
+    
         if not downloaded_files:
             raise Exception("Aucun fichier n'a pu être téléchargé de la playlist")
             
-        zip_filename = f"{playlist_name}_compress.zip"
-        zip_path = os.path.join(UPLOAD_FOLDER, zip_filename)
+        archive.close()
         
-        shutil.make_archive(zip_path.replace('.zip', ''), 'zip', base_temp_dir, playlist_name)
-        shutil.rmtree(base_temp_dir)
-        
-        return zip_path, zip_filename.replace('.zip', '')
+        return zip_path, zip_filename
         
     except Exception as e:
-        if os.path.exists(base_temp_dir):
-            shutil.rmtree(base_temp_dir)
+        archive.close(failed=True)
+        metrics.ERRORS.inc(source=source_type)
+        try:
+            os.remove(zip_path)
+        except OSError:
+            pass
         raise e
+    finally:
+        reservation.release()
+        remove_job_workspace(base_temp_dir)
 
-def download_youtube(url, output_path, custom_filename=None, progress_id=None, progress_dict=None):
-    base_path = output_path.replace('.mp3', '')
-    
+def download_youtube(url, output_path, custom_filename=None, progress_id=None, progress_dict=None, audio_format='mp3'):
     try:
         ffmpeg_location = ensure_ffmpeg()
     except Exception as e:
@@ -420,14 +1023,14 @@ def download_youtube(url, output_path, custom_filename=None, progress_id=None, p
                     'status': 'converting'
                 }
     
+    # Dossier de travail isolé: chemins déterministes, aucun scan du dossier partagé
+    workdir = create_job_workspace()
+    base_path = os.path.join(workdir, 'audio')
+    
     ydl_opts = {
-        'format': 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best',
+        'format': AUDIO_FORMATS[audio_format]['format'],
         'outtmpl': base_path + '.%(ext)s',
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '320',
-        }],
+        'postprocessors': [_audio_postprocessor(audio_format)],
         'quiet': False,
         'no_warnings': False,
         'progress_hooks': [progress_hook],
@@ -437,7 +1040,8 @@ def download_youtube(url, output_path, custom_filename=None, progress_id=None, p
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             try:
-                info = ydl.extract_info(url, download=False)
+                with metrics.STAGE_SECONDS.time(stage='extract', source='youtube'):
+                    info = ydl.extract_info(url, download=False)
                 if not info:
                     raise Exception("Impossible d'extraire les informations.")
                 
@@ -450,29 +1054,17 @@ def download_youtube(url, output_path, custom_filename=None, progress_id=None, p
             except Exception as e:
                 raise Exception(f"Erreur YouTube info: {str(e)}")
             
-            ydl.download([url])
-            cleanup_temp_files(os.path.dirname(output_path), base_path)
-            
-            if os.path.exists(output_path):
-                final_path = output_path
-            else:
-                files = [f for f in os.listdir(os.path.dirname(output_path)) 
-                        if f.startswith(os.path.basename(base_path)) and f.endswith('.mp3')]
-                if files:
-                    files_with_time = [(f, os.path.getmtime(os.path.join(os.path.dirname(output_path), f))) 
-                                      for f in files]
-                    files_with_time.sort(key=lambda x: x[1], reverse=True)
-                    final_path = os.path.join(os.path.dirname(output_path), files_with_time[0][0])
-                else:
-                    raise Exception("Fichier MP3 non créé après conversion")
-            
-            return final_path, final_filename
+            with storage.reserve(estimate_job_bytes(info, audio_format), workdir):
+                final_path = _download_with_info(ydl, info, base_path, audio_format, progress_id, progress_dict, 'youtube')
+                return publish_result(final_path, output_path), final_filename
+    except storage.StorageFullError:
+        raise
     except Exception as e:
         raise Exception(f"Erreur lors du téléchargement YouTube: {str(e)}")
+    finally:
+        remove_job_workspace(workdir)
 
-def download_soundcloud(url, output_path, custom_filename=None, progress_id=None, progress_dict=None):
-    base_path = output_path.replace('.mp3', '')
-    
+def download_soundcloud(url, output_path, custom_filename=None, progress_id=None, progress_dict=None, audio_format='mp3'):
     try:
         ffmpeg_location = ensure_ffmpeg()
     except Exception as e:
@@ -504,14 +1096,14 @@ def download_soundcloud(url, output_path, custom_filename=None, progress_id=None
                     'status': 'converting'
                 }
     
+    # Dossier de travail isolé: chemins déterministes, aucun scan du dossier partagé
+    workdir = create_job_workspace()
+    base_path = os.path.join(workdir, 'audio')
+    
     ydl_opts = {
-        'format': 'bestaudio/best',
+        'format': AUDIO_FORMATS[audio_format]['format'],
         'outtmpl': base_path + '.%(ext)s',
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '320',
-        }],
+        'postprocessors': [_audio_postprocessor(audio_format)],
         'extractor_args': {
             'soundcloud': {
                 'client_id': None,
@@ -526,7 +1118,8 @@ def download_soundcloud(url, output_path, custom_filename=None, progress_id=None
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             try:
-                info = ydl.extract_info(url, download=False)
+                with metrics.STAGE_SECONDS.time(stage='extract', source='soundcloud'):
+                    info = ydl.extract_info(url, download=False)
                 if not info:
                     raise Exception("Impossible d'extraire les informations.")
                 
@@ -539,27 +1132,68 @@ def download_soundcloud(url, output_path, custom_filename=None, progress_id=None
             except Exception as e:
                 raise Exception(f"Erreur SoundCloud info: {str(e)}")
             
-            ydl.download([url])
-            cleanup_temp_files(os.path.dirname(output_path), base_path)
-            
-            if os.path.exists(output_path):
-                final_path = output_path
-            else:
-                files = [f for f in os.listdir(os.path.dirname(output_path)) 
-                        if f.startswith(os.path.basename(base_path)) and f.endswith('.mp3')]
-                if files:
-                    files_with_time = [(f, os.path.getmtime(os.path.join(os.path.dirname(output_path), f))) 
-                                      for f in files]
-                    files_with_time.sort(key=lambda x: x[1], reverse=True)
-                    final_path = os.path.join(os.path.dirname(output_path), files_with_time[0][0])
-                else:
-                    raise Exception("Fichier MP3 non créé après conversion")
-            
-            return final_path, final_filename
+            with storage.reserve(estimate_job_bytes(info, audio_format), workdir):
+                final_path = _download_with_info(ydl, info, base_path, audio_format, progress_id, progress_dict, 'soundcloud')
+                return publish_result(final_path, output_path), final_filename
+    except storage.StorageFullError:
+        raise
     except Exception as e:
         raise Exception(f"Erreur lors du téléchargement SoundCloud: {str(e)}")
+    finally:
+        remove_job_workspace(workdir)
+
+def run_spotdl(url, output_dir, audio_format='mp3', on_progress=None, timeout=None):
+    """Télécharge une URL Spotify dans output_dir et retourne les fichiers produits.
 
-def download_spotify(url, output_path, custom_filename=None, progress_id=None, progress_dict=None):
+    Utilise le moteur spotdl persistant (clients déjà initialisés); le sous-processus
+    `python -m spotdl` ne sert plus que de repli si le moteur est indisponible.
+    Au-delà de timeout secondes le job échoue, dans un cas comme dans l'autre.
+    """
+    spotdl_format, spotdl_bitrate = SPOTDL_FORMATS[audio_format]
+    ffmpeg_exe = get_ffmpeg_info()['ffmpeg']
+
+    if SPOTDL_IN_PROCESS:
+        try:
+            engine = spotdl_engine.get_engine(ffmpeg_exe, SPOTDL_WORKERS)
+            return sorted(engine.download(url, output_dir, spotdl_format, spotdl_bitrate, on_progress, timeout))
+        except spotdl_engine.SpotdlUnavailable as e:
+            print(f"[Spotify] Moteur spotdl indisponible ({e}), utilisation du sous-processus.")
+
+    cmd = [
+        sys.executable, '-m', 'spotdl',
+        url,
+        '--output', output_dir,
+        '--format', spotdl_format,
+        '--bitrate', spotdl_bitrate,
+        '--simple-tui',
+    ]
+
+    if os.path.exists(ffmpeg_exe):
+        cmd.extend(['--ffmpeg', ffmpeg_exe])
+        
+    print(f"[Spotify] Exécution de la commande: {' '.join(cmd)}")
+
+    result = subprocess.run(
+        cmd,
+        capture_output=True,
+        text=True,
+        encoding='utf-8',
+        errors='replace',
+        timeout=timeout,
+        check=False
+    )
+    
+    if result.returncode != 0:
+        raise Exception(f"Erreur d'exécution spotdl: {result.stderr}")
+
+    # Le dossier de sortie appartient au job: tout fichier au bon format en provient
+    return [
+        os.path.join(output_dir, f)
+        for f in sorted(os.listdir(output_dir))
+        if f.endswith(f'.{spotdl_format}')
+    ]
+
+def download_spotify(url, output_path, custom_filename=None, progress_id=None, progress_dict=None, audio_format='mp3'):
     try:
         ffmpeg_location = ensure_ffmpeg()
     except Exception as e:
@@ -577,8 +1211,9 @@ def download_spotify(url, output_path, custom_filename=None, progress_id=None, p
 
     if not spotdl_installed:
         print("[Spotify] Module spotdl non trouvé, utilisation du fallback YouTube.")
-        return download_spotify_fallback(url, output_path, custom_filename, progress_id, progress_dict)
+        return download_spotify_fallback(url, output_path, custom_filename, progress_id, progress_dict, audio_format)
 
+    workdir = create_job_workspace('spotify')
     try:
         if progress_id and progress_dict is not None:
             progress_dict[progress_id] = {
@@ -586,77 +1221,46 @@ def download_spotify(url, output_path, custom_filename=None, progress_id=None, p
                 'status': 'searching'
             }
 
-        if os.name == 'nt':
-            ffmpeg_exe = os.path.join(ffmpeg_location, 'ffmpeg.exe')
-        else:
-            ffmpeg_exe = os.path.join(ffmpeg_location, 'ffmpeg')
-
-        base_path = output_path.replace('.mp3', '')
-
-        cmd = [
-            sys.executable, '-m', 'spotdl',
-            url,
-            '--output', UPLOAD_FOLDER,
-            '--format', 'mp3',
-            '--bitrate', '320k',
-            '--simple-tui',
-        ]
-
-        if os.path.exists(ffmpeg_exe):
-            cmd.extend(['--ffmpeg', ffmpeg_exe])
-            
-        print(f"[Spotify] Exécution de la commande: {' '.join(cmd)}")
-
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=600,
-            check=False
-        )
-        
-        if result.returncode != 0:
-            raise Exception(f"Erreur d'exécution spotdl: {result.stderr}")
+        def on_progress(song_name, percent, message):
+            if progress_id and progress_dict is not None:
+                progress_dict[progress_id] = {
+                    'percent': 10 + int(percent * 0.85),
+                    'status': 'downloading',
+                    'message': f"{song_name}: {message}"
+                }
 
-        files = [
-            (f, os.path.getmtime(os.path.join(UPLOAD_FOLDER, f)))
-            for f in os.listdir(UPLOAD_FOLDER)
-            if f.endswith('.mp3')
-        ]
+        # spotdl ne donne pas la durée avant le téléchargement: réservation forfaitaire
+        with storage.reserve(estimate_job_bytes(None, audio_format), workdir):
+            files = run_spotdl(url, workdir, audio_format, on_progress, timeout=SPOTDL_TIMEOUT)
 
         if not files:
             raise Exception("Fichier téléchargé introuvable après exécution de spotdl.")
 
-        files.sort(key=lambda x: x[1], reverse=True)
-        downloaded_file = files[0][0]
-        original_path = os.path.join(UPLOAD_FOLDER, downloaded_file)
-
-        cleanup_temp_files(UPLOAD_FOLDER, base_path)
-
-        if os.path.exists(output_path):
-            os.remove(output_path)
-        os.rename(original_path, output_path)
+        downloaded_file = os.path.basename(files[0])
+        final_path = publish_result(files[0], output_path)
 
         if custom_filename:
             final_filename = sanitize_filename(custom_filename)
         else:
-            final_filename = sanitize_filename(downloaded_file.replace('.mp3', ''))
+            final_filename = sanitize_filename(os.path.splitext(downloaded_file)[0])
 
-        return output_path, final_filename
+        return final_path, final_filename
 
+    except storage.StorageFullError:
+        raise
     except Exception as e:
         print(f"[Spotify] Erreur avec spotdl: {e}. Utilisation du fallback YouTube.")
         try:
-            return download_spotify_fallback(url, output_path, custom_filename, progress_id, progress_dict)
+            return download_spotify_fallback(url, output_path, custom_filename, progress_id, progress_dict, audio_format)
         except Exception as e2:
             raise Exception(
                 f"Erreur lors du téléchargement Spotify avec spotdl: {e}\n"
                 f"Le fallback YouTube a aussi échoué: {e2}"
             )
+    finally:
+        remove_job_workspace(workdir)
 
-def download_instagram(url, output_path, custom_filename=None, progress_id=None, progress_dict=None):
-    base_path = output_path.replace('.mp3', '')
-    
+def download_instagram(url, output_path, custom_filename=None, progress_id=None, progress_dict=None, audio_format='mp3'):
     try:
         ffmpeg_location = ensure_ffmpeg()
     except Exception as e:
@@ -687,14 +1291,14 @@ def download_instagram(url, output_path, custom_filename=None, progress_id=None,
                     'status': 'converting'
                 }
     
+    # Dossier de travail isolé: chemins déterministes, aucun scan du dossier partagé
+    workdir = create_job_workspace()
+    base_path = os.path.join(workdir, 'audio')
+    
     ydl_opts = {
-        'format': 'bestaudio/best',
+        'format': AUDIO_FORMATS[audio_format]['format'],
         'outtmpl': base_path + '.%(ext)s',
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '320',
-        }],
+        'postprocessors': [_audio_postprocessor(audio_format)],
         'ffmpeg_location': ffmpeg_location,
         'quiet': False,
         'no_warnings': False,
@@ -704,7 +1308,8 @@ def download_instagram(url, output_path, custom_filename=None, progress_id=None,
     try:
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
             try:
-                info = ydl.extract_info(url, download=False)
+                with metrics.STAGE_SECONDS.time(stage='extract', source='instagram'):
+                    info = ydl.extract_info(url, download=False)
                 if not info:
                     raise Exception("Impossible d'extraire les informations Instagram.")
                 
@@ -717,28 +1322,17 @@ def download_instagram(url, output_path, custom_filename=None, progress_id=None,
             except Exception as e:
                 raise Exception(f"Erreur Instagram: {str(e)}")
             
-            ydl.download([url])
-            cleanup_temp_files(os.path.dirname(output_path), base_path)
-            
-            if os.path.exists(output_path):
-                final_path = output_path
-            else:
-                files = [f for f in os.listdir(os.path.dirname(output_path)) 
-                        if f.startswith(os.path.basename(base_path)) and f.endswith('.mp3')]
-                if files:
-                    files_with_time = [(f, os.path.getmtime(os.path.join(os.path.dirname(output_path), f))) 
-                                      for f in files]
-                    files_with_time.sort(key=lambda x: x[1], reverse=True)
-                    final_path = os.path.join(os.path.dirname(output_path), files_with_time[0][0])
-                else:
-                    raise Exception("Fichier MP3 non créé après conversion")
-            
-            return final_path, final_filename
-
+            with storage.reserve(estimate_job_bytes(info, audio_format), workdir):
+                final_path = _download_with_info(ydl, info, base_path, audio_format, progress_id, progress_dict, 'instagram')
+                return publish_result(final_path, output_path), final_filename
+    except storage.StorageFullError:
+        raise
     except Exception as e:
         raise Exception(f"Erreur lors du téléchargement Instagram: {str(e)}")
+    finally:
+        remove_job_workspace(workdir)
 
-def download_spotify_fallback(url, output_path, custom_filename=None, progress_id=None, progress_dict=None):
+def download_spotify_fallback(url, output_path, custom_filename=None, progress_id=None, progress_dict=None, audio_format='mp3'):
     parsed = urlparse(url)
     path_parts = parsed.path.strip('/').split('/')
 
@@ -805,11 +1399,30 @@ def download_spotify_fallback(url, output_path, custom_filename=None, progress_i
         print(f"[Spotify Fallback] Recherche sur YouTube: {search_query}")
 
         yt_search_url = f"ytsearch1:{search_query}"
-        return download_youtube(yt_search_url, output_path, custom_filename, progress_id, progress_dict)
+        return download_youtube(yt_search_url, output_path, custom_filename, progress_id, progress_dict, audio_format)
 
     except Exception as e:
         raise Exception(f"Erreur lors du fallback Spotify: {str(e)}")
 
+def download_track(url, source_type, output_path, custom_filename=None, progress_id=None, progress_dict=None, audio_format='mp3'):
+    """Télécharge un fichier unique avec la fonction correspondant à source_type"""
+    download_functions = {
+        'youtube': download_youtube,
+        'soundcloud': download_soundcloud,
+        'spotify': download_spotify,
+        'instagram': download_instagram,
+    }
+    if source_type not in download_functions:
+        raise Exception("Type de source non supporté")
+    try:
+        result = download_functions[source_type](url, output_path, custom_filename, progress_id, progress_dict, audio_format)
+    except Exception:
+        metrics.JOBS.inc(source=source_type, status='error')
+        metrics.ERRORS.inc(source=source_type)
+        raise
+    metrics.JOBS.inc(source=source_type, status='completed')
+    return result
+
 
 # ===== MUSIC RECOGNITION FUNCTIONS =====
 
@@ -852,13 +1465,17 @@ def parse_timecode(timecode_str, default_to_minutes=False):
         raise Exception(f"Format de timecode invalide: {timecode_str}")
 
 
+# Encodeur utilisé pour la coupe selon l'extension du fichier de sortie
+TRIM_ENCODERS = {
+    '.mp3': ['-acodec', 'libmp3lame', '-ab', '192k'],
+    '.m4a': ['-acodec', 'aac', '-ab', '192k'],
+    '.opus': ['-acodec', 'libopus', '-ab', '128k'],
+    '.ogg': ['-acodec', 'libvorbis', '-ab', '192k'],
+}
+
 def trim_audio(input_path, output_path, start_time=None, end_time=None):
     """Trim audio file using FFmpeg"""
-    ffmpeg_location = ensure_ffmpeg()
-    if not ffmpeg_location:
-        raise Exception("FFmpeg n'est pas disponible.")
-    
-    ffmpeg_exe = os.path.join(ffmpeg_location, 'ffmpeg.exe' if os.name == 'nt' else 'ffmpeg')
+    ffmpeg_exe = get_ffmpeg_info()['ffmpeg']
     
     # -ss before -i is faster, but less accurate. 
     # -ss after -i is accurate.
@@ -894,10 +1511,12 @@ def trim_audio(input_path, output_path, start_time=None, end_time=None):
         else:
             cmd.extend(['-to', str(end_time)])
             
-    cmd.extend(['-acodec', 'libmp3lame', '-ab', '192k', '-y', output_path])
+    encoder_args = TRIM_ENCODERS.get(os.path.splitext(output_path)[1].lower(), TRIM_ENCODERS['.mp3'])
+    cmd.extend(encoder_args + ['-y', output_path])
     
     try:
-        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        with metrics.STAGE_SECONDS.time(stage='trim'):
+            result = subprocess.run(cmd, check=True, capture_output=True, text=True)
         if not os.path.exists(output_path):
             raise Exception(f"Fichier coupé non créé: {output_path}")
         return output_path
@@ -908,11 +1527,7 @@ def trim_audio(input_path, output_path, start_time=None, end_time=None):
 
 def extract_audio_segment(input_path, output_path, start_time, duration=10):
     """Extract audio segment using FFmpeg"""
-    ffmpeg_location = ensure_ffmpeg()
-    if not ffmpeg_location:
-        raise Exception("FFmpeg n'est pas disponible.")
-    
-    ffmpeg_exe = os.path.join(ffmpeg_location, 'ffmpeg.exe' if os.name == 'nt' else 'ffmpeg')
+    ffmpeg_exe = get_ffmpeg_info()['ffmpeg']
     cmd = [ffmpeg_exe, '-ss', str(start_time), '-i', input_path, '-t', str(duration), 
            '-acodec', 'libmp3lame', '-ab', '192k', '-y', output_path]
     
@@ -924,6 +1539,10 @@ def extract_audio_segment(input_path, output_path, start_time, duration=10):
 
 async def search_track_links(track_name, artist_name):
     """Search for track links on various platforms"""
+    # spotipy et yt-dlp sont bloquants: un thread par recherche, pour pouvoir les lancer en parallèle
+    return await asyncio.get_running_loop().run_in_executor(None, _search_track_links, track_name, artist_name)
+
+def _search_track_links(track_name, artist_name):
     links = {}
     spotify_uri = None
     
@@ -1002,17 +1621,198 @@ def play_spotify_uri(uri):
     return False
 
 
-def download_for_recognition(url, output_path):
-    """Download complete audio for recognition"""
+# Protocoles yt-dlp dont le flux peut être lu par plages (ffmpeg -ss directement sur l'URL)
+SEEKABLE_PROTOCOLS = ('http', 'https')
+
+def resolve_recognition_stream(url):
+    """Résout l'URL directe du flux audio, sans téléchargement, si le serveur accepte les requêtes Range.
+
+    Retourne l'info dict yt-dlp, ou None si la source doit être téléchargée en entier.
+    """
+    try:
+        with yt_dlp.YoutubeDL({'format': 'bestaudio/best', 'quiet': True}) as ydl:
+            with metrics.STAGE_SECONDS.time(stage='extract', source='recognition'):
+                info = ydl.extract_info(url, download=False)
+    except Exception as e:
+        print(f"[Recognition] Résolution du flux impossible ({e}), téléchargement complet.")
+        return None
+
+    if not info or not info.get('url') or info.get('protocol') not in SEEKABLE_PROTOCOLS:
+        return None
+
+    # Un seul octet demandé: 206 = accès par plages possible
+    try:
+        headers = dict(info.get('http_headers') or {}, Range='bytes=0-0')
+        with requests.get(info['url'], headers=headers, stream=True, timeout=15) as response:
+            if response.status_code != 206:
+                print(f"[Recognition] Flux non seekable (HTTP {response.status_code}), téléchargement complet.")
+                return None
+    except Exception as e:
+        print(f"[Recognition] Test du flux impossible ({e}), téléchargement complet.")
+        return None
+    return info
+
+class RecognitionAudio:
+    """Fenêtres PCM analysées par la reconnaissance.
+
+    Flux distant seekable: chaque fenêtre est lue par plage et décodée directement en mémoire.
+    Sinon (ou en cas d'échec), et pour l'analyse d'un mix complet (load), l'audio est décodé
+    une seule fois dans un PCM projeté en mémoire, où toutes les fenêtres sont découpées.
+    """
+
+    def __init__(self, url, workdir, keep_file=False):
+        self.url = url
+        self.workdir = workdir
+        self.keep_file = keep_file
+        # -no_delete demande le fichier complet: pas de lecture partielle
+        self.stream = None if keep_file else resolve_recognition_stream(url)
+        self.path = None
+        self.pcm = None
+        # Les fenêtres sont lues depuis plusieurs threads: un seul téléchargement complet
+        self._lock = threading.Lock()
+
+    @property
+    def duration(self):
+        if self.pcm is not None:
+            return self.pcm.duration
+        return (self.stream or {}).get('duration')
+
+    def load(self):
+        """Décode tout l'audio une seule fois et retourne le PCMBuffer"""
+        with self._lock:
+            if self.pcm is None:
+                ffmpeg_exe = get_ffmpeg_info()['ffmpeg']
+                raw_path = os.path.join(self.workdir, "audio.pcm")
+                if self.stream is not None:
+                    # Flux décodé à la volée: pas de fichier audio intermédiaire
+                    try:
+                        with metrics.STAGE_SECONDS.time(stage='decode', source='recognition'):
+                            self.pcm = pcm.decode_file(ffmpeg_exe, self.stream['url'], raw_path=raw_path,
+                                                       headers=self.stream.get('http_headers'))
+                    except Exception as e:
+                        print(f"[Recognition] Décodage du flux impossible ({e}), téléchargement complet.")
+                        self.stream = None
+                if self.pcm is None:
+                    self.path = download_for_recognition(url=self.url, output_path=os.path.join(self.workdir, "audio.mp3"),
+                                                         encode=self.keep_file)
+                    with metrics.STAGE_SECONDS.time(stage='decode', source='recognition'):
+                        self.pcm = pcm.decode_file(ffmpeg_exe, self.path, raw_path=raw_path)
+                print(f"[Recognition] Audio décodé: {self.pcm.duration:.0f}s")
+            return self.pcm
+
+    def window(self, timecode, duration=10):
+        """Échantillons de la fenêtre, ou None si timecode dépasse la fin de l'audio"""
+        if self.pcm is None and self.stream is not None:
+            if self.stream.get('duration') and timecode >= self.stream['duration']:
+                return None
+            try:
+                with metrics.STAGE_SECONDS.time(stage='download', source='recognition'):
+                    buffer = pcm.decode_stream(get_ffmpeg_info()['ffmpeg'], self.stream['url'], timecode, duration,
+                                               headers=self.stream.get('http_headers'))
+                return buffer.samples
+            except Exception as e:
+                # Flux qui refuse finalement le seek (ou URL expirée): repli sur le téléchargement complet
+                print(f"[Recognition] Lecture partielle impossible ({e}), téléchargement complet.")
+                self.stream = None
+        return self.load().window(timecode, duration)
+
+    def close(self):
+        if self.pcm is not None:
+            self.pcm.close()
+
+# Reconnaissance Shazam: appels simultanés par !find, débit global (tous les !find confondus)
+SHAZAM_CONCURRENCY = 4
+SHAZAM_RATE = 2          # requêtes/s en régime établi
+SHAZAM_BURST = 4
+SHAZAM_RETRIES = 3
+SHAZAM_BACKOFF = 2       # secondes, doublées à chaque nouvel essai
+SHAZAM_LIMITER = ratelimit.TokenBucket(SHAZAM_RATE, SHAZAM_BURST)
+
+class ShazamUnavailable(Exception):
+    """Réponse Shazam inexploitable (limitation de débit, erreur du service)"""
+
+def _shazam_client():
+    from shazamio import Shazam
+    try:
+        from shazamio.client import HTTPClient
+        from aiohttp_retry import ExponentialRetry
+    except ImportError:
+        return Shazam()
+    # Une seule tentative par requête: les reprises passent par SHAZAM_LIMITER
+    # au lieu des 20 essais internes de shazamio, qui ignorent la limitation
+    return Shazam(http_client=HTTPClient(retry_options=ExponentialRetry(attempts=1)))
+
+def _shazam_retryable_errors():
+    errors = [ShazamUnavailable, asyncio.TimeoutError]
+    try:
+        import aiohttp
+        errors.append(aiohttp.ClientError)
+    except ImportError:
+        pass
+    try:
+        from shazamio.exceptions import FailedDecodeJson
+        errors.append(FailedDecodeJson)
+    except ImportError:
+        pass
+    return tuple(errors)
+
+async def recognize_samples(shazam, samples, timecode=None):
+    """Envoie une fenêtre PCM à Shazam en respectant le débit; nouvel essai (attente croissante) si le service limite"""
+    data = pcm.to_wav(samples)
+    retryable = _shazam_retryable_errors()
+    for attempt in range(SHAZAM_RETRIES + 1):
+        await SHAZAM_LIMITER.acquire()
+        try:
+            with metrics.STAGE_SECONDS.time(stage='shazam'):
+                result = await shazam.recognize(data)
+            # Une réponse valide contient toujours 'matches' (vide si rien n'est reconnu)
+            if not isinstance(result, dict) or 'matches' not in result:
+                raise ShazamUnavailable(str(result)[:200])
+            return result
+        except retryable as e:
+            if attempt == SHAZAM_RETRIES:
+                raise
+            delay = SHAZAM_BACKOFF * 2 ** attempt
+            print(f"[Recognition] Shazam indisponible au timecode {timecode}s ({e}), nouvel essai dans {delay}s")
+            # Toutes les requêtes en attente ralentissent, pas seulement celle-ci
+            SHAZAM_LIMITER.pause(delay)
+
+def _lookup_fingerprint(samples):
+    """Empreinte de la fenêtre et morceau correspondant de l'index local (None si inconnu ou index indisponible)"""
+    try:
+        hashes = fingerprint.compute(samples)
+        return hashes, fingerprint.lookup(hashes)
+    except Exception as e:
+        print(f"[Recognition] Index d'empreintes indisponible: {e}")
+        return None, None
+
+def _index_fingerprints(identified):
+    """Ajoute à l'index local les fenêtres identifiées par Shazam: [(hachages, résultat avec liens)]"""
+    for hashes, res in identified:
+        try:
+            fingerprint.add(hashes, res['title'], res['artist'], {
+                'shazam_url': res.get('shazam_url'),
+                'cover_art': res.get('cover_art'),
+                'links': res.get('links', {}),
+            })
+        except Exception as e:
+            print(f"[Recognition] Indexation impossible ({res['title']}): {e}")
+
+def download_for_recognition(url, output_path, encode=True):
+    """Download complete audio for recognition
+
+    encode=False garde le format d'origine (pas de réencodage MP3: le fichier n'est que décodé en PCM).
+    """
     ffmpeg_location = ensure_ffmpeg()
     ydl_opts = {
         'format': 'bestaudio/best',
         'outtmpl': output_path.replace('.mp3', '.%(ext)s'),
-        'postprocessors': [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'}],
         'quiet': False,
         'ffmpeg_location': ffmpeg_location,
         'keepvideo': False,
     }
+    if encode:
+        ydl_opts['postprocessors'] = [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'}]
     
     with yt_dlp.YoutubeDL(ydl_opts) as ydl:
         print(f"[Recognition] Téléchargement audio...")
@@ -1020,15 +1820,16 @@ def download_for_recognition(url, output_path):
         if os.path.exists(output_path):
             print(f"[Recognition] Audio: {info.get('duration', 0)}s ({info.get('duration', 0)/60:.1f} min)")
             return output_path
-        base_path = output_path.replace('.mp3', '')
+        base_path = os.path.splitext(output_path)[0]
         directory = os.path.dirname(output_path)
-        files = [f for f in os.listdir(directory) if f.startswith(os.path.basename(base_path)) and f.endswith('.mp3')]
+        files = [f for f in os.listdir(directory) if f.startswith(os.path.basename(base_path))
+                 and (f.endswith('.mp3') or not encode) and not f.endswith('.part')]
         if files:
             return os.path.join(directory, files[0])
-        raise Exception("MP3 non créé")
+        raise Exception("MP3 non créé" if encode else "Audio non téléchargé")
 
 
-def recognize_music_from_url_sync(url, timecodes=None, progress_id=None, progress_dict=None, keep_file=False):
+def recognize_music_from_url_sync(url, timecodes=None, progress_id=None, progress_dict=None, keep_file=False, scan=False):
     """Sync wrapper for recognize_music_from_url"""
     import asyncio
     import sys
@@ -1037,87 +1838,99 @@ def recognize_music_from_url_sync(url, timecodes=None, progress_id=None, progres
     if sys.platform == 'win32':
         asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
         
-    return asyncio.run(recognize_music_from_url(url, timecodes, progress_id, progress_dict, keep_file))
+    return asyncio.run(recognize_music_from_url(url, timecodes, progress_id, progress_dict, keep_file, scan))
 
 
-async def recognize_music_from_url(url, timecodes=None, progress_id=None, progress_dict=None, keep_file=False):
-    """Recognize music from URL using Shazam"""
-    from shazamio import Shazam
+async def recognize_music_from_url(url, timecodes=None, progress_id=None, progress_dict=None, keep_file=False, scan=False):
+    """Recognize music from URL using Shazam
+
+    scan=True analyse le mix entier (timecodes ignorés) et ajoute 'tracklist' au résultat:
+    [{'start', 'end', 'title', 'artist', 'links', ...}] en secondes.
+    """
     temp_uuid = str(uuid.uuid4())
-    temp_audio_path = os.path.join(UPLOAD_FOLDER, f"{temp_uuid}.mp3")
-    final_path = None
+    workdir = create_job_workspace('recognition')
+    audio = None
     result_to_return = {'found': False, 'message': 'Erreur inconnue'}  # Default result
     
     try:
-        # Determine source type
-        if is_youtube_url(url):
-            source_type = 'youtube'
-        elif is_soundcloud_url(url):
-            source_type = 'soundcloud'
-        elif is_spotify_url(url):
-            source_type = 'spotify'
-        elif is_instagram_url(url):
-            source_type = 'instagram'
-        else:
+        # Seules les sources gérées par les téléchargeurs sont acceptées
+        if not (is_youtube_url(url) or is_soundcloud_url(url) or is_spotify_url(url) or is_instagram_url(url)):
             raise Exception("URL non supportée")
         
-        # Download audio
-        final_path = download_for_recognition(url, temp_audio_path)
+        # Lecture partielle du flux distant quand c'est possible, sinon décodage unique du fichier complet
+        audio = RecognitionAudio(url, workdir, keep_file)
         
-        # Default timecodes
-        if not timecodes:
+        loop = asyncio.get_running_loop()
+        plan = None
+        if scan:
+            # Mix complet: décodage unique, sondes placées d'après l'énergie et les changements spectraux
+            buffer = await loop.run_in_executor(None, audio.load)
+            with metrics.STAGE_SECONDS.time(stage='scan', source='recognition'):
+                plan = await loop.run_in_executor(None, tracklist.plan_probes, buffer)
+            timecodes = plan.probes
+            print(f"[Recognition] Scan: {len(plan.boundaries)} segments détectés, {len(timecodes)} sondes")
+        elif not timecodes:
+            # Default timecodes
             timecodes = [30, 60, 90]
         
-        # Analyze each timecode
+        # Analyze each timecode (fenêtres lues et envoyées en parallèle, débit borné par SHAZAM_LIMITER)
         print(f"[Recognition] Initialisation Shazam...")
-        shazam = Shazam()
-        
-        results = []
+        shazam = _shazam_client()
+        semaphore = asyncio.Semaphore(SHAZAM_CONCURRENCY)
+        # Fenêtres reconnues par Shazam, indexées une fois leurs liens trouvés
+        identified = []
         print(f"[Recognition] Analyse de {len(timecodes)} timecodes: {timecodes}")
         
-        for i, timecode in enumerate(timecodes):
-            segment_path = None
-            try:
-                print(f"[Recognition] Traitement timecode {i+1}/{len(timecodes)}: {timecode}s")
-                segment_path = os.path.join(UPLOAD_FOLDER, f"{temp_uuid}_segment_{i}.mp3")
-                
-                # Extract segment
-                print(f"[Recognition] Extraction segment vers {segment_path}")
-                extract_audio_segment(final_path, segment_path, timecode, duration=10)
-                
-                # Recognize
-                print(f"[Recognition] Envoi à Shazam...")
-                result = await shazam.recognize(segment_path)
-                
-                # Cleanup segment
-                if os.path.exists(segment_path):
-                    os.remove(segment_path)
-                
-                if result and 'track' in result:
-                    track_info = result['track']
-                    title = track_info.get('title', 'Inconnu')
-                    artist = track_info.get('subtitle', 'Inconnu')
-                    print(f"[Recognition] TROUVÉ: {title} - {artist}")
+        async def analyze(i, timecode):
+            async with semaphore:
+                try:
+                    print(f"[Recognition] Traitement timecode {i+1}/{len(timecodes)}: {timecode}s")
                     
-                    results.append({
-                        'timecode': timecode,
-                        'title': title,
-                        'artist': artist,
-                        'shazam_url': track_info.get('url', None),
-                        'cover_art': track_info.get('images', {}).get('coverart', None),
-                        'raw_result': result
-                    })
-                else:
-                    print(f"[Recognition] Rien trouvé au timecode {timecode}s")
+                    # Fenêtre PCM découpée en mémoire, envoyée en WAV sans fichier intermédiaire
+                    samples = await loop.run_in_executor(None, audio.window, timecode, 10)
+                    if samples is None or not len(samples):
+                        print(f"[Recognition] Timecode {timecode}s au-delà de la fin ({audio.duration}s)")
+                        return None
                     
-            except Exception as e:
-                print(f"[Recognition] ERREUR au timecode {timecode}s: {e}")
-                if segment_path and os.path.exists(segment_path):
-                    try:
-                        os.remove(segment_path)
-                    except:
-                        pass
-                continue
+                    # Index local d'abord: un extrait déjà identifié ne repart pas chez Shazam
+                    hashes, known = await loop.run_in_executor(None, _lookup_fingerprint, samples)
+                    if known:
+                        print(f"[Recognition] TROUVÉ (index local): {known['title']} - {known['artist']}")
+                        return {
+                            'timecode': timecode,
+                            'title': known['title'],
+                            'artist': known['artist'],
+                            'shazam_url': known.get('shazam_url'),
+                            'cover_art': known.get('cover_art'),
+                            'links': dict(known.get('links') or {}),
+                            'raw_result': None
+                        }
+                    
+                    result = await recognize_samples(shazam, samples, timecode)
+                    if result and 'track' in result:
+                        track_info = result['track']
+                        title = track_info.get('title', 'Inconnu')
+                        artist = track_info.get('subtitle', 'Inconnu')
+                        print(f"[Recognition] TROUVÉ: {title} - {artist}")
+                        found = {
+                            'timecode': timecode,
+                            'title': title,
+                            'artist': artist,
+                            'shazam_url': track_info.get('url', None),
+                            'cover_art': track_info.get('images', {}).get('coverart', None),
+                            'raw_result': result
+                        }
+                        if hashes:
+                            identified.append((hashes, found))
+                        return found
+                    print(f"[Recognition] Rien trouvé au timecode {timecode}s")
+                except Exception as e:
+                    print(f"[Recognition] ERREUR au timecode {timecode}s: {e}")
+                return None
+        
+        # gather conserve l'ordre des timecodes
+        outcomes = await asyncio.gather(*(analyze(i, tc) for i, tc in enumerate(timecodes)))
+        results = [r for r in outcomes if r]
         
         # Prepare result
         if not results:
@@ -1129,13 +1942,20 @@ async def recognize_music_from_url(url, timecodes=None, progress_id=None, progre
             # For backward compatibility, we also return the "best" (first) result fields
             best_result = results[0]
             
-            # Search links for ALL found tracks
+            # Search links for ALL found tracks: une recherche par morceau distinct, toutes en parallèle
+            # (les morceaux trouvés dans l'index local ont déjà leurs liens)
+            links_by_track = {(res['title'], res['artist']): res['links'] for res in results if 'links' in res}
+            tracks = [track for track in dict.fromkeys((res['title'], res['artist']) for res in results)
+                      if track not in links_by_track]
+            found_links = await asyncio.gather(*(search_track_links(title, artist) for title, artist in tracks))
+            links_by_track.update(zip(tracks, found_links))
             all_tracks_links = []
             for res in results:
-                links = await search_track_links(res['title'], res['artist'])
-                res['links'] = links
+                res['links'] = dict(links_by_track[(res['title'], res['artist'])])
                 all_tracks_links.append(res)
             
+            await loop.run_in_executor(None, _index_fingerprints, identified)
+            
             result_to_return = {
                 'found': True,
                 'results': all_tracks_links, # New field with all results
@@ -1147,26 +1967,27 @@ async def recognize_music_from_url(url, timecodes=None, progress_id=None, progre
                 'shazam_url': best_result['shazam_url'],
                 'links': all_tracks_links[0]['links']
             }
+            
+            if plan is not None:
+                # Sondes consécutives d'un même morceau fusionnées en plages horaires
+                entries = tracklist.build_tracklist(zip(timecodes, outcomes), plan.boundaries, plan.duration)
+                for entry in entries:
+                    entry['links'] = dict(links_by_track[(entry['title'], entry['artist'])])
+                result_to_return['tracklist'] = entries
         
     except Exception as e:
         print(f"[Recognition] ERREUR GLOBALE: {e}")
-        # Clean up segments
-        for f in os.listdir(UPLOAD_FOLDER):
-            if f.startswith(temp_uuid) and '_segment_' in f:
-                try:
-                    os.remove(os.path.join(UPLOAD_FOLDER, f))
-                except:
-                    pass
         raise e
     finally:
-        # This executes AFTER all analyses
-        if not keep_file and final_path and os.path.exists(final_path):
-            print(f"[Recognition] Suppression: {final_path}")
-            try:
-                os.remove(final_path)
-            except Exception as e:
-                print(f"[Recognition] Erreur suppression: {e}")
-        elif keep_file and final_path and os.path.exists(final_path):
-            print(f"[Recognition] Fichier conservé: {final_path}")
+        # This executes AFTER all analyses: the workspace (audio + segments) goes away in one go
+        if audio is not None:
+            audio.close()
+            if keep_file and audio.path and os.path.exists(audio.path):
+                # Hors de portée du janitor et de l'éviction: le fichier reste jusqu'à suppression manuelle
+                kept_dir = kept_files_folder()
+                os.makedirs(kept_dir, exist_ok=True)
+                kept_path = publish_result(audio.path, os.path.join(kept_dir, f"{temp_uuid}.mp3"))
+                print(f"[Recognition] Fichier conservé: {kept_path}")
+        remove_job_workspace(workdir)
     
     return result_to_return
@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import Counter
+import numpy as np
+import metrics
+
+# Configuration par défaut (INDEX_PATH None: index désactivé)
+INDEX_PATH = 'fingerprints.db'
+MIN_MATCHES = 20          # hachages alignés nécessaires pour accepter une correspondance
+
+# Empreinte: pics spectraux (STFT à 16 kHz, trames de 16 ms) appariés deux à deux
+FFT_SIZE = 1024
+HOP = 256
+PEAK_TIME = 15            # un pic domine ses voisins sur ±15 trames...
+PEAK_FREQ = 10            # ...et ±10 bandes de fréquence
+PEAK_RANGE = 3           # pics retenus à moins de 3 (log naturel, ~26 dB) du maximum de leur trame
+ONSET_DECAY = 0.98        # passe-haut temporel: les attaques de notes dominent les sons tenus
+PEAKS_PER_SECOND = 30
+FAN_OUT = 10              # chaque pic est apparié aux 10 suivants
+MAX_DELTA = 63            # écart maximal entre deux pics appariés (trames, 6 bits)
+QUERY_CHUNK = 500         # paramètres par requête IN (limite SQLite)
+
+_local = threading.local()
+
+def setup(index_path):
+    global INDEX_PATH
+    INDEX_PATH = index_path
+
+def _connect():
+    # Une connexion par thread et par base (les reconnaissances tournent dans l'executor)
+    if getattr(_local, 'key', None) != (INDEX_PATH, os.getpid()):
+        directory = os.path.dirname(INDEX_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(INDEX_PATH, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS tracks ('
+            ' id INTEGER PRIMARY KEY, title TEXT NOT NULL, artist TEXT NOT NULL,'
+            ' data TEXT NOT NULL, added REAL NOT NULL, UNIQUE (title, artist))'
+        )
+        conn.execute('CREATE TABLE IF NOT EXISTS hashes (hash INTEGER NOT NULL, track_id INTEGER NOT NULL, offset INTEGER NOT NULL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS hashes_by_hash ON hashes (hash)')
+        _local.conn = conn
+        _local.key = (INDEX_PATH, os.getpid())
+    return _local.conn
+
+def _sliding_max(values, radius, axis):
+    """Maximum sur ±radius le long d'un axe (le filtre max 2D est séparable)"""
+    pad = [(0, 0)] * values.ndim
+    pad[axis] = (radius, radius)
+    padded = np.pad(values, pad, mode='constant', constant_values=-np.inf)
+    return np.lib.stride_tricks.sliding_window_view(padded, 2 * radius + 1, axis=axis).max(axis=-1)
+
+def peaks(samples, sample_rate=16000):
+    """Pics spectraux (trame, bande) du signal, au plus PEAKS_PER_SECOND par seconde, triés par trame"""
+    signal = np.asarray(samples, dtype=np.float32) / 32768.0
+    if len(signal) < FFT_SIZE:
+        return []
+    frames = np.lib.stride_tricks.sliding_window_view(signal, FFT_SIZE)[::HOP]
+    magnitude = np.abs(np.fft.rfft(frames * np.hanning(FFT_SIZE).astype(np.float32), axis=1))
+    if not magnitude.max():
+        return []
+    spectrum = np.log(np.maximum(magnitude, magnitude.max() * 1e-6))
+    spectrum -= spectrum.mean()
+
+    # Le maximum d'une note tenue tombe sur une trame quelconque de son plateau (instable);
+    # celui de son attaque est bien localisé dans le temps
+    emphasized = np.empty_like(spectrum)
+    previous, state = spectrum[0], np.zeros(spectrum.shape[1], dtype=spectrum.dtype)
+    for i, row in enumerate(spectrum):
+        state = row - previous + ONSET_DECAY * state
+        previous = row
+        emphasized[i] = state
+    spectrum = emphasized
+
+    local_max = _sliding_max(_sliding_max(spectrum, PEAK_FREQ, axis=1), PEAK_TIME, axis=0)
+    floor = spectrum.max(axis=1, keepdims=True) - PEAK_RANGE
+    candidates = np.argwhere((spectrum == local_max) & (spectrum > floor) & (spectrum > 0))
+
+    # Densité limitée: les pics les plus forts de chaque seconde
+    per_second = sample_rate // HOP
+    selected = []
+    for second in range(0, len(frames), per_second):
+        group = candidates[(candidates[:, 0] >= second) & (candidates[:, 0] < second + per_second)]
+        strongest = np.argsort(spectrum[group[:, 0], group[:, 1]])[::-1][:PEAKS_PER_SECOND]
+        selected.extend((int(t), int(f)) for t, f in group[strongest])
+    return sorted(selected)
+
+def compute(samples, sample_rate=16000):
+    """Empreinte d'une fenêtre: [(hachage, trame du pic d'ancrage)]"""
+    points = peaks(samples, sample_rate)
+    hashes = []
+    for i, (t1, f1) in enumerate(points):
+        for t2, f2 in points[i + 1:i + 1 + FAN_OUT]:
+            delta = t2 - t1
+            if 0 < delta <= MAX_DELTA:
+                hashes.append(((f1 & 0x1FF) << 15 | (f2 & 0x1FF) << 6 | delta, t1))
+    return hashes
+
+def lookup(hashes):
+    """Morceau déjà identifié dont l'empreinte correspond ({'title', 'artist', ...}), ou None.
+
+    Une correspondance exige MIN_MATCHES hachages communs avec le même décalage temporel.
+    """
+    if INDEX_PATH is None or not hashes:
+        return None
+    offsets = {}
+    for h, t in hashes:
+        offsets.setdefault(h, []).append(t)
+
+    with metrics.STAGE_SECONDS.time(stage='fingerprint', source='recognition'):
+        conn = _connect()
+        votes = Counter()
+        keys = list(offsets)
+        for start in range(0, len(keys), QUERY_CHUNK):
+            chunk = keys[start:start + QUERY_CHUNK]
+            rows = conn.execute(
+                f'SELECT hash, track_id, offset FROM hashes WHERE hash IN ({",".join("?" * len(chunk))})', chunk
+            )
+            for h, track_id, offset in rows:
+                for t in offsets[h]:
+                    votes[(track_id, offset - t)] += 1
+
+        # Décalage ±1 trame toléré (fenêtres décalées de quelques échantillons)
+        scores = {(track_id, delta): votes[(track_id, delta - 1)] + count + votes[(track_id, delta + 1)]
+                  for (track_id, delta), count in votes.items()}
+        if not scores:
+            metrics.FINGERPRINT_LOOKUPS.inc(result='miss')
+            return None
+        (track_id, _), count = max(scores.items(), key=lambda item: item[1])
+        if count < MIN_MATCHES:
+            metrics.FINGERPRINT_LOOKUPS.inc(result='miss')
+            return None
+        row = conn.execute('SELECT title, artist, data FROM tracks WHERE id = ?', (track_id,)).fetchone()
+
+    if row is None:
+        return None
+    metrics.FINGERPRINT_LOOKUPS.inc(result='hit')
+    match = json.loads(row[2])
+    match.update({'title': row[0], 'artist': row[1], 'matches': count})
+    return match
+
+def add(hashes, title, artist, data):
+    """Indexe l'empreinte d'une fenêtre identifiée; data (liens, pochette...) est renvoyé par lookup"""
+    if INDEX_PATH is None or not hashes:
+        return
+    conn = _connect()
+    with conn:
+        # Pas d'upsert (ON CONFLICT, SQLite 3.24+): UPDATE puis INSERT, sous le verrou
+        # d'écriture pris dès BEGIN IMMEDIATE pour que deux ajouts ne se croisent pas
+        conn.execute('BEGIN IMMEDIATE')
+        cursor = conn.execute('UPDATE tracks SET data = ? WHERE title = ? AND artist = ?', (json.dumps(data), title, artist))
+        if cursor.rowcount == 0:
+            conn.execute('INSERT INTO tracks (title, artist, data, added) VALUES (?, ?, ?, ?)',
+                         (title, artist, json.dumps(data), time.time()))
+        track_id = conn.execute('SELECT id FROM tracks WHERE title = ? AND artist = ?', (title, artist)).fetchone()[0]
+        conn.executemany('INSERT INTO hashes (hash, track_id, offset) VALUES (?, ?, ?)',
+                         [(h, track_id, t) for h, t in hashes])
+
+def stats():
+    if INDEX_PATH is None:
+        return {'tracks': 0, 'hashes': 0}
+    conn = _connect()
+    return {
+        'tracks': conn.execute('SELECT COUNT(*) FROM tracks').fetchone()[0],
+        'hashes': conn.execute('SELECT COUNT(*) FROM hashes').fetchone()[0],
+    }
@@ -0,0 +1,68 @@
+import time
+import threading
+
+class Janitor:
+    """Thread de fond qui exécute périodiquement des tâches de nettoyage.
+
+    Chaque tâche retourne le nombre d'éléments supprimés, ou un tuple
+    (éléments, octets libérés); les totaux sont exposés par stats().
+    """
+
+    def __init__(self, interval=60):
+        self.interval = interval
+        self._tasks = []
+        self._lock = threading.Lock()
+        self._runs = 0
+        self._last_run = None
+        self._reclaimed = {}
+        self._thread = None
+
+    def add_task(self, name, func):
+        with self._lock:
+            self._tasks.append((name, func))
+            self._reclaimed[name] = {'items': 0, 'bytes': 0, 'last_items': 0}
+
+    def run_once(self):
+        with self._lock:
+            tasks = list(self._tasks)
+
+        for name, func in tasks:
+            try:
+                result = func()
+            except Exception as e:
+                print(f"[Janitor] Erreur dans la tâche {name}: {e}")
+                continue
+
+            items, freed = result if isinstance(result, tuple) else (result or 0, 0)
+            with self._lock:
+                entry = self._reclaimed[name]
+                entry['items'] += items
+                entry['bytes'] += freed
+                entry['last_items'] = items
+            if items:
+                print(f"[Janitor] {name}: {items} élément(s) supprimé(s), {freed / (1024 * 1024):.1f} Mo libérés")
+
+        with self._lock:
+            self._runs += 1
+            self._last_run = time.time()
+
+    def start(self):
+        """Démarre le thread de nettoyage (une seule fois)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='janitor', daemon=True)
+            self._thread.start()
+        return self
+
+    def stats(self):
+        with self._lock:
+            return {
+                'interval': self.interval,
+                'runs': self._runs,
+                'last_run': self._last_run,
+                'reclaimed': {name: dict(entry) for name, entry in self._reclaimed.items()}
+            }
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            self.run_once()
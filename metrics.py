@@ -0,0 +1,163 @@
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Format d'exposition texte de Prometheus (version 0.0.4)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_registry = []
+_registry_lock = threading.Lock()
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+class Counter(_Metric):
+    """Compteur croissant (octets, requêtes, erreurs...)"""
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {value}' for key, value in items]
+
+class Gauge(_Metric):
+    """Valeur instantanée, lue au moment de l'export via une fonction"""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, func):
+        super().__init__(name, documentation)
+        self.func = func
+
+    def _samples(self):
+        try:
+            return [f'{self.name} {self.func()}']
+        except Exception:
+            return []
+
+class Histogram(_Metric):
+    """Distribution de durées (secondes) par intervalles cumulés"""
+    kind = 'histogram'
+
+    DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Mesure la durée du bloc (y compris en cas d'exception)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels):
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels), ([0], 0.0))
+            return sum(counts)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(float(bound))
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, [("le", le)])} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+def render():
+    """Toutes les métriques du processus au format texte Prometheus"""
+    with _registry_lock:
+        metrics = list(_registry)
+    return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+def start_http_server(port, host='0.0.0.0'):
+    """Expose /metrics sur un port dédié (processus sans serveur Web, comme le bot)"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True)
+    thread.start()
+    return server
+
+# Métriques partagées par l'interface Web et le bot
+STAGE_SECONDS = Histogram(
+    'musicdl_stage_seconds',
+    "Durée de chaque étape (extract, download, transcode, trim, zip, send, shazam, decode, scan, fingerprint). "
+    "En mode pipeline, download inclut l'encodage FFmpeg.",
+    ['stage', 'source']
+)
+BYTES_DOWNLOADED = Counter('musicdl_downloaded_bytes_total', 'Octets téléchargés depuis les sources', ['source'])
+BYTES_SERVED = Counter('musicdl_served_bytes_total', 'Octets envoyés aux clients', ['interface'])
+CACHE_REQUESTS = Counter('musicdl_cache_requests_total', 'Consultations du cache de conversions', ['result'])
+JOBS = Counter('musicdl_jobs_total', 'Téléchargements terminés par source et statut', ['source', 'status'])
+ERRORS = Counter('musicdl_errors_total', 'Erreurs par source', ['source'])
+COALESCED = Counter('musicdl_coalesced_requests_total', 'Demandes rattachées à une conversion identique déjà en cours', ['interface'])
+FINGERPRINT_LOOKUPS = Counter('musicdl_fingerprint_lookups_total', "Consultations de l'index local d'empreintes avant Shazam", ['result'])
@@ -0,0 +1,89 @@
+import io
+import os
+import wave
+import subprocess
+import numpy as np
+
+# Format de travail de la reconnaissance: mono, 16 kHz, 16 bits signés
+# (celui des signatures Shazam: aucun rééchantillonnage côté shazamio)
+SAMPLE_RATE = 16000
+SAMPLE_DTYPE = '<i2'
+
+def _output_args(sample_rate):
+    return ['-vn', '-ac', '1', '-ar', str(sample_rate), '-acodec', 'pcm_s16le', '-f', 's16le']
+
+def _header_arg(headers):
+    """En-têtes HTTP au format attendu par ffmpeg -headers"""
+    return ''.join(f'{name}: {value}\r\n' for name, value in (headers or {}).items())
+
+class PCMBuffer:
+    """Échantillons mono int16 d'une source audio, le premier situé à `start` secondes.
+
+    Les fenêtres sont des vues sur le tableau: aucune copie ni fichier temporaire par segment.
+    """
+
+    def __init__(self, samples, sample_rate=SAMPLE_RATE, start=0):
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self.start = start
+
+    @property
+    def duration(self):
+        return len(self.samples) / self.sample_rate
+
+    @property
+    def end(self):
+        return self.start + self.duration
+
+    def window(self, start_time, duration=10):
+        """Échantillons de [start_time, start_time + duration[; None si start_time est hors du tampon"""
+        first = int(round((start_time - self.start) * self.sample_rate))
+        if first < 0 or first >= len(self.samples):
+            return None
+        return self.samples[first:first + int(duration * self.sample_rate)]
+
+    def close(self):
+        """Lâche le tableau (et donc le fichier projeté, qui peut alors être supprimé sous Windows)"""
+        self.samples = np.zeros(0, dtype=SAMPLE_DTYPE)
+
+def decode_file(ffmpeg_exe, input_path, raw_path=None, sample_rate=SAMPLE_RATE, headers=None):
+    """Décode tout le fichier (ou l'URL d'un flux, avec ses en-têtes HTTP) une seule fois.
+
+    Avec raw_path, le PCM brut est écrit sur disque puis projeté en mémoire (np.memmap):
+    un set de plusieurs heures n'est jamais chargé entièrement en RAM.
+    """
+    cmd = [ffmpeg_exe, '-v', 'error']
+    if headers:
+        cmd.extend(['-headers', _header_arg(headers)])
+    cmd.extend(['-i', input_path, *_output_args(sample_rate)])
+    if raw_path is None:
+        result = subprocess.run(cmd + ['pipe:1'], check=True, capture_output=True)
+        return PCMBuffer(np.frombuffer(result.stdout, dtype=SAMPLE_DTYPE), sample_rate)
+
+    subprocess.run(cmd + ['-y', raw_path], check=True, capture_output=True)
+    if os.path.getsize(raw_path) == 0:
+        # np.memmap refuse les fichiers vides
+        return PCMBuffer(np.zeros(0, dtype=SAMPLE_DTYPE), sample_rate)
+    return PCMBuffer(np.memmap(raw_path, dtype=SAMPLE_DTYPE, mode='r'), sample_rate)
+
+def decode_stream(ffmpeg_exe, url, start_time, duration, headers=None, sample_rate=SAMPLE_RATE, timeout=120):
+    """Décode une seule fenêtre d'un flux distant (ffmpeg -ss sur l'URL: lecture par plage) en mémoire"""
+    cmd = [ffmpeg_exe, '-v', 'error', '-rw_timeout', '30000000']
+    if headers:
+        cmd.extend(['-headers', _header_arg(headers)])
+    cmd.extend(['-ss', str(start_time), '-i', url, '-t', str(duration), *_output_args(sample_rate), 'pipe:1'])
+
+    result = subprocess.run(cmd, check=True, capture_output=True, timeout=timeout)
+    if not result.stdout:
+        raise ValueError(f"Aucun échantillon à {start_time}s")
+    return PCMBuffer(np.frombuffer(result.stdout, dtype=SAMPLE_DTYPE), sample_rate, start=start_time)
+
+def to_wav(samples, sample_rate=SAMPLE_RATE):
+    """Encapsule des échantillons int16 dans un WAV en mémoire (bytes acceptés par shazam.recognize)"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(np.ascontiguousarray(samples, dtype=SAMPLE_DTYPE).tobytes())
+    return buffer.getvalue()
@@ -0,0 +1,314 @@
+import time
+import asyncio
+import threading
+from collections.abc import MutableMapping
+from state import MemoryBackend
+
+# Statuts après lesquels une entrée n'évolue plus
+TERMINAL_STATUSES = ('completed', 'error')
+
+class _AsyncWaiter:
+    """Équivalent de threading.Event pour une coroutine, réveillable depuis n'importe quel thread"""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def set(self):
+        try:
+            self.loop.call_soon_threadsafe(self.event.set)
+        except RuntimeError:
+            # Boucle déjà fermée: l'abonné n'existe plus
+            pass
+
+class ProgressBus(MutableMapping):
+    """Dictionnaire de progression qui notifie ses abonnés à chaque écriture.
+
+    S'utilise comme le dict download_progress d'origine (les workers écrivent
+    progress_dict[progress_id] = {...}); chaque entrée porte un numéro de version
+    et les abonnés bloquent jusqu'à ce qu'elle change, au lieu de la relire en boucle.
+    Seuls les abonnés de l'entrée modifiée sont réveillés.
+
+    Les entrées sont rangées dans un backend (voir state.py). Avec un backend partagé
+    entre processus, les écritures faites ailleurs sont détectées en relisant la
+    version toutes les poll_interval secondes; celles du processus courant réveillent
+    les abonnés immédiatement.
+
+    Avec publish_interval, une entrée n'est écrite dans le backend qu'au plus une fois
+    par intervalle: seule la dernière valeur reçue entre-temps est publiée. Les statuts
+    terminaux sont toujours écrits immédiatement.
+    """
+
+    def __init__(self, min_interval=0.1, backend=None, namespace='progress', poll_interval=0.25, publish_interval=0):
+        # Intervalle minimum entre deux événements envoyés à un même abonné:
+        # les mises à jour intermédiaires (hooks yt-dlp) sont fusionnées
+        self.min_interval = min_interval
+        self.backend = backend or MemoryBackend()
+        self.namespace = namespace
+        self.poll_interval = poll_interval
+        self.publish_interval = publish_interval
+        self._lock = threading.Lock()
+        self._waiters = {}
+        # Fusion côté écrivain: dernière valeur en attente et date de dernière écriture, par clé
+        self._publish_lock = threading.Lock()
+        self._pending = {}
+        self._published = {}
+
+    def _wake(self, key):
+        with self._lock:
+            waiters = self._waiters.pop(key, ())
+        for event in waiters:
+            event.set()
+
+    def _current(self, key):
+        entry = self.backend.get(self.namespace, key)
+        if entry is None:
+            return 0, None
+        return entry[0], entry[1]
+
+    def __getitem__(self, key):
+        # Le processus qui écrit relit sa dernière valeur, même pas encore publiée
+        with self._publish_lock:
+            if key in self._pending:
+                return self._pending[key]
+        entry = self.backend.get(self.namespace, key)
+        if entry is None:
+            raise KeyError(key)
+        return entry[1]
+
+    def __setitem__(self, key, value):
+        if not self.publish_interval:
+            self.backend.set(self.namespace, key, value)
+            self._wake(key)
+            return
+        with self._publish_lock:
+            now = time.monotonic()
+            if (value or {}).get('status') in TERMINAL_STATUSES:
+                # État final: publié tout de suite, la valeur en attente est périmée
+                self._pending.pop(key, None)
+                self._published.pop(key, None)
+            else:
+                delay = self._published.get(key, 0) + self.publish_interval - now
+                if delay > 0:
+                    if key not in self._pending:
+                        timer = threading.Timer(delay, self._flush, (key,))
+                        timer.daemon = True
+                        timer.start()
+                    self._pending[key] = value
+                    return
+                self._published[key] = now
+            # Écriture sous le verrou: une valeur en attente ne peut pas passer après une plus récente
+            self.backend.set(self.namespace, key, value)
+        self._wake(key)
+
+    def _flush(self, key):
+        """Publie la dernière valeur en attente de key (fin de l'intervalle de publication)"""
+        with self._publish_lock:
+            if key not in self._pending:
+                return
+            value = self._pending.pop(key)
+            self._published[key] = time.monotonic()
+            self.backend.set(self.namespace, key, value)
+        self._wake(key)
+
+    def _forget(self, key):
+        with self._publish_lock:
+            self._pending.pop(key, None)
+            self._published.pop(key, None)
+
+    def __delitem__(self, key):
+        self._forget(key)
+        if not self.backend.delete(self.namespace, key):
+            raise KeyError(key)
+        self._wake(key)
+
+    def __iter__(self):
+        return iter(self.backend.keys(self.namespace))
+
+    def __len__(self):
+        return len(self.backend.keys(self.namespace))
+
+    def claim(self, key, value):
+        """Crée l'entrée key seulement si elle n'existe pas, de façon atomique pour tous les processus.
+
+        Retourne True si value a été écrite.
+        """
+        if not self.backend.claim(self.namespace, key, value):
+            return False
+        self._wake(key)
+        return True
+
+    def discard(self, key, version):
+        """Supprime key seulement si elle n'a pas changé depuis version; retourne True si supprimée"""
+        self._forget(key)
+        if not self.backend.delete(self.namespace, key, version):
+            return False
+        self._wake(key)
+        return True
+
+    def pop(self, key, *default):
+        value = self.get(key)
+        self._forget(key)
+        if self.backend.delete(self.namespace, key):
+            self._wake(key)
+            return value
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def expire(self, ttl, stale_ttl=None):
+        """Supprime les entrées terminées depuis plus de ttl secondes.
+
+        Avec stale_ttl, les entrées sans mise à jour depuis stale_ttl secondes
+        (job interrompu) sont aussi supprimées. Retourne le nombre d'entrées supprimées.
+        """
+        now = time.time()
+        expired = 0
+        for key, value, updated in self.backend.entries(self.namespace):
+            age = now - updated
+            status = (value or {}).get('status')
+            if (status in TERMINAL_STATUSES and age > ttl) or (stale_ttl is not None and age > stale_ttl):
+                self._forget(key)
+                if self.backend.delete(self.namespace, key):
+                    expired += 1
+                self._wake(key)
+        return expired
+
+    def version(self, key):
+        return self._current(key)[0]
+
+    def entry(self, key):
+        """(version, données) de key, lues ensemble; (0, None) si elle n'existe pas"""
+        return self._current(key)
+
+    def _register(self, key, version, waiter):
+        """Inscrit waiter si l'entrée n'a pas changé; sinon retourne (version, données)"""
+        # Inscription avant la lecture: une écriture concurrente réveillera forcément waiter
+        with self._lock:
+            self._waiters.setdefault(key, set()).add(waiter)
+        current = self._current(key)
+        if current[0] != version:
+            self._unregister(key, waiter)
+            return current
+        return None
+
+    def _unregister(self, key, waiter):
+        with self._lock:
+            waiters = self._waiters.get(key)
+            if waiters:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[key]
+
+    def _wait_step(self, remaining):
+        """Durée d'une attente: tout le délai en local, poll_interval avec un backend partagé"""
+        if not self.backend.shared:
+            return remaining
+        return self.poll_interval if remaining is None else min(remaining, self.poll_interval)
+
+    def wait(self, key, version=0, timeout=None):
+        """Attend que l'entrée key dépasse version; retourne (version, données)"""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            event = threading.Event()
+            changed = self._register(key, version, event)
+            if changed is not None:
+                return changed
+            remaining = None if deadline is None else max(0, deadline - time.time())
+            event.wait(self._wait_step(remaining))
+            self._unregister(key, event)
+            current = self._current(key)
+            if current[0] != version or (deadline is not None and time.time() >= deadline):
+                return current
+
+    async def _offload(self, func, *args):
+        """Appelle func depuis une coroutine: dans le pool de threads si le backend fait des E/S (SQLite, Redis)"""
+        if not self.backend.shared:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def wait_async(self, key, version=0, timeout=None):
+        """Version coroutine de wait(): n'occupe aucun thread pendant l'attente"""
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            waiter = _AsyncWaiter()
+            changed = await self._offload(self._register, key, version, waiter)
+            if changed is not None:
+                return changed
+            remaining = None if deadline is None else max(0, deadline - time.time())
+            try:
+                await asyncio.wait_for(waiter.event.wait(), self._wait_step(remaining))
+            except asyncio.TimeoutError:
+                pass
+            self._unregister(key, waiter)
+            current = await self._offload(self._current, key)
+            if current[0] != version or (deadline is not None and time.time() >= deadline):
+                return current
+
+    def _resume(self, key, last_version):
+        """État final d'un job terminé, renvoyé d'emblée au client qui se reconnecte (sans attendre)"""
+        version, data = self._current(key)
+        if last_version and data is not None and data.get('status') in TERMINAL_STATUSES:
+            return version, data
+        return None
+
+    def subscribe(self, key, timeout=None, keepalive=15, last_version=0):
+        """Générateur des états successifs de key sous forme (version, données), jusqu'à un statut terminal.
+
+        Produit None toutes les `keepalive` secondes sans changement (pour garder
+        la connexion ouverte); s'arrête si l'entrée reste absente plus de `timeout` secondes.
+        last_version (Last-Event-ID d'un client qui se reconnecte) évite de renvoyer un état déjà reçu.
+        """
+        final = self._resume(key, last_version)
+        if final is not None:
+            yield final
+            return
+
+        version = last_version
+        missing_since = time.time()
+        while True:
+            previous = version
+            version, data = self.wait(key, version, keepalive)
+            if data is None:
+                if timeout is not None and time.time() - missing_since > timeout:
+                    return
+                yield None
+                continue
+            missing_since = time.time()
+            if version == previous:
+                # Rien de nouveau pendant keepalive secondes
+                yield None
+                continue
+
+            yield version, data
+            if data.get('status') in TERMINAL_STATUSES:
+                return
+            time.sleep(self.min_interval)
+
+    async def subscribe_async(self, key, timeout=None, keepalive=15, last_version=0):
+        """Version asynchrone de subscribe() (flux SSE du mode ASGI)"""
+        final = await self._offload(self._resume, key, last_version)
+        if final is not None:
+            yield final
+            return
+
+        version = last_version
+        missing_since = time.time()
+        while True:
+            previous = version
+            version, data = await self.wait_async(key, version, keepalive)
+            if data is None:
+                if timeout is not None and time.time() - missing_since > timeout:
+                    return
+                yield None
+                continue
+            missing_since = time.time()
+            if version == previous:
+                # Rien de nouveau pendant keepalive secondes
+                yield None
+                continue
+
+            yield version, data
+            if data.get('status') in TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(self.min_interval)
@@ -0,0 +1,41 @@
+import time
+import asyncio
+import threading
+
+class TokenBucket:
+    """Limiteur de débit à jetons: `rate` appels par seconde, rafales de `burst` appels.
+
+    Partagé entre threads et boucles asyncio (chaque !find tourne dans son propre
+    asyncio.run): les jetons sont réservés sous verrou, puis chaque appelant attend
+    son tour de son côté.
+    """
+
+    def __init__(self, rate, burst=1, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = burst
+        self._updated = clock()
+        self._blocked_until = 0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Prend un jeton; retourne le délai (secondes) à attendre avant de s'en servir"""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Jeton pris d'avance: le solde négatif fait patienter les suivants
+            self._tokens -= 1
+            delay = 0 if self._tokens >= 0 else -self._tokens / self.rate
+            return max(delay, self._blocked_until - now)
+
+    def pause(self, seconds):
+        """Suspend tous les appelants pendant `seconds` (le service distant signale une limitation)"""
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, self._clock() + seconds)
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
@@ -0,0 +1,108 @@
+import os
+import math
+import time
+import heapq
+import itertools
+import threading
+
+# Priorités (plus petit = plus prioritaire): un fichier unique passe avant une playlist
+PRIORITY_SINGLE = 0
+PRIORITY_PLAYLIST = 1
+
+class QueueFullError(Exception):
+    """Levée quand la file d'attente est pleine; retry_after est une estimation en secondes"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"File d'attente pleine, réessayez dans {retry_after}s")
+        self.retry_after = retry_after
+
+class JobScheduler:
+    """Pool de workers fixe alimenté par une file d'attente bornée et priorisée.
+
+    La position des jobs en attente est publiée dans progress_dict
+    (statut 'queued', champ 'queue_position').
+    """
+
+    def __init__(self, workers=None, max_queue=50, progress_dict=None):
+        self.workers = max(1, workers or os.cpu_count() or 2)
+        self.max_queue = max_queue
+        self.progress_dict = progress_dict
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._active = 0
+        # Publication des positions hors du verrou de la file: seul l'état le plus récent est écrit
+        self._generation = itertools.count()
+        self._published = -1
+        self._publish_lock = threading.Lock()
+        # Durée moyenne d'un job (moyenne mobile), sert à estimer Retry-After
+        self._avg_duration = 30.0
+
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'job-worker-{i}')
+            thread.daemon = True
+            thread.start()
+
+    def submit(self, job_id, func, priority=PRIORITY_SINGLE):
+        """Ajoute un job à la file; lève QueueFullError si elle est pleine"""
+        with self._cond:
+            if len(self._queue) >= self.max_queue:
+                raise QueueFullError(self.retry_after())
+            heapq.heappush(self._queue, (priority, next(self._seq), job_id, func))
+            positions = self._positions()
+            self._cond.notify()
+        self._publish_positions(*positions)
+
+    def retry_after(self):
+        """Estimation (secondes) du temps nécessaire pour écouler la file et les jobs en cours"""
+        # Les workers traitent la file par vagues de self.workers jobs
+        waves = len(self._queue) / self.workers + 1
+        return max(1, math.ceil(self._avg_duration * waves))
+
+    def stats(self):
+        with self._cond:
+            return {'queued': len(self._queue), 'active': self._active, 'workers': self.workers}
+
+    def _positions(self):
+        """Relevé (génération, [job_id par position]) de la file; à appeler sous self._cond"""
+        return next(self._generation), [job_id for _, _, job_id, _ in sorted(self._queue)]
+
+    def _publish_positions(self, generation, job_ids):
+        """Publie un relevé de la file (hors de self._cond: le backend peut être lent).
+
+        Un relevé plus ancien que le dernier publié est ignoré; un worker publie le sien
+        avant de lancer le job qu'il a retiré, qui ne peut donc pas repasser en 'queued'.
+        """
+        if self.progress_dict is None:
+            return
+        with self._publish_lock:
+            if generation < self._published:
+                return
+            self._published = generation
+            for position, job_id in enumerate(job_ids, start=1):
+                self.progress_dict[job_id] = {
+                    'percent': 0,
+                    'status': 'queued',
+                    'queue_position': position,
+                    'message': f"En attente (position {position} dans la file)"
+                }
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                _, _, job_id, func = heapq.heappop(self._queue)
+                self._active += 1
+                positions = self._positions()
+            self._publish_positions(*positions)
+
+            started = time.time()
+            try:
+                func()
+            except Exception as e:
+                print(f"[Scheduler] Erreur non gérée dans le job {job_id}: {e}")
+            finally:
+                with self._cond:
+                    self._active -= 1
+                    self._avg_duration = 0.8 * self._avg_duration + 0.2 * (time.time() - started)
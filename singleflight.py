@@ -0,0 +1,28 @@
+import asyncio
+
+class SingleFlight:
+    """Regroupe les demandes identiques simultanées (asyncio).
+
+    Le premier appelant d'une clé lance le travail; ceux qui arrivent pendant
+    qu'il tourne attendent le même résultat (ou la même exception) au lieu de le relancer.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    def running(self, key):
+        return key is not None and key in self._tasks
+
+    async def do(self, key, func):
+        """Retourne (résultat de await func(), True si le travail a été partagé); key None: pas de regroupement"""
+        if key is None:
+            return await func(), False
+
+        task = self._tasks.get(key)
+        shared = task is not None
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._tasks[key] = task
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        # shield: un appelant annulé n'interrompt pas le travail des autres
+        return await asyncio.shield(task), shared
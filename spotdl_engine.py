@@ -0,0 +1,142 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+class SpotdlUnavailable(Exception):
+    """Levée quand le moteur spotdl ne peut pas être utilisé dans ce processus"""
+
+class SpotdlTimeout(Exception):
+    """Levée quand un téléchargement spotdl dépasse le délai accordé"""
+
+class SpotdlEngine:
+    """Moteur spotdl persistant, partagé par les jobs du processus.
+
+    Le client Spotify (singleton de spotdl) est initialisé une seule fois. Les jobs
+    s'exécutent sur un pool de `workers` threads; chaque thread garde ses propres
+    Downloader spotdl, un par format de sortie (boucle asyncio, fournisseurs audio
+    créés pour ce format, gestionnaire de progression): plusieurs jobs avancent en
+    parallèle sans partager de réglages modifiables, et les clients restent chauds
+    d'un job à l'autre (les pistes d'un même job sont téléchargées en parallèle par spotdl).
+    """
+
+    def __init__(self, ffmpeg_path=None, threads=4, workers=1):
+        self.ffmpeg_path = ffmpeg_path
+        self.threads = threads
+        self.workers = max(1, workers)
+        self._spotdl = None
+        self._error = None
+        self._init_lock = threading.Lock()
+        self._local = threading.local()
+        self._executor_lock = threading.Lock()
+        self._executor = self._new_executor()
+
+    def _new_executor(self):
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='spotdl-engine')
+
+    def _settings(self, spotdl_format='mp3'):
+        settings = {'simple_tui': True, 'threads': self.threads, 'format': spotdl_format}
+        if self.ffmpeg_path and os.path.exists(self.ffmpeg_path):
+            settings['ffmpeg'] = self.ffmpeg_path
+        return settings
+
+    def _init_client(self):
+        with self._init_lock:
+            if self._spotdl is not None:
+                return self._spotdl
+            if self._error is not None:
+                raise SpotdlUnavailable(self._error)
+
+            try:
+                from spotdl import Spotdl
+                from spotdl.utils.config import SPOTIFY_OPTIONS
+            except ImportError as e:
+                self._error = f"spotdl n'est pas installé: {e}"
+                raise SpotdlUnavailable(self._error)
+
+            try:
+                self._spotdl = Spotdl(
+                    client_id=SPOTIFY_OPTIONS['client_id'],
+                    client_secret=SPOTIFY_OPTIONS['client_secret'],
+                    downloader_settings=self._settings()
+                )
+            except Exception as e:
+                # Le client Spotify de spotdl est un singleton: un échec ici est définitif pour le processus
+                self._error = f"Initialisation de spotdl impossible: {e}"
+                raise SpotdlUnavailable(self._error)
+
+            print(f"[Spotify] Moteur spotdl initialisé ({self.workers} workers)")
+            return self._spotdl
+
+    def _downloader(self, spotdl_format):
+        """Downloader spotdl du thread courant pour ce format (créé au premier job)"""
+        downloaders = getattr(self._local, 'downloaders', None)
+        if downloaders is None:
+            downloaders = self._local.downloaders = {}
+        if spotdl_format not in downloaders:
+            from spotdl.download.downloader import Downloader
+            downloaders[spotdl_format] = Downloader(self._settings(spotdl_format))
+        return downloaders[spotdl_format]
+
+    def _download(self, url, output_dir, spotdl_format, bitrate, on_progress):
+        client = self._init_client()
+        downloader = self._downloader(spotdl_format)
+        # spotdl crée ses tâches sur la boucle courante du thread
+        asyncio.set_event_loop(downloader.loop)
+
+        downloader.settings['output'] = os.path.join(output_dir, '{artists} - {title}.{output-ext}')
+        downloader.settings['bitrate'] = bitrate
+
+        def update_callback(tracker, message):
+            on_progress(tracker.song.display_name, tracker.progress, message)
+
+        downloader.progress_handler.update_callback = update_callback if on_progress else None
+        try:
+            songs = client.search([url])
+            if not songs:
+                raise Exception("Aucune piste trouvée pour cette URL Spotify")
+            results = downloader.download_multiple_songs(songs)
+        finally:
+            downloader.progress_handler.update_callback = None
+
+        return [str(path) for _, path in results if path]
+
+    def download(self, url, output_dir, spotdl_format='mp3', bitrate='320k', on_progress=None, timeout=None):
+        """Télécharge une piste, un album ou une playlist Spotify dans output_dir.
+
+        on_progress(song_name, percent, message) est appelé pour chaque piste.
+        Retourne la liste des fichiers produits. Lève SpotdlTimeout si le
+        téléchargement n'est pas terminé après timeout secondes.
+        """
+        with self._executor_lock:
+            executor = self._executor
+        future = executor.submit(self._download, url, output_dir, spotdl_format, bitrate, on_progress)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            if not future.cancel():
+                self._abandon(executor)
+            raise SpotdlTimeout(f"spotdl n'a pas terminé en {timeout} s")
+
+    def _abandon(self, executor):
+        """Remplace le pool dont un thread est bloqué dans spotdl.
+
+        Le thread ne peut pas être interrompu: il est laissé à son sort (les jobs déjà
+        en file dans l'ancien pool s'y terminent) et les jobs suivants partent sur un pool neuf.
+        """
+        with self._executor_lock:
+            if self._executor is executor:
+                print("[Spotify] Téléchargement spotdl bloqué, remplacement des workers")
+                self._executor = self._new_executor()
+        executor.shutdown(wait=False)
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine(ffmpeg_path=None, workers=1):
+    """Retourne le moteur partagé par le processus (créé au premier appel)"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = SpotdlEngine(ffmpeg_path, workers=workers)
+        return _engine
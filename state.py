@@ -0,0 +1,273 @@
+"""Backends de l'état partagé des jobs (progressions, archives en construction).
+
+Chaque backend range des valeurs JSON par (espace de noms, clé), avec un numéro
+de version et la date de dernière mise à jour. Les versions viennent d'un compteur
+commun au backend: chaque écriture en reçoit une nouvelle, jamais réutilisée même
+après la suppression de l'entrée (une version lue identifie une écriture précise).
+Avec un backend partagé (SQLite ou Redis), plusieurs processus (gunicorn -w N)
+voient les mêmes jobs: un /progress peut arriver sur n'importe quel worker.
+
+    memory                      état local au processus (défaut)
+    sqlite:///state.db          fichier SQLite partagé par les processus d'une machine
+    redis://hote:6379/0         serveur Redis (ou compatible: KeyDB, Valkey...)
+"""
+import os
+import json
+import time
+import sqlite3
+import threading
+
+class MemoryBackend:
+    """État en mémoire, limité au processus courant"""
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+        self._version = 0
+
+    def _next_version(self):
+        self._version += 1
+        return self._version
+
+    def get(self, namespace, key):
+        """Retourne (version, valeur, date de mise à jour) ou None"""
+        with self._lock:
+            return self._data.get(namespace, {}).get(key)
+
+    def set(self, namespace, key, value):
+        """Écrit value et retourne la nouvelle version de l'entrée"""
+        with self._lock:
+            version = self._next_version()
+            self._data.setdefault(namespace, {})[key] = (version, value, time.time())
+            return version
+
+    def claim(self, namespace, key, value):
+        """Écrit value seulement si l'entrée n'existe pas (atomique); retourne True si c'est le cas"""
+        with self._lock:
+            entries = self._data.setdefault(namespace, {})
+            if key in entries:
+                return False
+            entries[key] = (self._next_version(), value, time.time())
+            return True
+
+    def delete(self, namespace, key, version=None):
+        """Supprime l'entrée (seulement si elle est encore à version, si précisé).
+
+        Retourne False si elle n'existait pas ou avait changé.
+        """
+        with self._lock:
+            entries = self._data.get(namespace, {})
+            if key not in entries or (version is not None and entries[key][0] != version):
+                return False
+            del entries[key]
+            return True
+
+    def keys(self, namespace):
+        with self._lock:
+            return list(self._data.get(namespace, {}))
+
+    def entries(self, namespace):
+        """Liste de (clé, valeur, date de mise à jour)"""
+        with self._lock:
+            return [(key, value, updated) for key, (_, value, updated) in self._data.get(namespace, {}).items()]
+
+class SQLiteBackend:
+    """État dans une base SQLite (mode WAL), partagé par les processus d'une même machine"""
+    shared = True
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS state ('
+            ' namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,'
+            ' version INTEGER NOT NULL, updated REAL NOT NULL,'
+            ' PRIMARY KEY (namespace, key))'
+        )
+        # Compteur des versions (une seule ligne), repris après les versions existantes
+        conn.execute('CREATE TABLE IF NOT EXISTS state_version (id INTEGER PRIMARY KEY, version INTEGER NOT NULL)')
+        conn.execute('INSERT OR IGNORE INTO state_version (id, version) SELECT 0, COALESCE(MAX(version), 0) FROM state')
+
+    def _connect(self):
+        # Une connexion par thread, et jamais héritée d'un fork (gunicorn --preload)
+        if getattr(self._local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return self._local.conn
+
+    def get(self, namespace, key):
+        row = self._connect().execute(
+            'SELECT version, value, updated FROM state WHERE namespace = ? AND key = ?', (namespace, key)
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1]), row[2]
+
+    def _write(self, write):
+        """Exécute write(conn, version) dans une transaction, avec une nouvelle version"""
+        # Ni upsert ni RETURNING: compatible avec le SQLite fourni par les anciens Python
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('UPDATE state_version SET version = version + 1 WHERE id = 0')
+            version = conn.execute('SELECT version FROM state_version WHERE id = 0').fetchone()[0]
+            result = write(conn, version)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+    def set(self, namespace, key, value):
+        def write(conn, version):
+            params = (json.dumps(value), version, time.time(), namespace, key)
+            cursor = conn.execute('UPDATE state SET value = ?, version = ?, updated = ? WHERE namespace = ? AND key = ?', params)
+            if cursor.rowcount == 0:
+                conn.execute('INSERT INTO state (value, version, updated, namespace, key) VALUES (?, ?, ?, ?, ?)', params)
+            return version
+
+        return self._write(write)
+
+    def claim(self, namespace, key, value):
+        def write(conn, version):
+            cursor = conn.execute(
+                'INSERT OR IGNORE INTO state (namespace, key, value, version, updated) VALUES (?, ?, ?, ?, ?)',
+                (namespace, key, json.dumps(value), version, time.time())
+            )
+            return cursor.rowcount > 0
+
+        return self._write(write)
+
+    def delete(self, namespace, key, version=None):
+        if version is None:
+            cursor = self._connect().execute('DELETE FROM state WHERE namespace = ? AND key = ?', (namespace, key))
+        else:
+            cursor = self._connect().execute(
+                'DELETE FROM state WHERE namespace = ? AND key = ? AND version = ?', (namespace, key, version)
+            )
+        return cursor.rowcount > 0
+
+    def keys(self, namespace):
+        return [row[0] for row in self._connect().execute('SELECT key FROM state WHERE namespace = ?', (namespace,))]
+
+    def entries(self, namespace):
+        rows = self._connect().execute('SELECT key, value, updated FROM state WHERE namespace = ?', (namespace,))
+        return [(key, json.loads(value), updated) for key, value, updated in rows]
+
+class RedisBackend:
+    """État dans Redis: un hash par entrée (value, version, updated), un set d'index par espace
+    de noms et un compteur des versions.
+
+    client peut être tout objet compatible redis-py (par exemple fakeredis pour les tests).
+    """
+    shared = True
+
+    def __init__(self, url=None, client=None, prefix='musicdl'):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise Exception("Le module redis n'est pas installé (pip install redis).")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _name(self, namespace, key):
+        return f'{self.prefix}:{namespace}:{key}'
+
+    def _index(self, namespace):
+        return f'{self.prefix}:{namespace}'
+
+    def _next_version(self):
+        return self.client.incr(f'{self.prefix}:_version')
+
+    @staticmethod
+    def _text(value):
+        return value.decode('utf-8') if isinstance(value, bytes) else value
+
+    def _entry(self, data):
+        if not data:
+            return None
+        data = {self._text(field): self._text(value) for field, value in data.items()}
+        return int(data['version']), json.loads(data['value']), float(data['updated'])
+
+    def get(self, namespace, key):
+        return self._entry(self.client.hgetall(self._name(namespace, key)))
+
+    def set(self, namespace, key, value):
+        version = self._next_version()
+        pipe = self.client.pipeline()
+        pipe.hset(self._name(namespace, key), mapping={'value': json.dumps(value), 'updated': repr(time.time()), 'version': version})
+        pipe.sadd(self._index(namespace), key)
+        pipe.execute()
+        return version
+
+    def _transaction(self, name, check, write):
+        """Écrit via write(pipe) si check(client) est vrai et que name n'a pas changé entre-temps (WATCH)"""
+        from redis.exceptions import WatchError
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(name)
+                if not check(pipe):
+                    return False
+                pipe.multi()
+                write(pipe)
+                pipe.execute()
+                return True
+            except WatchError:
+                return False
+
+    def claim(self, namespace, key, value):
+        name = self._name(namespace, key)
+        version = self._next_version()
+
+        def write(pipe):
+            pipe.hset(name, mapping={'value': json.dumps(value), 'updated': repr(time.time()), 'version': version})
+            pipe.sadd(self._index(namespace), key)
+
+        return self._transaction(name, lambda client: not client.exists(name), write)
+
+    def delete(self, namespace, key, version=None):
+        name = self._name(namespace, key)
+        if version is None:
+            pipe = self.client.pipeline()
+            pipe.delete(name)
+            pipe.srem(self._index(namespace), key)
+            return pipe.execute()[0] > 0
+
+        def write(pipe):
+            pipe.delete(name)
+            pipe.srem(self._index(namespace), key)
+
+        return self._transaction(name, lambda client: self._text(client.hget(name, 'version')) == str(version), write)
+
+    def keys(self, namespace):
+        return [self._text(key) for key in self.client.smembers(self._index(namespace))]
+
+    def entries(self, namespace):
+        keys = self.keys(namespace)
+        pipe = self.client.pipeline()
+        for key in keys:
+            pipe.hgetall(self._name(namespace, key))
+        result = []
+        for key, data in zip(keys, pipe.execute()):
+            entry = self._entry(data)
+            if entry is not None:
+                result.append((key, entry[1], entry[2]))
+        return result
+
+def create_backend(spec=None):
+    """Backend correspondant à une configuration ('memory', 'sqlite:///...', 'redis://...')"""
+    if not spec or spec == 'memory':
+        return MemoryBackend()
+    if spec.startswith('sqlite://'):
+        # sqlite:///state.db (chemin relatif) ou sqlite:////var/lib/musicdl/state.db (absolu)
+        return SQLiteBackend(spec[len('sqlite:///'):] if spec.startswith('sqlite:///') else spec[len('sqlite://'):])
+    if spec.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(spec)
+    raise ValueError(f"Backend d'état inconnu: {spec}")
@@ -0,0 +1,252 @@
+import os
+import time
+import shutil
+import threading
+
+# Configuration par défaut (surchargée par setup() dans app.py / bot.py)
+STORAGE_FOLDER = 'downloads'
+MAX_BYTES = 20 * 1024 * 1024 * 1024  # 20 Go
+# Au-delà de HIGH_WATER * MAX_BYTES, les résultats les moins récemment utilisés
+# sont supprimés jusqu'à redescendre sous LOW_WATER * MAX_BYTES
+HIGH_WATER = 0.9
+LOW_WATER = 0.75
+# Espace toujours laissé libre sur le disque, quel que soit le quota
+MIN_FREE_BYTES = 1024 * 1024 * 1024  # 1 Go
+
+_lock = threading.Lock()
+_reservations = set()
+_last_used = {}
+_is_evictable = lambda path: True
+_stats = {'evicted_files': 0, 'evicted_bytes': 0, 'refused': 0}
+# Octets occupés dans STORAGE_FOLDER, tenus à jour sans parcourir l'arborescence:
+# ajustés à chaque publication, éviction ou suppression, recalculés par refresh()
+# (passage périodique du janitor). None: pas encore calculé.
+_used_bytes = None
+
+class StorageFullError(Exception):
+    """Levée quand l'espace nécessaire à un job ne peut pas être libéré"""
+
+    def __init__(self, needed, available):
+        super().__init__(
+            f"Espace de stockage insuffisant: {needed / (1024 * 1024):.0f} Mo nécessaires, "
+            f"{max(0, available) / (1024 * 1024):.0f} Mo disponibles. Réessayez plus tard."
+        )
+        self.needed = needed
+        self.available = available
+
+def setup(folder, max_bytes=None, high_water=None, low_water=None, min_free=None, is_evictable=None):
+    """Configure le dossier surveillé.
+
+    is_evictable(path) permet d'exclure de l'éviction certains résultats (archives en construction).
+    """
+    global STORAGE_FOLDER, MAX_BYTES, HIGH_WATER, LOW_WATER, MIN_FREE_BYTES, _is_evictable, _used_bytes
+    STORAGE_FOLDER = folder
+    _used_bytes = None
+    if max_bytes is not None:
+        MAX_BYTES = max_bytes
+    if high_water is not None:
+        HIGH_WATER = high_water
+    if low_water is not None:
+        LOW_WATER = low_water
+    if min_free is not None:
+        MIN_FREE_BYTES = min_free
+    if is_evictable is not None:
+        _is_evictable = is_evictable
+    os.makedirs(STORAGE_FOLDER, exist_ok=True)
+
+def _path_bytes(path):
+    """Taille d'un fichier ou d'un dossier (0 s'il n'existe pas encore)"""
+    try:
+        if not os.path.isdir(path):
+            return os.path.getsize(path)
+    except OSError:
+        return 0
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def _used():
+    """Octets occupés (le dossier n'est parcouru qu'au premier appel, ensuite par refresh())"""
+    global _used_bytes
+    if _used_bytes is None:
+        _used_bytes = _path_bytes(STORAGE_FOLDER)
+    return _used_bytes
+
+def _adjust_used(delta):
+    global _used_bytes
+    if _used_bytes is not None:
+        _used_bytes = max(0, _used_bytes + delta)
+
+def _pending_bytes():
+    """Part des réservations pas encore écrite sur le disque (au dernier passage de refresh())"""
+    return sum(max(0, r.nbytes - r.written) for r in _reservations)
+
+def _results():
+    """Résultats terminés (fichiers à la racine du dossier): liste de (dernier usage, taille, chemin).
+
+    Les sous-dossiers (dossiers de travail, fichiers conservés avec -no_delete) ne sont jamais évincés.
+    """
+    entries = []
+    try:
+        names = os.listdir(STORAGE_FOLDER)
+    except FileNotFoundError:
+        return entries
+    for name in names:
+        path = os.path.join(STORAGE_FOLDER, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        if os.path.isfile(path):
+            entries.append((_last_used.get(path, stat.st_mtime), stat.st_size, path))
+    return entries
+
+def added(path):
+    """Compte un fichier qui vient d'être publié dans le dossier"""
+    size = _path_bytes(path)
+    with _lock:
+        _adjust_used(size)
+
+def remove(path):
+    """Supprime un fichier du dossier et le décompte (OSError comme os.remove)"""
+    size = os.path.getsize(path)
+    os.remove(path)
+    with _lock:
+        _adjust_used(-size)
+        _last_used.pop(path, None)
+
+def mark_used(path):
+    """Signale qu'un résultat vient d'être servi (sans toucher au fichier, dont le mtime sert d'ETag)"""
+    with _lock:
+        _last_used[path] = time.time()
+
+def _evict(target_bytes, used):
+    """Supprime les résultats LRU jusqu'à ce que used <= target_bytes; retourne (fichiers, octets)"""
+    removed = 0
+    freed = 0
+    for last_used, size, path in sorted(_results()):
+        if used <= target_bytes:
+            break
+        if not _is_evictable(path):
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        _last_used.pop(path, None)
+        used -= size
+        removed += 1
+        freed += size
+    _adjust_used(-freed)
+    if removed:
+        _stats['evicted_files'] += removed
+        _stats['evicted_bytes'] += freed
+        print(f"[Storage] {removed} résultat(s) évincé(s), {freed / (1024 * 1024):.1f} Mo libérés")
+    return removed, freed
+
+def _ensure_space(nbytes):
+    """Libère la place nécessaire pour nbytes octets supplémentaires ou lève StorageFullError"""
+    pending = _pending_bytes()
+    used = _used() + pending
+    available = MAX_BYTES - used
+    try:
+        # Le disque peut aussi être rempli par autre chose que nos fichiers
+        available = min(available, shutil.disk_usage(STORAGE_FOLDER).free - pending - MIN_FREE_BYTES)
+    except OSError:
+        pass
+
+    # Ne rien supprimer si l'éviction de tous les résultats ne suffirait pas
+    if nbytes > available:
+        evictable = sum(size for _, size, path in _results() if _is_evictable(path))
+        if nbytes > available + evictable:
+            _stats['refused'] += 1
+            raise StorageFullError(nbytes, available + evictable)
+
+    if used + nbytes > HIGH_WATER * MAX_BYTES or nbytes > available:
+        target = min(LOW_WATER * MAX_BYTES, used + available) - nbytes
+        _evict(target, used)
+
+def ensure_space(nbytes=0):
+    """Vérifie (en évinçant si besoin) qu'un job de nbytes octets peut démarrer"""
+    with _lock:
+        _ensure_space(nbytes)
+
+class Reservation:
+    """Espace réservé pour un job, à libérer avec release() (ou en sortie de bloc with)"""
+
+    def __init__(self, nbytes, path=None):
+        self.nbytes = nbytes
+        self.path = path
+        # Octets de path déjà comptés dans l'espace occupé (mis à jour par refresh())
+        self.written = 0
+
+    def release(self):
+        # Le dossier de travail disparaît avec le job; un fichier (archive) reste et est compté tel quel
+        size = _path_bytes(self.path) if self.path and os.path.isfile(self.path) else 0
+        with _lock:
+            if self in _reservations:
+                _reservations.discard(self)
+                _adjust_used(size - self.written)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+def reserve(nbytes, path=None):
+    """Réserve nbytes octets pour un job; lève StorageFullError si la place ne peut pas être libérée.
+
+    path est le dossier de travail ou le fichier que le job remplit: ce qui y est
+    écrit (relevé par refresh()) est déduit de la réservation pour ne pas être compté deux fois.
+    """
+    with _lock:
+        _ensure_space(nbytes)
+        reservation = Reservation(nbytes, path)
+        _reservations.add(reservation)
+        return reservation
+
+def refresh():
+    """Recalcule l'espace occupé et l'avancement des réservations en parcourant le dossier.
+
+    Le parcours se fait hors du verrou; les écarts accumulés entre deux passages
+    (fichiers supprimés par ailleurs, fragments écrits) sont corrigés ici.
+    """
+    global _used_bytes
+    with _lock:
+        reservations = list(_reservations)
+    used = _path_bytes(STORAGE_FOLDER)
+    written = {r: _path_bytes(r.path) if r.path else 0 for r in reservations}
+    with _lock:
+        _used_bytes = used
+        for reservation, nbytes in written.items():
+            if reservation in _reservations:
+                reservation.written = nbytes
+        # Oublier les résultats supprimés par ailleurs (purge, /delete)
+        for path in [path for path in _last_used if not os.path.exists(path)]:
+            del _last_used[path]
+
+def enforce():
+    """Tâche périodique: recalcul puis éviction si le dossier dépasse le seuil haut; retourne (fichiers, octets)"""
+    refresh()
+    with _lock:
+        used = _used() + _pending_bytes()
+        if used <= HIGH_WATER * MAX_BYTES:
+            return 0, 0
+        return _evict(LOW_WATER * MAX_BYTES, used)
+
+def stats():
+    with _lock:
+        return {
+            'used_bytes': _used(),
+            'reserved_bytes': _pending_bytes(),
+            'active_reservations': len(_reservations),
+            'max_bytes': MAX_BYTES,
+            'high_water': HIGH_WATER,
+            **_stats
+        }
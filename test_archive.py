@@ -0,0 +1,66 @@
+"""Test script for playlist archives streamed while they are built"""
+import sys
+import os
+import io
+import time
+import zipfile
+import tempfile
+import threading
+sys.path.insert(0, '.')
+import downloader
+from progress import ProgressBus
+
+all_passed = True
+
+def check(name, condition, detail=''):
+    global all_passed
+    if condition:
+        print(f"[OK] {name}")
+    else:
+        print(f"[FAIL] {name} {detail}")
+        all_passed = False
+
+folder = tempfile.mkdtemp()
+archive_state = ProgressBus()
+downloader.setup(folder, 'ffmpeg_local', archive_state=archive_state)
+track = os.path.join(folder, 'track.mp3')
+with open(track, 'wb') as f:
+    f.write(os.urandom(50000))
+
+print("Testing streaming archive...\n")
+zip_path = os.path.join(folder, 'playlist.zip')
+archive = downloader.StreamingZip(zip_path)
+check("archive is in progress while it is built", downloader.archive_in_progress(zip_path)
+      and archive_state[zip_path]['status'] == 'building')
+
+def build():
+    for i in range(3):
+        time.sleep(0.1)
+        archive.add(track, f'Playlist/{i}.mp3')
+    archive.close()
+
+builder = threading.Thread(target=build)
+builder.start()
+body = b''.join(downloader.iter_growing_file(zip_path))
+builder.join()
+
+streamed = zipfile.ZipFile(io.BytesIO(body))
+check("followed download is the complete archive", body == open(zip_path, 'rb').read()
+      and streamed.namelist() == ['Playlist/0.mp3', 'Playlist/1.mp3', 'Playlist/2.mp3'], streamed.namelist())
+check("tracks are stored without recompression", all(i.compress_type == zipfile.ZIP_STORED for i in streamed.infolist())
+      and streamed.read('Playlist/1.mp3') == open(track, 'rb').read())
+check("finished archive is no longer in progress", not downloader.archive_in_progress(zip_path)
+      and archive_state[zip_path] == {'status': 'completed', 'entries': 3}, archive_state.get(zip_path))
+
+failed_path = os.path.join(folder, 'failed.zip')
+failed = downloader.StreamingZip(failed_path)
+failed.add(track, 'Playlist/0.mp3')
+failed.close(failed=True)
+check("failed archive is reported as an error", archive_state[failed_path]['status'] == 'error'
+      and downloader.archive_status(failed_path) == (True, True))
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
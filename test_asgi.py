@@ -0,0 +1,96 @@
+"""Test script for the ASGI interface (asgi.py)"""
+import sys
+import os
+import io
+import time
+import asyncio
+import zipfile
+import tempfile
+import threading
+sys.path.insert(0, '.')
+from starlette.testclient import TestClient
+import asgi
+import app as web
+import downloader
+import metrics
+
+all_passed = True
+
+def check(name, condition, detail=''):
+    global all_passed
+    if condition:
+        print(f"[OK] {name}")
+    else:
+        print(f"[FAIL] {name} {detail}")
+        all_passed = False
+
+folder = tempfile.mkdtemp()
+web.app.config['UPLOAD_FOLDER'] = folder
+track = os.path.join(folder, 'track.mp3')
+with open(track, 'wb') as f:
+    f.write(b'ID3' + bytes(range(256)) * 100)
+
+print("Testing growing archive streaming...\n")
+asgi.ARCHIVE_POLL_INTERVAL = 0.05
+zip_path = os.path.join(folder, 'playlist.zip')
+archive = downloader.StreamingZip(zip_path)
+
+def build():
+    for i in range(3):
+        time.sleep(0.2)
+        archive.add(track, f'{i}.mp3')
+    archive.close()
+
+async def follow():
+    ticks = 0
+    stop = asyncio.Event()
+
+    async def ticker():
+        nonlocal ticks
+        while not stop.is_set():
+            ticks += 1
+            await asyncio.sleep(0.01)
+
+    ticking = asyncio.create_task(ticker())
+    chunks = [chunk async for chunk in asgi.iter_growing_file(zip_path)]
+    stop.set()
+    await ticking
+    return b''.join(chunks), ticks
+
+builder = threading.Thread(target=build)
+builder.start()
+body, ticks = asyncio.run(follow())
+builder.join()
+check("archive is followed until it is closed", zipfile.ZipFile(io.BytesIO(body)).namelist() == ['0.mp3', '1.mp3', '2.mp3'])
+check("event loop keeps running while waiting for entries", ticks > 30, ticks)
+
+print("\nTesting routes...\n")
+client = TestClient(asgi.app)
+web.download_progress['asgi-test'] = {'status': 'completed', 'percent': 100}
+response = client.get('/check-progress/asgi-test')
+check("progress is read", response.status_code == 200 and response.json()['status'] == 'completed', response.text)
+check("unknown progress gives 404", client.get('/check-progress/missing').status_code == 404)
+check("stats are served", 'storage' in client.get('/stats').json())
+check("metrics are served", client.get('/metrics').status_code == 200)
+
+response = client.get('/download/track', headers={'Range': 'bytes=0-2'})
+check("range request on a finished file", response.status_code == 206 and response.content == b'ID3', response.status_code)
+
+content = open(track, 'rb').read()
+served = metrics.BYTES_SERVED.value(interface='web')
+response = client.get('/download/track?filename=Titre')
+check("whole file is sent by FileResponse", response.status_code == 200 and response.content == content
+      and response.headers.get('content-length') == str(len(content)), response.status_code)
+check("whole file keeps its ETag and download name", response.headers.get('etag', '').startswith('"')
+      and 'Titre.mp3' in response.headers.get('content-disposition', ''), response.headers)
+check("whole file is counted", metrics.BYTES_SERVED.value(interface='web') - served == len(content),
+      metrics.BYTES_SERVED.value(interface='web') - served)
+check("current ETag gives 304", client.get('/download/track', headers={'If-None-Match': response.headers['etag']}).status_code == 304)
+response = client.get('/download/track', headers={'Range': 'bytes=0-2', 'If-Range': '"stale"'})
+check("stale If-Range sends the whole file", response.status_code == 200 and response.content == content, response.status_code)
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
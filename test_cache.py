@@ -0,0 +1,78 @@
+"""Test script for the conversion cache"""
+import sys
+import os
+import time
+import tempfile
+sys.path.insert(0, '.')
+import cache
+import metrics
+
+test_cases = [
+    # (url, source_type, expected media id)
+    ("https://www.youtube.com/watch?v=ST23wVrz5_w", 'youtube', "ST23wVrz5_w"),
+    ("https://youtu.be/ST23wVrz5_w?t=42", 'youtube', "ST23wVrz5_w"),
+    ("https://www.youtube.com/shorts/ST23wVrz5_w", 'youtube', "ST23wVrz5_w"),
+    ("https://www.youtube.com/results?search_query=test", 'youtube', None),
+    ("https://soundcloud.com/Artist/Track-Name?in=foo", 'soundcloud', "artist/track-name"),
+    ("https://soundcloud.com/artist/sets/album", 'soundcloud', None),
+    ("https://open.spotify.com/intl-fr/track/4uLU6hMCjMI75M1A2tKUQC?si=x", 'spotify', "4uLU6hMCjMI75M1A2tKUQC"),
+    ("https://www.instagram.com/reel/C1abcDEF/", 'instagram', "C1abcDEF"),
+]
+
+print("Testing canonical media ids...\n")
+all_passed = True
+
+for url, source_type, expected in test_cases:
+    result = cache.canonical_media_id(url, source_type)
+    if result == expected:
+        print(f"[OK] {url} -> {result}")
+    else:
+        print(f"[FAIL] {url} -> {result} (expected {expected})")
+        all_passed = False
+
+# Les options de conversion font partie de la clé
+if cache.make_key(test_cases[0][0], 'youtube') == cache.make_key(test_cases[1][0], 'youtube') \
+        and cache.make_key(test_cases[0][0], 'youtube') != cache.make_key(test_cases[0][0], 'youtube', start_time=10):
+    print("[OK] make_key depends on media id and trim range only")
+else:
+    print("[FAIL] make_key")
+    all_passed = False
+
+print("\nTesting store / lookup / LRU eviction...\n")
+with tempfile.TemporaryDirectory() as tmp:
+    cache.setup(os.path.join(tmp, 'cache'), max_bytes=2500)
+
+    for i in range(3):
+        src = os.path.join(tmp, f'src_{i}.mp3')
+        with open(src, 'wb') as f:
+            f.write(b'x' * 1000)
+        cache.store(f'key{i}', src, f'Track {i}')
+        os.utime(os.path.join(tmp, 'cache', f'key{i}.mp3'), (time.time() - 100 + i, time.time() - 100 + i))
+    cache.evict()
+
+    dest = os.path.join(tmp, 'dest.mp3')
+    hit = cache.lookup('key2', dest)
+    if hit and hit['filename'] == 'Track 2' and os.path.getsize(dest) == 1000:
+        print("[OK] lookup returns the stored entry")
+    else:
+        print(f"[FAIL] lookup -> {hit}")
+        all_passed = False
+
+    if cache.lookup('key0', dest) is None:
+        print("[OK] least recently used entry was evicted")
+    else:
+        print("[FAIL] key0 should have been evicted")
+        all_passed = False
+
+    misses = metrics.CACHE_REQUESTS.value(result='miss')
+    if cache.lookup(None, dest) is None and metrics.CACHE_REQUESTS.value(result='miss') == misses:
+        print("[OK] lookup without a key is not counted as a miss")
+    else:
+        print("[FAIL] lookup without a key counted as a miss")
+        all_passed = False
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
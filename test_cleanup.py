@@ -0,0 +1,65 @@
+"""Test script for the periodic cleanup of results and temporary files"""
+import sys
+import os
+import time
+import tempfile
+sys.path.insert(0, '.')
+import downloader
+
+all_passed = True
+
+def check(name, condition, detail=''):
+    global all_passed
+    if condition:
+        print(f"[OK] {name}")
+    else:
+        print(f"[FAIL] {name} {detail}")
+        all_passed = False
+
+folder = tempfile.mkdtemp()
+downloader.setup(folder, 'ffmpeg_local')
+
+def write(path, age):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * 100)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+old_result = write(os.path.join(folder, 'old.mp3'), 7200)
+new_result = write(os.path.join(folder, 'new.mp3'), 10)
+old_fragment = write(os.path.join(folder, 'old.webm.part'), 7200)
+kept = write(os.path.join(downloader.kept_files_folder(), 'kept.mp3'), 7200)
+abandoned = write(os.path.join(folder, '.jobs', 'job_1', 'audio.part'), 7200)
+os.utime(os.path.dirname(abandoned), (time.time() - 7200, time.time() - 7200))
+
+print("Testing janitor sweeps...\n")
+check("kept files live outside the swept root", os.path.dirname(kept) != folder, kept)
+
+removed, freed = downloader.purge_expired_results(folder, 3600)
+check("expired results are purged", not os.path.exists(old_result) and os.path.exists(new_result), (removed, freed))
+
+removed, freed = downloader.cleanup_all_temp_files(folder, 3600)
+check("abandoned fragments and workspaces are removed",
+      not os.path.exists(old_fragment) and not os.path.exists(os.path.dirname(abandoned)), (removed, freed))
+check("files kept with -no_delete survive both sweeps", os.path.exists(kept))
+
+print("\nTesting job workspaces...\n")
+first, second = downloader.create_job_workspace('job'), downloader.create_job_workspace('job')
+check("each job gets its own directory under .jobs",
+      first != second and all(os.path.dirname(w) == os.path.join(folder, '.jobs') and os.path.isdir(w) for w in (first, second)))
+write(os.path.join(first, 'audio.webm.part'), 7200)
+os.utime(first, (time.time() - 7200, time.time() - 7200))
+write(os.path.join(second, 'audio.webm.part'), 0)
+downloader.cleanup_all_temp_files(folder, 3600)
+check("only the abandoned workspace is swept", not os.path.exists(first) and os.path.exists(second))
+downloader.remove_job_workspace(second)
+downloader.remove_job_workspace(second)
+check("removing a workspace drops its content (twice is harmless)", not os.path.exists(second))
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
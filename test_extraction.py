@@ -0,0 +1,114 @@
+"""Test script for single extraction per download (info dict reused by process_ie_result)"""
+import sys
+import os
+import types
+import zipfile
+import tempfile
+sys.path.insert(0, '.')
+import downloader
+
+all_passed = True
+
+def check(name, condition, detail=''):
+    global all_passed
+    if condition:
+        print(f"[OK] {name}")
+    else:
+        print(f"[FAIL] {name} {detail}")
+        all_passed = False
+
+FAKE_FFMPEG = f'''#!{sys.executable}
+import sys
+if '-version' in sys.argv:
+    print('ffmpeg version 9.9-fake')
+'''
+
+PLAYLIST = {'_type': 'playlist', 'title': 'Ma Playlist', 'entries': [
+    {'id': f'v{i}', 'title': f'Piste {i}', 'url': f'https://www.youtube.com/watch?v=v{i}'} for i in range(3)]}
+
+extracted = []
+processed = []
+
+class FakeYDL:
+    """YoutubeDL simulé: note les extractions et les info dicts passés à process_ie_result"""
+
+    def __init__(self, params):
+        self.params = params
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def extract_info(self, url, download=False):
+        extracted.append(url)
+        if 'list=' in url:
+            return PLAYLIST
+        return {'id': url.rsplit('=', 1)[-1], 'title': f'Titre {len(extracted)}', 'webpage_url': url, 'duration': 60}
+
+    def process_ie_result(self, info, download=True):
+        processed.append(info)
+        # Le fichier final suit outtmpl, comme après l'extraction audio de yt-dlp
+        with open(self.params['outtmpl'].replace('%(ext)s', 'mp3'), 'wb') as f:
+            f.write(info['webpage_url'].encode())
+        return info
+
+    def download(self, urls):
+        raise AssertionError("download() refait l'extraction")
+
+    def add_progress_hook(self, hook):
+        pass
+
+    def add_postprocessor_hook(self, hook):
+        pass
+
+if os.name == 'nt':
+    print("[SKIP] fake FFmpeg script needs a POSIX shebang")
+    sys.exit(0)
+
+ffmpeg_folder = tempfile.mkdtemp()
+for name in ('ffmpeg', 'ffprobe'):
+    path = os.path.join(ffmpeg_folder, name)
+    with open(path, 'w') as f:
+        f.write(FAKE_FFMPEG)
+    os.chmod(path, 0o755)
+
+folder = tempfile.mkdtemp()
+downloader.setup(folder, ffmpeg_folder)
+downloader.PIPELINED_DOWNLOADS = False
+downloader.yt_dlp = types.SimpleNamespace(YoutubeDL=FakeYDL)
+
+print("Testing single extraction per track...\n")
+for source, download_func, url in [
+        ('youtube', downloader.download_youtube, 'https://www.youtube.com/watch?v=abc'),
+        ('soundcloud', downloader.download_soundcloud, 'https://soundcloud.com/artiste/son?v=def'),
+        ('instagram', downloader.download_instagram, 'https://www.instagram.com/reel/x?v=ghi')]:
+    extracted.clear()
+    processed.clear()
+    output_path = os.path.join(folder, f'{source}.mp3')
+    final_path, final_filename = download_func(url, output_path)
+    check(f"{source}: URL is extracted once", extracted == [url], extracted)
+    check(f"{source}: extracted info dict is downloaded as is",
+          len(processed) == 1 and processed[0]['webpage_url'] == url, processed)
+    check(f"{source}: file is published", final_path == output_path and open(final_path, 'rb').read() == url.encode())
+
+print("\nTesting playlist title...\n")
+extracted.clear()
+check("title comes from the given info dict", downloader.get_playlist_title('https://www.youtube.com/playlist?list=PL1', 'youtube', PLAYLIST) == 'Ma Playlist')
+check("given info dict avoids an extraction", extracted == [], extracted)
+check("title is extracted without info dict", downloader.get_playlist_title('https://www.youtube.com/playlist?list=PL1', 'youtube') == 'Ma Playlist'
+      and extracted == ['https://www.youtube.com/playlist?list=PL1'], extracted)
+
+print("\nTesting playlist enumeration...\n")
+extracted.clear()
+zip_path, _ = downloader.process_playlist('https://www.youtube.com/playlist?list=PL1', 'youtube')
+check("playlist is enumerated once and each track extracted once",
+      sorted(extracted) == sorted(['https://www.youtube.com/playlist?list=PL1'] + [e['url'] for e in PLAYLIST['entries']]), extracted)
+check("archive holds every track", len(zipfile.ZipFile(zip_path).namelist()) == 3, zipfile.ZipFile(zip_path).namelist())
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
@@ -0,0 +1,106 @@
+"""Test script for FFmpeg detection, capability probing and output format selection"""
+import sys
+import os
+import tempfile
+import threading
+sys.path.insert(0, '.')
+import downloader
+
+all_passed = True
+
+def check(name, condition, detail=''):
+    global all_passed
+    if condition:
+        print(f"[OK] {name}")
+    else:
+        print(f"[FAIL] {name} {detail}")
+        all_passed = False
+
+# Faux FFmpeg: note chaque appel et répond aux sondes -version / -encoders
+FAKE_FFMPEG = f'''#!{sys.executable}
+import os, sys
+with open(os.environ['FAKE_FFMPEG_LOG'], 'a') as log:
+    log.write(' '.join(sys.argv[1:]) + '\\n')
+if '-version' in sys.argv:
+    print('ffmpeg version 9.9-fake Copyright (c) the FFmpeg developers')
+    print('configuration: --enable-libmp3lame')
+elif '-encoders' in sys.argv:
+    print('Encoders:')
+    print(' A..... = Audio')
+    print(' ------')
+    print(' A..... aac                  AAC (Advanced Audio Coding)')
+    print(' A..... libmp3lame           libmp3lame MP3 (MPEG audio layer 3)')
+'''
+
+def probes():
+    if not os.path.exists(log_path):
+        return 0
+    with open(log_path) as f:
+        return sum(1 for _ in f)
+
+if os.name == 'nt':
+    print("[SKIP] fake FFmpeg script needs a POSIX shebang")
+    sys.exit(0)
+
+folder = tempfile.mkdtemp()
+for name in ('ffmpeg', 'ffprobe'):
+    path = os.path.join(folder, name)
+    with open(path, 'w') as f:
+        f.write(FAKE_FFMPEG)
+    os.chmod(path, 0o755)
+log_path = os.path.join(folder, 'calls.log')
+os.environ['FAKE_FFMPEG_LOG'] = log_path
+downloader.setup(tempfile.mkdtemp(), folder)
+
+print("Testing FFmpeg probing...\n")
+info = downloader.get_ffmpeg_info()
+check("local FFmpeg is found", info['ffmpeg'] == os.path.join(os.path.abspath(folder), 'ffmpeg'), info['ffmpeg'])
+check("version and encoders are parsed", info['version'] == '9.9-fake' and info['encoders'] == {'aac', 'libmp3lame'} and info['threads'],
+      (info['version'], info['encoders']))
+check("FFmpeg is probed once (-version, -encoders)", probes() == 2, probes())
+
+threads = [threading.Thread(target=downloader.get_ffmpeg_info) for _ in range(8)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+check("later and concurrent calls reuse the probe",
+      probes() == 2 and downloader.has_encoder('libmp3lame') and not downloader.has_encoder('libopus')
+      and downloader.ensure_ffmpeg() == os.path.abspath(folder), probes())
+
+downloader.refresh_ffmpeg()
+check("refresh_ffmpeg probes again", probes() == 4, probes())
+
+downloader.setup(tempfile.mkdtemp(), folder)
+downloader.get_ffmpeg_info()
+check("setup() forgets the previous detection", probes() == 6, probes())
+
+print("\nTesting output formats...\n")
+encode = downloader._pipeline_encoder_args
+check("m4a from an AAC stream is a stream copy", encode('mp4a.40.2', 'm4a') == (['-c:a', 'copy'], 'm4a'), encode('mp4a.40.2', 'm4a'))
+check("m4a from another codec is encoded to AAC", encode('opus', 'm4a') == (['-c:a', 'aac', '-b:a', '256k'], 'm4a'), encode('opus', 'm4a'))
+check("opus from an Opus stream is a stream copy", encode('opus', 'opus') == (['-c:a', 'copy'], 'opus'), encode('opus', 'opus'))
+check("opus without libopus is not piped", encode('mp4a.40.2', 'opus') is None, encode('mp4a.40.2', 'opus'))
+check("original keeps the source codec", encode('vorbis', 'original') == (['-c:a', 'copy'], 'ogg') and encode('flac', 'original') is None)
+check("mp3 is encoded with libmp3lame", encode('opus', 'mp3') == (['-c:a', 'libmp3lame', '-b:a', '320k'], 'mp3'), encode('opus', 'mp3'))
+
+check("each format asks yt-dlp for its codec",
+      [downloader._audio_postprocessor(f)['preferredcodec'] for f in ('mp3', 'm4a', 'opus', 'original')] == ['mp3', 'm4a', 'opus', 'best'])
+try:
+    downloader._audio_postprocessor('wma')
+    rejected = False
+except Exception:
+    rejected = True
+check("unknown output format is rejected", rejected)
+
+workdir = tempfile.mkdtemp()
+for name in ('track.opus', 'track.webm.part'):
+    open(os.path.join(workdir, name), 'wb').close()
+check("original output is found whatever its extension",
+      downloader._find_output_file(os.path.join(workdir, 'track'), 'original') == os.path.join(workdir, 'track.opus'))
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
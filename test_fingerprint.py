@@ -0,0 +1,76 @@
+"""Test script for the local audio-fingerprint index"""
+import sys
+import os
+import tempfile
+import numpy as np
+sys.path.insert(0, '.')
+import fingerprint
+
+all_passed = True
+
+def check(name, condition, detail=''):
+    global all_passed
+    if condition:
+        print(f"[OK] {name}")
+    else:
+        print(f"[FAIL] {name} {detail}")
+        all_passed = False
+
+rate = 16000
+notes = [110, 147, 165, 196, 220, 262, 294, 330, 392, 440, 523, 587, 659, 784, 880]
+
+def fake_song(seconds, seed):
+    """Accords aléatoires de 250 ms avec une attaque percussive"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(rate // 4) / rate
+    parts = []
+    for _ in range(int(seconds * 4)):
+        chord = rng.choice(notes, 3)
+        hit = rng.normal(0, 0.3, len(t)) * np.exp(-t * 40)
+        parts.append(sum(np.sin(2 * np.pi * f * t) * 0.2 + np.sin(2 * np.pi * 2 * f * t) * 0.1 for f in chord) + hit)
+    return (np.concatenate(parts) * 12000).clip(-32768, 32767).astype('<i2')
+
+def degrade(samples, seed=0):
+    """Autre décodage du même média: léger bruit de quantification"""
+    noise = np.random.default_rng(seed).normal(0, 300, len(samples))
+    return (samples + noise).clip(-32768, 32767).astype('<i2')
+
+fingerprint.setup(os.path.join(tempfile.mkdtemp(), 'fingerprints.db'))
+song, other = fake_song(60, 1), fake_song(60, 2)
+window = song[30 * rate:40 * rate]
+
+hashes = fingerprint.compute(window)
+check("a window produces hashes", len(hashes) > 100, len(hashes))
+check("silence produces no hashes", fingerprint.compute(np.zeros(10 * rate, dtype='<i2')) == [])
+check("empty index has no match", fingerprint.lookup(hashes) is None)
+
+fingerprint.add(hashes, 'Song', 'Artist', {'links': {'youtube': 'https://youtube.com/watch?v=x'}, 'cover_art': None})
+match = fingerprint.lookup(fingerprint.compute(window))
+check("indexed window is found with its data",
+      match and (match['title'], match['artist'], match['links']['youtube']) == ('Song', 'Artist', 'https://youtube.com/watch?v=x'), match)
+
+shifted = degrade(song[30 * rate + 57:40 * rate + 57])
+match = fingerprint.lookup(fingerprint.compute(shifted))
+check("shifted and re-decoded window still matches", match and match['title'] == 'Song', match)
+
+overlapping = song[34 * rate:44 * rate]
+match = fingerprint.lookup(fingerprint.compute(overlapping))
+check("partially overlapping window matches", match and match['title'] == 'Song', match)
+
+check("another part of the track does not match", fingerprint.lookup(fingerprint.compute(song[5 * rate:15 * rate])) is None)
+check("another track does not match", fingerprint.lookup(fingerprint.compute(other[30 * rate:40 * rate])) is None)
+
+fingerprint.add(fingerprint.compute(song[45 * rate:55 * rate]), 'Song', 'Artist', {'links': {}})
+stats = fingerprint.stats()
+check("same track is stored once", stats['tracks'] == 1 and stats['hashes'] > len(hashes), stats)
+match = fingerprint.lookup(fingerprint.compute(window))
+check("data of a track indexed again is updated", match and match['links'] == {} and 'cover_art' not in match, match)
+
+fingerprint.setup(None)
+check("disabled index never matches", fingerprint.lookup(hashes) is None)
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
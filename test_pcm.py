@@ -0,0 +1,83 @@
+"""Test script for in-memory PCM segment extraction"""
+import sys
+import io
+import os
+import wave
+import shutil
+import tempfile
+import numpy as np
+sys.path.insert(0, '.')
+import pcm
+
+all_passed = True
+
+def check(name, condition, detail=''):
+    global all_passed
+    if condition:
+        print(f"[OK] {name}")
+    else:
+        print(f"[FAIL] {name} {detail}")
+        all_passed = False
+
+rate = pcm.SAMPLE_RATE
+samples = (np.arange(rate * 60) % 1000).astype(pcm.SAMPLE_DTYPE)
+buffer = pcm.PCMBuffer(samples)
+
+print("Testing windows...\n")
+window = buffer.window(30, duration=10)
+check("window has the requested length", len(window) == 10 * rate, len(window))
+check("window starts at the timecode", window[0] == samples[30 * rate])
+check("window is a view, not a copy", np.shares_memory(window, samples))
+check("last window is truncated at the end", len(buffer.window(55, duration=10)) == 5 * rate)
+check("timecode past the end gives None", buffer.window(60) is None and buffer.window(-1) is None)
+
+partial = pcm.PCMBuffer(samples[:10 * rate], start=120)
+check("offset buffers use absolute timecodes",
+      partial.window(120, 5) is not None and partial.window(100) is None and partial.end == 130)
+
+print("\nTesting WAV encoding...\n")
+data = pcm.to_wav(window)
+with wave.open(io.BytesIO(data)) as wav:
+    decoded = np.frombuffer(wav.readframes(wav.getnframes()), dtype=pcm.SAMPLE_DTYPE)
+    check("WAV is mono 16 kHz 16 bits", (wav.getnchannels(), wav.getframerate(), wav.getsampwidth()) == (1, rate, 2))
+check("WAV round-trips the samples", np.array_equal(decoded, window))
+
+try:
+    import asyncio
+    from shazamio_core import Recognizer
+    tone = (np.sin(2 * np.pi * 440 * np.arange(rate * 10) / rate) * 8000
+            + np.random.default_rng(0).normal(0, 2000, rate * 10)).astype(pcm.SAMPLE_DTYPE)
+
+    async def sign():
+        return await Recognizer().recognize_bytes(value=pcm.to_wav(tone), options=None)
+    signature = asyncio.run(sign())
+    check("Shazam signature is computed from WAV bytes", signature is not None)
+except ImportError:
+    print("[SKIP] shazamio n'est pas installé")
+
+print("\nTesting decoding...\n")
+ffmpeg = shutil.which('ffmpeg')
+if ffmpeg is None:
+    print("[SKIP] ffmpeg introuvable")
+else:
+    workdir = tempfile.mkdtemp()
+    source = os.path.join(workdir, 'tone.wav')
+    with open(source, 'wb') as f:
+        f.write(pcm.to_wav(samples))
+    in_memory = pcm.decode_file(ffmpeg, source)
+    mapped = pcm.decode_file(ffmpeg, source, raw_path=os.path.join(workdir, 'audio.pcm'))
+    check("decode_file returns the whole track", abs(in_memory.duration - 60) < 0.1, in_memory.duration)
+    check("raw_path is memory-mapped", isinstance(mapped.samples, np.memmap) and abs(mapped.duration - 60) < 0.1)
+    mapped.close()
+    shutil.rmtree(workdir)
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
+
+# Le runtime natif de shazamio_core peut interrompre (SIGABRT) la finalisation de
+# l'interpréteur une fois les tests terminés: sortie immédiate avec le résultat des tests
+sys.stdout.flush()
+os._exit(0 if all_passed else 1)
@@ -0,0 +1,168 @@
+"""Test script for the pipelined download (remote stream piped to FFmpeg)"""
+import sys
+import os
+import json
+import re
+import tempfile
+import threading
+import http.server
+import http.cookiejar
+sys.path.insert(0, '.')
+from yt_dlp.cookies import YoutubeDLCookieJar
+import downloader
+
+all_passed = True
+
+def check(name, condition, detail=''):
+    global all_passed
+    if condition:
+        print(f"[OK] {name}")
+    else:
+        print(f"[FAIL] {name} {detail}")
+        all_passed = False
+
+# Faux FFmpeg: note ses arguments, recopie son entrée standard dans le fichier de sortie
+# ou échoue selon FAKE_FFMPEG_FAIL
+FAKE_FFMPEG = f'''#!{sys.executable}
+import os, sys, json
+args = sys.argv[1:]
+if '-version' in args:
+    print('ffmpeg version 9.9-fake')
+elif '-encoders' in args:
+    print(' A..... libmp3lame           libmp3lame MP3 (MPEG audio layer 3)')
+else:
+    with open(os.environ['FAKE_FFMPEG_LOG'], 'a') as log:
+        log.write(json.dumps(args) + '\\n')
+    if os.environ.get('FAKE_FFMPEG_FAIL'):
+        sys.stderr.write('Invalid data found when processing input')
+        sys.exit(1)
+    data = sys.stdin.buffer.read() if args[args.index('-i') + 1] == 'pipe:0' else b''
+    with open(args[-1], 'wb') as f:
+        f.write(data)
+    print('out_time_us=5000000')
+    print('progress=end')
+'''
+
+# Média servi localement, avec les plages HTTP utilisées par http_chunk_size
+MEDIA = os.urandom(300000)
+requests_seen = []
+
+class MediaHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        requests_seen.append((self.headers.get('Range'), self.headers.get('Cookie'), self.headers.get('Referer')))
+        start, end = 0, len(MEDIA) - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range') or '')
+        if match:
+            start = int(match.group(1))
+            end = min(end, int(match.group(2) or end))
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(MEDIA)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+        self.wfile.write(MEDIA[start:end + 1])
+
+    def log_message(self, *args):
+        pass
+
+def fake_ffmpeg_folder():
+    folder = tempfile.mkdtemp()
+    for name in ('ffmpeg', 'ffprobe'):
+        path = os.path.join(folder, name)
+        with open(path, 'w') as f:
+            f.write(FAKE_FFMPEG)
+        os.chmod(path, 0o755)
+    return folder
+
+class FakeYDL:
+    """YoutubeDL réduit à ce qu'utilise _download_with_info (téléchargement classique simulé)"""
+
+    def __init__(self, cookiejar):
+        self.cookiejar = cookiejar
+        self.downloaded = []
+
+    def add_progress_hook(self, hook):
+        pass
+
+    def add_postprocessor_hook(self, hook):
+        pass
+
+    def process_ie_result(self, info, download=True):
+        self.downloaded.append(info['url'])
+        with open(self.base_path + '.mp3', 'wb') as f:
+            f.write(b'classic')
+
+def calls():
+    if not os.path.exists(log_path):
+        return []
+    with open(log_path) as f:
+        return [json.loads(line) for line in f]
+
+if os.name == 'nt':
+    print("[SKIP] fake FFmpeg script needs a POSIX shebang")
+    sys.exit(0)
+
+server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), MediaHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+media_url = f'http://127.0.0.1:{server.server_port}/videoplayback'
+
+workdir = tempfile.mkdtemp()
+log_path = os.path.join(workdir, 'ffmpeg.log')
+os.environ['FAKE_FFMPEG_LOG'] = log_path
+downloader.setup(workdir, fake_ffmpeg_folder(), pipelined=True)
+
+jar = YoutubeDLCookieJar()
+jar.set_cookie(http.cookiejar.Cookie(
+    0, 'SID', 'secret', None, False, '127.0.0.1', False, False, '/', True, False, None, False, None, None, {}))
+ydl = FakeYDL(jar)
+# Forme d'un format audio YouTube: http_chunk_size dans downloader_options
+audio_format = {
+    'format_id': '251', 'url': media_url, 'protocol': 'http', 'ext': 'webm', 'acodec': 'opus', 'vcodec': 'none',
+    'http_headers': {'User-Agent': 'UA', 'Referer': 'https://www.youtube.com/'},
+    'downloader_options': {'http_chunk_size': 100000},
+}
+info = {
+    'id': 'abc', 'title': 'Titre', 'extractor': 'youtube', 'extractor_key': 'Youtube', 'duration': 10,
+    'formats': [audio_format], **audio_format,
+}
+
+print("Testing pipelined download...\n")
+ydl.base_path = os.path.join(workdir, 'piped')
+progress = {}
+path = downloader._download_with_info(ydl, dict(info), ydl.base_path, 'mp3', 'p1', progress)
+args = calls()[-1] if calls() else []
+check("stream is encoded by FFmpeg from yt-dlp's output", path == ydl.base_path + '.mp3' and not ydl.downloaded
+      and args[args.index('-i') + 1] == 'pipe:0' and open(path, 'rb').read() == MEDIA, (path, args))
+ranges = [re.match(r'bytes=(\d+)-(\d+)', r[0] or '') for r in requests_seen]
+check("YouTube chunked download is kept (http_chunk_size ranges)", len(ranges) > 2 and all(ranges)
+      and all(int(r.group(2)) - int(r.group(1)) < 100000 for r in ranges), requests_seen)
+check("cookies and format headers reach the media server",
+      all(r[1] == 'SID=secret' and r[2] == 'https://www.youtube.com/' for r in requests_seen), requests_seen)
+check("progress comes from FFmpeg", progress.get('p1', {}).get('percent') == 100, progress)
+check("no intermediate file is left", sorted(os.listdir(workdir)) == ['ffmpeg.log', 'piped.mp3'], os.listdir(workdir))
+
+print("\nTesting fallbacks...\n")
+ydl.base_path = os.path.join(workdir, 'merged')
+before = len(calls())
+path = downloader._download_with_info(ydl, {**info, 'requested_formats': [audio_format, audio_format]}, ydl.base_path, 'mp3')
+check("formats to merge are not piped", len(calls()) == before and open(path, 'rb').read() == b'classic', calls()[before:])
+
+os.environ['FAKE_FFMPEG_FAIL'] = '1'
+ydl.base_path = os.path.join(workdir, 'failed')
+before = len(calls())
+path = downloader._download_with_info(ydl, dict(info), ydl.base_path, 'mp3')
+del os.environ['FAKE_FFMPEG_FAIL']
+check("FFmpeg failure falls back to the classic download", len(calls()) == before + 1 and open(path, 'rb').read() == b'classic', path)
+
+ydl.base_path = os.path.join(workdir, 'missing')
+missing_format = {**audio_format, 'url': media_url.replace(str(server.server_port), '1')}
+path = downloader._download_with_info(ydl, {**info, **missing_format, 'formats': [missing_format]}, ydl.base_path, 'mp3')
+check("download failure falls back to the classic download", open(path, 'rb').read() == b'classic'
+      and not os.path.exists(ydl.base_path + '.info.json'), path)
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
@@ -0,0 +1,102 @@
+"""Test script for concurrent playlist downloads (process_playlist, PlaylistProgress)"""
+import sys
+import os
+import time
+import types
+import zipfile
+import tempfile
+import threading
+sys.path.insert(0, '.')
+import downloader
+
+all_passed = True
+
+def check(name, condition, detail=''):
+    global all_passed
+    if condition:
+        print(f"[OK] {name}")
+    else:
+        print(f"[FAIL] {name} {detail}")
+        all_passed = False
+
+print("Testing aggregated progress...\n")
+published = {}
+tracker = downloader.PlaylistProgress(4, 'pl', published)
+tracker['000'] = {'percent': 50}
+tracker['001'] = {'percent': 80, 'status': 'converting'}
+check("percent averages tracks over the playlist", published['pl']['percent'] == 37.5, published['pl'])
+tracker.finish('000', True)
+tracker.finish('002', False)
+check("finished and failed tracks count as done", published['pl']['percent'] == 75
+      and (published['pl']['completed_tracks'], published['pl']['failed_tracks']) == (1, 1), published['pl'])
+check("only running tracks are listed as active", [t['track'] for t in published['pl']['active_tracks']] == [2], published['pl'])
+
+print("\nTesting process_playlist...\n")
+WORKERS = 3
+ENTRIES = [{'id': f'v{i}', 'title': f'Piste {i}', 'url': f'https://www.youtube.com/watch?v=v{i}'} for i in range(8)]
+
+class FakeYDL:
+    """Énumération à plat de la playlist (extract_flat), sans réseau"""
+
+    def __init__(self, params):
+        self.params = params
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def extract_info(self, url, download=False):
+        return {'_type': 'playlist', 'title': 'Ma Playlist', 'entries': ENTRIES}
+
+running = 0
+peak = 0
+lock = threading.Lock()
+samples = []
+
+def fake_download(url, output_path, custom_filename, progress_id, progress_dict, audio_format):
+    global running, peak
+    with lock:
+        running += 1
+        peak = max(peak, running)
+    try:
+        for percent in (25, 75):
+            with lock:
+                progress_dict[progress_id] = {'percent': percent, 'status': 'downloading'}
+                samples.append(dict(progress['pl']))
+            time.sleep(0.05)
+        if url.endswith('v5'):
+            raise Exception("Vidéo indisponible")
+        with open(output_path, 'wb') as f:
+            f.write(url.encode())
+        return output_path, os.path.basename(output_path)
+    finally:
+        with lock:
+            running -= 1
+
+folder = tempfile.mkdtemp()
+downloader.setup(folder, 'ffmpeg_local', playlist_workers=WORKERS)
+downloader.yt_dlp = types.SimpleNamespace(YoutubeDL=FakeYDL)
+downloader.download_youtube = fake_download
+progress = {}
+zip_path, zip_filename = downloader.process_playlist('https://www.youtube.com/playlist?list=PL1', 'youtube', 'pl', progress)
+
+check("tracks are downloaded concurrently within the worker limit", peak == WORKERS, peak)
+names = zipfile.ZipFile(zip_path).namelist()
+check("a failing track does not abort the archive",
+      sorted(names) == [f'Ma Playlist/{i:03d}_Piste {i}.mp3' for i in range(8) if i != 5], names)
+check("track numbering and content are kept",
+      zipfile.ZipFile(zip_path).read('Ma Playlist/002_Piste 2.mp3') == ENTRIES[2]['url'].encode())
+percents = [sample['percent'] for sample in samples]
+check("aggregated percent only grows", percents == sorted(percents) and 0 < percents[-1] < 100, percents)
+final = progress['pl']
+check("last progress counts completed and failed tracks",
+      (final['completed_tracks'], final['failed_tracks'], final['total_tracks']) == (7, 1, 8) and final['percent'] == 100, final)
+check("playlist workspace is removed", os.listdir(os.path.join(folder, '.jobs')) == [], os.listdir(os.path.join(folder, '.jobs')))
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
@@ -0,0 +1,116 @@
+"""Test script for the progress bus"""
+import sys
+import time
+import itertools
+import threading
+sys.path.insert(0, '.')
+from progress import ProgressBus
+from state import MemoryBackend
+
+all_passed = True
+bus = ProgressBus(min_interval=0.05)
+received = []
+
+def watch():
+    for event in bus.subscribe('job', timeout=2, keepalive=1):
+        if event is not None:
+            received.append(event[1])
+
+watcher = threading.Thread(target=watch)
+watcher.start()
+time.sleep(0.1)
+
+# Rafale de mises à jour: l'abonné ne doit pas toutes les recevoir
+for percent in range(100):
+    bus['job'] = {'percent': percent, 'status': 'downloading'}
+time.sleep(0.1)
+bus['job'] = {'percent': 100, 'status': 'completed'}
+watcher.join(2)
+
+if not watcher.is_alive() and received and received[-1]['status'] == 'completed':
+    print(f"[OK] subscriber stopped on completion ({len(received)} events)")
+else:
+    print(f"[FAIL] subscriber did not finish: {received[-1:] if received else received}")
+    all_passed = False
+
+if len(received) < 50:
+    print("[OK] burst of updates was coalesced")
+else:
+    print(f"[FAIL] {len(received)} events for a burst of 100 updates")
+    all_passed = False
+
+started = time.time()
+events = list(bus.subscribe('unknown', timeout=0.3, keepalive=0.1))
+if time.time() - started < 1 and all(data is None for data in events):
+    print("[OK] missing entry times out with keepalives only")
+else:
+    print(f"[FAIL] missing entry: {events}")
+    all_passed = False
+
+version = bus.version('job')
+bus.pop('job')
+if bus.wait('job', version, timeout=0.1) == (0, None):
+    print("[OK] removing an entry wakes waiters")
+else:
+    print("[FAIL] pop did not notify")
+    all_passed = False
+
+bus['finished'] = {'percent': 100, 'status': 'completed'}
+bus['running'] = {'percent': 10, 'status': 'downloading'}
+time.sleep(0.05)
+if bus.expire(0.01) == 1 and list(bus) == ['running'] and bus.expire(0.01, stale_ttl=0.01) == 1:
+    print("[OK] expire drops finished entries, then stale ones")
+else:
+    print(f"[FAIL] expire left {list(bus)}")
+    all_passed = False
+
+# Reconnexion avec Last-Event-ID: pas de renvoi de l'état déjà reçu, sauf l'état final
+bus['resumed'] = {'percent': 40, 'status': 'downloading'}
+seen = bus.version('resumed')
+events = list(itertools.islice(bus.subscribe('resumed', keepalive=0.1, last_version=seen), 2))
+bus['resumed'] = {'percent': 100, 'status': 'completed'}
+final = list(bus.subscribe('resumed', keepalive=0.1, last_version=bus.version('resumed')))
+if all(event is None for event in events) and [event[1]['status'] for event in final] == ['completed']:
+    print("[OK] resumed subscription skips known states and replays the final one")
+else:
+    print(f"[FAIL] resume: {events} / {final}")
+    all_passed = False
+
+# Fusion côté écrivain: le backend ne reçoit pas chaque mise à jour des hooks
+class CountingBackend(MemoryBackend):
+    writes = 0
+
+    def set(self, namespace, key, value):
+        CountingBackend.writes += 1
+        return super().set(namespace, key, value)
+
+coalesced = ProgressBus(backend=CountingBackend(), publish_interval=0.2)
+for percent in range(100):
+    coalesced['job'] = {'percent': percent, 'status': 'downloading'}
+if CountingBackend.writes == 1 and coalesced['job']['percent'] == 99:
+    print("[OK] burst of updates is held back by the publisher (latest value still readable)")
+else:
+    print(f"[FAIL] {CountingBackend.writes} backend writes for a burst of 100 updates")
+    all_passed = False
+
+version, data = coalesced.wait('job', coalesced.version('job'), timeout=1)
+if data and data['percent'] == 99 and CountingBackend.writes == 2:
+    print("[OK] latest pending value is flushed after the interval")
+else:
+    print(f"[FAIL] flushed {data} after {CountingBackend.writes} writes")
+    all_passed = False
+
+coalesced['job'] = {'percent': 100, 'status': 'downloading'}
+coalesced['job'] = {'percent': 100, 'status': 'completed'}
+time.sleep(0.3)
+if coalesced.backend.get('progress', 'job')[1]['status'] == 'completed' and CountingBackend.writes == 3:
+    print("[OK] terminal status is written immediately and not overwritten by a pending update")
+else:
+    print(f"[FAIL] backend holds {coalesced.backend.get('progress', 'job')} after {CountingBackend.writes} writes")
+    all_passed = False
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
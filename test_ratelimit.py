@@ -0,0 +1,51 @@
+"""Test script for the token-bucket rate limiter"""
+import sys
+import time
+import asyncio
+sys.path.insert(0, '.')
+from ratelimit import TokenBucket
+
+all_passed = True
+
+def check(name, condition, detail=''):
+    global all_passed
+    if condition:
+        print(f"[OK] {name}")
+    else:
+        print(f"[FAIL] {name} {detail}")
+        all_passed = False
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+clock = FakeClock()
+bucket = TokenBucket(rate=2, burst=3, clock=clock)
+
+delays = [bucket.reserve() for _ in range(5)]
+check("burst is served immediately", delays[:3] == [0, 0, 0], delays)
+check("later calls are spaced by 1/rate", delays[3:] == [0.5, 1.0], delays)
+
+clock.now += 10
+check("tokens refill up to burst", [bucket.reserve() for _ in range(3)] == [0, 0, 0])
+
+bucket.pause(5)
+check("pause delays every caller", bucket.reserve() >= 5)
+
+async def main():
+    limiter = TokenBucket(rate=20, burst=2)
+    start = time.monotonic()
+    await asyncio.gather(*(limiter.acquire() for _ in range(6)))
+    return time.monotonic() - start
+
+elapsed = asyncio.run(main())
+check("acquire waits for the rate limit", 0.15 <= elapsed < 1, elapsed)
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
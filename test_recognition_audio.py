@@ -0,0 +1,134 @@
+"""Test script for the recognition windows (RecognitionAudio) on a generated sine file"""
+import sys
+import os
+import json
+import shutil
+import tempfile
+import threading
+import http.server
+import numpy as np
+sys.path.insert(0, '.')
+import pcm
+import downloader
+
+all_passed = True
+
+def check(name, condition, detail=''):
+    global all_passed
+    if condition:
+        print(f"[OK] {name}")
+    else:
+        print(f"[FAIL] {name} {detail}")
+        all_passed = False
+
+# Faux FFmpeg: décode un WAV mono 16 bits (fichier ou URL) avec -ss / -t vers du s16le,
+# comme le ferait ffmpeg pour ce format; chaque appel est noté
+FAKE_FFMPEG = f'''#!{sys.executable}
+import io, os, sys, json, wave, urllib.request
+args = sys.argv[1:]
+if '-version' in args:
+    print('ffmpeg version 9.9-fake')
+if '-version' in args or '-encoders' in args:
+    sys.exit(0)
+with open(os.environ['FAKE_FFMPEG_LOG'], 'a') as log:
+    log.write(json.dumps(args) + '\\n')
+source = args[args.index('-i') + 1]
+data = urllib.request.urlopen(source).read() if source.startswith('http') else open(source, 'rb').read()
+with wave.open(io.BytesIO(data)) as wav:
+    rate = wav.getframerate()
+    frames = wav.readframes(wav.getnframes())
+start = int(float(args[args.index('-ss') + 1]) * rate) * 2 if '-ss' in args else 0
+end = start + int(float(args[args.index('-t') + 1]) * rate) * 2 if '-t' in args else len(frames)
+output = args[-1]
+if output == 'pipe:1':
+    sys.stdout.buffer.write(frames[start:end])
+else:
+    with open(output, 'wb') as f:
+        f.write(frames[start:end])
+'''
+
+class WavHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(WAV)))
+        self.end_headers()
+        self.wfile.write(WAV)
+
+    def log_message(self, *args):
+        pass
+
+def calls():
+    if not os.path.exists(log_path):
+        return []
+    with open(log_path) as f:
+        return [json.loads(line) for line in f]
+
+# Sinus d'une minute dont la fréquence change chaque seconde: chaque fenêtre est reconnaissable
+rate = pcm.SAMPLE_RATE
+t = np.arange(rate * 60) / rate
+SAMPLES = (np.sin(2 * np.pi * (200 + 10 * np.floor(t)) * t) * 8000).astype(pcm.SAMPLE_DTYPE)
+WAV = pcm.to_wav(SAMPLES)
+# Fenêtres demandées par la reconnaissance: (timecode, durée attendue), comme l'ancien extract_audio_segment
+WINDOWS = [(0, 10), (30, 10), (55, 5)]
+
+ffmpeg = shutil.which('ffmpeg')
+workdir = tempfile.mkdtemp()
+log_path = os.path.join(workdir, 'ffmpeg.log')
+os.environ['FAKE_FFMPEG_LOG'] = log_path
+if ffmpeg is None:
+    if os.name == 'nt':
+        print("[SKIP] ffmpeg introuvable et faux FFmpeg impossible sans shebang POSIX")
+        sys.exit(0)
+    ffmpeg_folder = tempfile.mkdtemp()
+    for name in ('ffmpeg', 'ffprobe'):
+        path = os.path.join(ffmpeg_folder, name)
+        with open(path, 'w') as f:
+            f.write(FAKE_FFMPEG)
+        os.chmod(path, 0o755)
+else:
+    ffmpeg_folder = os.path.dirname(ffmpeg)
+downloader.setup(workdir, ffmpeg_folder)
+
+server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), WavHandler)
+threading.Thread(target=server.serve_forever, daemon=True).start()
+stream_url = f'http://127.0.0.1:{server.server_port}/tone.wav'
+source_path = os.path.join(workdir, 'tone.wav')
+with open(source_path, 'wb') as f:
+    f.write(WAV)
+
+def fake_download_for_recognition(url, output_path, encode=True):
+    shutil.copy(source_path, output_path)
+    return output_path
+
+downloader.download_for_recognition = fake_download_for_recognition
+
+def matches(window, timecode, duration):
+    expected = SAMPLES[timecode * rate:(timecode + duration) * rate]
+    return window is not None and len(window) == len(expected) and np.abs(window.astype(int) - expected).max() <= 1
+
+for mode in ('stream', 'download'):
+    print(f"\nTesting {mode} windows...\n")
+    downloader.resolve_recognition_stream = lambda url: (
+        {'url': stream_url, 'protocol': 'http', 'duration': 60} if mode == 'stream' else None)
+    job_dir = tempfile.mkdtemp()
+    before = len(calls())
+    audio = downloader.RecognitionAudio('https://example.com/mix', job_dir)
+    windows = [audio.window(timecode, 10) for timecode, _ in WINDOWS]
+    for (timecode, duration), window in zip(WINDOWS, windows):
+        check(f"window at {timecode}s has the source samples ({duration}s)", matches(window, timecode, duration),
+              None if window is None else len(window) / rate)
+    check("timecode past the end gives None", audio.window(70, 10) is None)
+    if ffmpeg is None:
+        decodes = calls()[before:]
+        if mode == 'stream':
+            check("each window is read from the stream at its offset",
+                  [float(args[args.index('-ss') + 1]) for args in decodes] == [tc for tc, _ in WINDOWS], decodes)
+        else:
+            check("the file is decoded once for every window", len(decodes) == 1 and '-ss' not in decodes[0], decodes)
+    audio.close()
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
@@ -0,0 +1,93 @@
+"""Test script for the job scheduler"""
+import sys
+import time
+import threading
+sys.path.insert(0, '.')
+from scheduler import JobScheduler, QueueFullError, PRIORITY_SINGLE, PRIORITY_PLAYLIST
+
+all_passed = True
+progress = {}
+order = []
+release = threading.Event()
+
+# Un seul worker, une file de 2 places
+scheduler = JobScheduler(workers=1, max_queue=2, progress_dict=progress)
+
+scheduler.submit('running', lambda: (release.wait(), order.append('running')))
+time.sleep(0.1)
+scheduler.submit('playlist', lambda: order.append('playlist'), PRIORITY_PLAYLIST)
+scheduler.submit('single', lambda: order.append('single'), PRIORITY_SINGLE)
+
+if progress['single']['queue_position'] == 1 and progress['playlist']['queue_position'] == 2:
+    print("[OK] queue positions are published (single track ahead of playlist)")
+else:
+    print(f"[FAIL] queue positions: {progress}")
+    all_passed = False
+
+try:
+    scheduler.submit('overflow', lambda: None)
+    print("[FAIL] full queue should raise QueueFullError")
+    all_passed = False
+except QueueFullError as e:
+    print(f"[OK] full queue rejected (retry after {e.retry_after}s)")
+
+release.set()
+time.sleep(0.3)
+
+if order == ['running', 'single', 'playlist']:
+    print(f"[OK] execution order: {order}")
+else:
+    print(f"[FAIL] execution order: {order}")
+    all_passed = False
+
+# Plusieurs workers: la file se vide par vagues de 4 jobs (durée moyenne initiale: 30 s)
+blocked = threading.Event()
+pool = JobScheduler(workers=4, max_queue=8)
+for i in range(4):
+    pool.submit(f'running{i}', blocked.wait)
+time.sleep(0.1)
+for i in range(8):
+    pool.submit(f'queued{i}', blocked.wait)
+try:
+    pool.submit('overflow', lambda: None)
+    print("[FAIL] full queue should raise QueueFullError")
+    all_passed = False
+except QueueFullError as e:
+    if e.retry_after == 90:
+        print(f"[OK] retry estimate with 4 workers: {e.retry_after}s")
+    else:
+        print(f"[FAIL] retry estimate with 4 workers: {e.retry_after}s (expected 90)")
+        all_passed = False
+blocked.set()
+
+# Les positions sont publiées hors du verrou de la file: stats() (qui le prend) répond pendant l'écriture
+class LockCheckingDict(dict):
+    held = False
+
+    def __setitem__(self, key, value):
+        probe = threading.Thread(target=locked.stats)
+        probe.start()
+        probe.join(0.5)
+        if probe.is_alive():
+            LockCheckingDict.held = True
+        super().__setitem__(key, value)
+
+published = LockCheckingDict()
+hold = threading.Event()
+locked = JobScheduler(workers=1, max_queue=5, progress_dict=published)
+locked.submit('first', hold.wait)
+time.sleep(0.1)
+locked.submit('second', lambda: None)
+hold.set()
+time.sleep(0.1)
+if not LockCheckingDict.held and published['second']['queue_position'] == 1:
+    print("[OK] queue positions are published without holding the queue lock")
+else:
+    print(f"[FAIL] positions published under the queue lock: {published}")
+    all_passed = False
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
@@ -0,0 +1,61 @@
+"""Test script for request coalescing"""
+import sys
+import asyncio
+sys.path.insert(0, '.')
+from singleflight import SingleFlight
+
+all_passed = True
+calls = []
+
+async def slow_job(name):
+    calls.append(name)
+    await asyncio.sleep(0.1)
+    return f'result-{name}'
+
+async def failing_job():
+    calls.append('fail')
+    await asyncio.sleep(0.05)
+    raise ValueError('boom')
+
+async def main():
+    global all_passed
+    flight = SingleFlight()
+
+    results = await asyncio.gather(*(flight.do('same', lambda: slow_job('same')) for _ in range(5)))
+    if calls == ['same'] and [r for r, _ in results] == ['result-same'] * 5 and sum(shared for _, shared in results) == 4:
+        print("[OK] identical requests share one job")
+    else:
+        print(f"[FAIL] calls={calls} results={results}")
+        all_passed = False
+
+    calls.clear()
+    await flight.do('same', lambda: slow_job('again'))
+    if calls == ['again'] and not flight.running('same'):
+        print("[OK] finished jobs are not reused")
+    else:
+        print(f"[FAIL] calls={calls}")
+        all_passed = False
+
+    calls.clear()
+    outcomes = await asyncio.gather(*(flight.do('bad', failing_job) for _ in range(3)), return_exceptions=True)
+    if calls == ['fail'] and all(isinstance(o, ValueError) for o in outcomes):
+        print("[OK] errors are propagated to every waiter")
+    else:
+        print(f"[FAIL] calls={calls} outcomes={outcomes}")
+        all_passed = False
+
+    calls.clear()
+    await asyncio.gather(flight.do(None, lambda: slow_job('a')), flight.do(None, lambda: slow_job('b')))
+    if sorted(calls) == ['a', 'b']:
+        print("[OK] requests without key are never coalesced")
+    else:
+        print(f"[FAIL] calls={calls}")
+        all_passed = False
+
+asyncio.run(main())
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
@@ -0,0 +1,195 @@
+"""Test script for the persistent spotdl engine (spotdl_engine.py), with a stubbed spotdl package"""
+import sys
+import os
+import time
+import tempfile
+import threading
+sys.path.insert(0, '.')
+
+all_passed = True
+
+def check(name, condition, detail=''):
+    global all_passed
+    if condition:
+        print(f"[OK] {name}")
+    else:
+        print(f"[FAIL] {name} {detail}")
+        all_passed = False
+
+# Faux paquet spotdl: même API que celle utilisée par le moteur, et un `python -m spotdl`
+# pour le sous-processus de repli. FAKE_SPOTDL_BROKEN fait échouer l'initialisation.
+FAKE_SPOTDL = {
+    '__init__.py': '''
+import os
+
+INITS = []
+on_download = None
+
+class Song:
+    def __init__(self, name):
+        self.display_name = name
+
+class Spotdl:
+    def __init__(self, client_id, client_secret, downloader_settings=None):
+        if os.environ.get('FAKE_SPOTDL_BROKEN'):
+            raise RuntimeError('client Spotify indisponible')
+        INITS.append(downloader_settings)
+
+    def search(self, query):
+        return [Song(query[0].rsplit('/', 1)[-1])]
+''',
+    '__main__.py': '''
+import os, sys, json
+args = sys.argv[1:]
+with open(os.environ['FAKE_SPOTDL_LOG'], 'a') as log:
+    log.write(json.dumps(args) + '\\n')
+output = args[args.index('--output') + 1]
+fmt = args[args.index('--format') + 1]
+with open(os.path.join(output, f"Artiste - {args[0].rsplit('/', 1)[-1]}.{fmt}"), 'wb') as f:
+    f.write(b'subprocess')
+''',
+    'utils/__init__.py': '',
+    'utils/config.py': "SPOTIFY_OPTIONS = {'client_id': 'id', 'client_secret': 'secret'}\n",
+    'download/__init__.py': '',
+    'download/downloader.py': '''
+import os
+import asyncio
+import threading
+import spotdl
+
+CREATED = []
+
+class ProgressHandler:
+    update_callback = None
+
+class Tracker:
+    def __init__(self, song, progress):
+        self.song = song
+        self.progress = progress
+
+class Downloader:
+    def __init__(self, settings=None):
+        self.settings = dict(settings or {})
+        self.loop = asyncio.new_event_loop()
+        self.progress_handler = ProgressHandler()
+        # Fournisseurs audio créés une fois pour le format de ce Downloader, comme spotdl
+        self.provider_format = self.settings.get('format', 'mp3')
+        CREATED.append((self.provider_format, threading.current_thread().name))
+
+    def download_multiple_songs(self, songs):
+        async def download(song):
+            if spotdl.on_download:
+                await asyncio.get_running_loop().run_in_executor(None, spotdl.on_download, song)
+            if self.progress_handler.update_callback:
+                self.progress_handler.update_callback(Tracker(song, 100), 'Done')
+            path = self.settings['output'].replace('{output-ext}', self.provider_format)
+            path = path.format(artists='Artiste', title=song.display_name)
+            with open(path, 'wb') as f:
+                f.write(self.settings['bitrate'].encode())
+            return song, path
+        return list(self.loop.run_until_complete(asyncio.gather(*[download(song) for song in songs])))
+''',
+}
+
+FAKE_FFMPEG = f'''#!{sys.executable}
+import sys
+if '-version' in sys.argv:
+    print('ffmpeg version 9.9-fake')
+'''
+
+if os.name == 'nt':
+    print("[SKIP] fake FFmpeg script needs a POSIX shebang")
+    sys.exit(0)
+
+stub_dir = tempfile.mkdtemp()
+for name, source in FAKE_SPOTDL.items():
+    path = os.path.join(stub_dir, 'spotdl', name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(source)
+sys.path.insert(0, stub_dir)
+os.environ['PYTHONPATH'] = os.pathsep.join([stub_dir, os.environ.get('PYTHONPATH', '')])
+ffmpeg_folder = tempfile.mkdtemp()
+for name in ('ffmpeg', 'ffprobe'):
+    path = os.path.join(ffmpeg_folder, name)
+    with open(path, 'w') as f:
+        f.write(FAKE_FFMPEG)
+    os.chmod(path, 0o755)
+
+import spotdl
+from spotdl.download import downloader as spotdl_downloader
+import spotdl_engine
+import downloader
+
+downloader.setup(tempfile.mkdtemp(), ffmpeg_folder, spotdl_workers=2)
+
+print("Testing format selection...\n")
+engine = spotdl_engine.SpotdlEngine(workers=1)
+out = tempfile.mkdtemp()
+mp3 = engine.download('https://open.spotify.com/track/un', out, 'mp3', '320k')
+opus = engine.download('https://open.spotify.com/track/deux', out, 'opus', '160k')
+again = engine.download('https://open.spotify.com/track/trois', out, 'opus', '160k')
+check("each format gets its own downloader and audio providers",
+      [f for f, _ in spotdl_downloader.CREATED] == ['mp3', 'opus'], spotdl_downloader.CREATED)
+check("files use the requested format and bitrate",
+      mp3 == [os.path.join(out, 'Artiste - un.mp3')] and opus == [os.path.join(out, 'Artiste - deux.opus')]
+      and open(opus[0], 'rb').read() == b'160k', (mp3, opus))
+check("Spotify client is initialised once", len(spotdl.INITS) == 1 and again, spotdl.INITS)
+
+print("\nTesting concurrency...\n")
+engine = spotdl_engine.SpotdlEngine(workers=2)
+barrier = threading.Barrier(2, timeout=5)
+spotdl.on_download = lambda song: barrier.wait()
+results = []
+
+def job(name):
+    try:
+        results.append(engine.download(f'https://open.spotify.com/track/{name}', tempfile.mkdtemp(), 'mp3', '320k'))
+    except Exception as e:
+        results.append(e)
+
+jobs = [threading.Thread(target=job, args=(name,)) for name in ('long', 'court')]
+for thread in jobs:
+    thread.start()
+for thread in jobs:
+    thread.join()
+check("two jobs run at the same time", len(results) == 2 and all(isinstance(r, list) and r for r in results), results)
+
+print("\nTesting timeout...\n")
+release = threading.Event()
+spotdl.on_download = lambda song: song.display_name != 'bloque' or release.wait(10)
+started = time.time()
+try:
+    engine.download('https://open.spotify.com/track/bloque', tempfile.mkdtemp(), 'mp3', '320k', timeout=0.5)
+    timed_out = False
+except spotdl_engine.SpotdlTimeout:
+    timed_out = True
+check("hung download raises SpotdlTimeout", timed_out and time.time() - started < 5)
+later = [engine.download(f'https://open.spotify.com/track/{name}', tempfile.mkdtemp(), 'mp3', '320k', timeout=5)
+         for name in ('debut', 'suite')]
+check("later jobs do not wait for the hung one", all(later) and not release.is_set(), later)
+release.set()
+spotdl.on_download = None
+
+print("\nTesting run_spotdl...\n")
+out = tempfile.mkdtemp()
+files = downloader.run_spotdl('https://open.spotify.com/track/web', out, 'm4a', timeout=5)
+check("engine is created with the configured workers", spotdl_engine._engine.workers == 2, spotdl_engine._engine.workers)
+check("output format is mapped to spotdl's", files == [os.path.join(out, 'Artiste - web.m4a')], files)
+
+log_path = os.path.join(out, 'spotdl.log')
+os.environ['FAKE_SPOTDL_LOG'] = log_path
+os.environ['FAKE_SPOTDL_BROKEN'] = '1'
+spotdl_engine._engine = None
+spotdl.INITS.clear()
+out = tempfile.mkdtemp()
+files = downloader.run_spotdl('https://open.spotify.com/track/repli', out, 'opus', timeout=60)
+args = open(log_path).read() if os.path.exists(log_path) else ''
+check("unavailable engine falls back to python -m spotdl",
+      files == [os.path.join(out, 'Artiste - repli.opus')] and '"--format", "opus"' in args, (files, args))
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
@@ -0,0 +1,117 @@
+"""Test script for the shared job-state backends"""
+import sys
+import os
+import time
+import tempfile
+import threading
+sys.path.insert(0, '.')
+import state
+from progress import ProgressBus
+
+all_passed = True
+
+def check(name, condition, detail=''):
+    global all_passed
+    if condition:
+        print(f"[OK] {name}")
+    else:
+        print(f"[FAIL] {name} {detail}")
+        all_passed = False
+
+def make_backends():
+    """Deux instances indépendantes d'un même stockage (comme deux workers gunicorn)"""
+    db_path = os.path.join(tempfile.mkdtemp(), 'state.db')
+    backends = [
+        ('memory', state.MemoryBackend, None),
+        ('sqlite', lambda: state.create_backend(f'sqlite:///{db_path}'), None),
+    ]
+    try:
+        import fakeredis
+        server = fakeredis.FakeServer()
+        backends.append(('redis', lambda: state.RedisBackend(client=fakeredis.FakeRedis(server=server)), None))
+    except ImportError:
+        backends.append(('redis', None, "fakeredis n'est pas installé"))
+    return backends
+
+for name, factory, skip_reason in make_backends():
+    print(f"\nTesting {name} backend...\n")
+    if factory is None:
+        print(f"[SKIP] {skip_reason}")
+        continue
+
+    backend = factory()
+    first = backend.set('progress', 'job', {'percent': 10, 'status': 'downloading'})
+    second = backend.set('progress', 'job', {'percent': 20, 'status': 'downloading'})
+    version, value, _ = backend.get('progress', 'job')
+    check("set increments versions", 0 < first < second and version == second, (first, second, version))
+    check("get returns the last value", value == {'percent': 20, 'status': 'downloading'}, value)
+    check("namespaces are separate", backend.get('archives', 'job') is None and backend.keys('progress') == ['job'])
+    check("delete reports missing entries", backend.delete('progress', 'job') and not backend.delete('progress', 'job'))
+
+    check("claim only creates missing entries",
+          backend.claim('inflight', 'key', {'progress_id': 'a'}) and not backend.claim('inflight', 'key', {'progress_id': 'b'})
+          and backend.get('inflight', 'key')[1] == {'progress_id': 'a'})
+    claimed = backend.get('inflight', 'key')[0]
+    updated = backend.set('inflight', 'key', {'progress_id': 'a', 'status': 'done'})
+    check("conditional delete ignores a changed entry",
+          not backend.delete('inflight', 'key', claimed) and backend.delete('inflight', 'key', updated) and backend.get('inflight', 'key') is None)
+
+    # Version lue avant une suppression puis une nouvelle réclamation (ABA): elle ne doit pas
+    # permettre de supprimer l'entrée du nouveau propriétaire
+    backend.claim('inflight', 'aba', {'progress_id': 'a'})
+    stale = backend.get('inflight', 'aba')[0]
+    backend.delete('inflight', 'aba', stale)
+    backend.claim('inflight', 'aba', {'progress_id': 'c'})
+    recreated = backend.set('progress', 'job', {})
+    backend.delete('progress', 'job')
+    check("versions are never reused after a delete", backend.get('inflight', 'aba')[0] > stale and recreated > updated)
+    check("stale version cannot delete a newer claim",
+          not backend.delete('inflight', 'aba', stale) and backend.get('inflight', 'aba')[1] == {'progress_id': 'c'})
+
+    # Plusieurs "workers" (instances distinctes) réclament la même clé en même temps: un seul gagne
+    instances = [factory() for _ in range(8)] if backend.shared else [backend] * 8
+    barrier = threading.Barrier(len(instances))
+    winners = []
+
+    def contend(instance, name):
+        barrier.wait()
+        if instance.claim('inflight', 'race', {'progress_id': name}):
+            winners.append(name)
+
+    threads = [threading.Thread(target=contend, args=(instance, str(i))) for i, instance in enumerate(instances)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    check("concurrent claims have a single winner", len(winners) == 1 and backend.get('inflight', 'race')[1]['progress_id'] == winners[0], winners)
+
+    if not backend.shared:
+        continue
+
+    # Un abonné d'un "processus" voit les écritures faites par un autre
+    writer = ProgressBus(backend=factory(), poll_interval=0.05)
+    reader = ProgressBus(min_interval=0.01, backend=factory(), poll_interval=0.05)
+    received = []
+
+    def watch():
+        for event in reader.subscribe('shared', timeout=3, keepalive=1):
+            if event is not None:
+                received.append(event[1])
+
+    watcher = threading.Thread(target=watch)
+    watcher.start()
+    time.sleep(0.1)
+    writer['shared'] = {'percent': 50, 'status': 'downloading'}
+    time.sleep(0.2)
+    writer['shared'] = {'percent': 100, 'status': 'completed', 'file_id': 'abc'}
+    watcher.join(3)
+    check("progress written by another instance reaches subscribers",
+          not watcher.is_alive() and received and received[-1].get('file_id') == 'abc', received)
+    check("entries are visible from every instance", reader.get('shared', {}).get('status') == 'completed' and 'shared' in list(reader))
+    check("expire works on shared entries", writer.expire(-1) == 1 and len(reader) == 0)
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
@@ -0,0 +1,117 @@
+"""Test script for the storage quota manager"""
+import sys
+import os
+import time
+import tempfile
+sys.path.insert(0, '.')
+import storage
+
+all_passed = True
+folder = tempfile.mkdtemp()
+protected = os.path.join(folder, 'building.zip')
+storage.setup(folder, max_bytes=1000, high_water=0.9, low_water=0.6, min_free=0,
+              is_evictable=lambda path: path != protected)
+
+def write(name, size, age):
+    path = os.path.join(folder, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+oldest = write('oldest.mp3', 200, 300)
+served = write('served.mp3', 200, 200)
+recent = write('recent.mp3', 200, 100)
+write('building.zip', 200, 400)
+storage.mark_used(served)
+
+# 800 octets occupés: une réservation de 200 dépasse le seuil haut (900)
+with storage.reserve(200, os.path.join(folder, '.jobs', 'job')):
+    if not os.path.exists(oldest) and not os.path.exists(recent) and os.path.exists(served) and os.path.exists(protected):
+        print("[OK] LRU results evicted, recently served and protected files kept")
+    else:
+        print(f"[FAIL] eviction left {sorted(os.listdir(folder))}")
+        all_passed = False
+
+    if storage.stats()['reserved_bytes'] == 200:
+        print("[OK] reservation counted until released")
+    else:
+        print(f"[FAIL] reserved {storage.stats()['reserved_bytes']}")
+        all_passed = False
+
+    try:
+        storage.reserve(700)
+        print("[FAIL] reservation beyond the quota accepted")
+        all_passed = False
+    except storage.StorageFullError as e:
+        print(f"[OK] refused: {e}")
+
+if storage.stats()['reserved_bytes'] == 0:
+    print("[OK] reservation released")
+else:
+    print("[FAIL] reservation still counted")
+    all_passed = False
+
+# Ce qui est déjà écrit dans le dossier du job est déduit de la réservation au passage du janitor
+workdir = os.path.join(folder, '.jobs', 'job')
+os.makedirs(workdir)
+reservation = storage.reserve(300, workdir)
+with open(os.path.join(workdir, 'audio.part'), 'wb') as f:
+    f.write(b'x' * 100)
+storage.enforce()
+if storage.stats()['reserved_bytes'] == 200:
+    print("[OK] written bytes are not counted twice")
+else:
+    print(f"[FAIL] reserved {storage.stats()['reserved_bytes']}")
+    all_passed = False
+reservation.release()
+os.remove(os.path.join(workdir, 'audio.part'))
+
+# Espace occupé tenu par compteurs: stats() ne parcourt pas le dossier
+used = storage.stats()['used_bytes']
+published = write('published.mp3', 100, 0)
+if storage.stats()['used_bytes'] == used:
+    print("[OK] stats() does not walk the folder")
+else:
+    print("[FAIL] stats() walked the folder")
+    all_passed = False
+storage.added(published)
+if storage.stats()['used_bytes'] == used + 100:
+    print("[OK] published file is counted")
+else:
+    print(f"[FAIL] used {storage.stats()['used_bytes']} after publish (was {used})")
+    all_passed = False
+storage.remove(published)
+if storage.stats()['used_bytes'] == used and not os.path.exists(published):
+    print("[OK] deleted file is uncounted")
+else:
+    print(f"[FAIL] used {storage.stats()['used_bytes']} after delete (was {used})")
+    all_passed = False
+write('untracked.mp3', 100, 0)
+storage.enforce()
+if storage.stats()['used_bytes'] == used + 100:
+    print("[OK] janitor pass resynchronizes the counters")
+else:
+    print(f"[FAIL] used {storage.stats()['used_bytes']} after refresh (expected {used + 100})")
+    all_passed = False
+
+# Les fichiers conservés avec -no_delete (sous-dossier) ne sont jamais évincés
+kept = write(os.path.join('kept', 'kept.mp3'), 300, 1000)
+storage.enforce()
+try:
+    storage.reserve(250).release()
+except storage.StorageFullError:
+    pass
+if os.path.exists(kept):
+    print("[OK] kept files are not evicted")
+else:
+    print("[FAIL] kept file evicted")
+    all_passed = False
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
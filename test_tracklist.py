@@ -0,0 +1,67 @@
+"""Test script for full-mix scanning (probe planning and tracklist merging)"""
+import sys
+import numpy as np
+sys.path.insert(0, '.')
+import pcm
+import tracklist
+
+all_passed = True
+
+def check(name, condition, detail=''):
+    global all_passed
+    if condition:
+        print(f"[OK] {name}")
+    else:
+        print(f"[FAIL] {name} {detail}")
+        all_passed = False
+
+rate = pcm.SAMPLE_RATE
+rng = np.random.default_rng(1)
+
+def fake_track(seconds, freqs, beat):
+    """Accord pulsé + bruit: chaque 'morceau' a son propre spectre"""
+    t = np.arange(int(seconds * rate)) / rate
+    signal = sum(np.sin(2 * np.pi * f * t) for f in freqs) / len(freqs)
+    envelope = 0.6 + 0.4 * (np.sin(2 * np.pi * beat * t) > 0)
+    return (signal * envelope * 0.5 + rng.normal(0, 0.02, len(t))).astype(np.float32)
+
+def to_buffer(signal):
+    return pcm.PCMBuffer((signal * 32767).astype(pcm.SAMPLE_DTYPE))
+
+print("Testing probe planning...\n")
+first, second, third = fake_track(150, [220, 330, 440], 2), fake_track(200, [1200, 1800, 2500], 3), fake_track(400, [80, 120, 5000], 1.5)
+fade = np.linspace(0, 1, 8 * rate)
+crossfaded = np.concatenate([first[:-len(fade)], first[-len(fade):] * (1 - fade) + second[:len(fade)] * fade, second[len(fade):]])
+mix = np.concatenate([crossfaded, np.zeros(5 * rate, dtype=np.float32), third])
+plan = tracklist.plan_probes(to_buffer(mix))
+
+check("crossfade is detected as a transition", any(140 <= b <= 152 for b in plan.boundaries), plan.boundaries)
+check("silence gap is detected as a transition", any(342 <= b <= 350 for b in plan.boundaries), plan.boundaries)
+check("every track gets a probe", all(any(lo <= p < hi for p in plan.probes) for lo, hi in [(0, 142), (150, 342), (347, 747)]), plan.probes)
+check("long tracks get control probes", sum(1 for p in plan.probes if p >= 347) == 3, plan.probes)
+check("probe count follows transitions, not a fixed grid", len(plan.probes) < len(mix) / rate / 30, plan.probes)
+
+silence = tracklist.plan_probes(to_buffer(np.zeros(120 * rate, dtype=np.float32)))
+check("silence is never probed", silence.probes == [], silence.probes)
+
+print("\nTesting tracklist merging...\n")
+def hit(title):
+    return {'title': title, 'artist': 'DJ', 'shazam_url': None, 'cover_art': None}
+
+hits = [(20, hit('A')), (200, None), (380, hit('a')), (500, hit('B')), (680, hit('B')), (900, hit('C'))]
+entries = tracklist.build_tracklist(hits, boundaries=[0, 450, 880], duration=1000)
+check("identical consecutive hits are merged", [e['title'] for e in entries] == ['A', 'B', 'C'], entries)
+check("a probe without result does not split a track", entries[0]['timecodes'] == [20, 380], entries[0])
+check("ranges snap to detected transitions", [(e['start'], e['end']) for e in entries] == [(0, 450), (450, 880), (880, 1000)],
+      [(e['start'], e['end']) for e in entries])
+
+entries = tracklist.build_tracklist([(30, hit('A')), (90, hit('B'))])
+check("without transitions, a track ends where the next one is heard", [(e['start'], e['end']) for e in entries] == [(30, 90), (90, 100)])
+
+check("timestamps are formatted", (tracklist.format_timestamp(90), tracklist.format_timestamp(3725)) == ('1:30', '1:02:05'))
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
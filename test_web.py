@@ -0,0 +1,234 @@
+"""Test script for the web interface routes (Flask, WSGI level)"""
+import sys
+import os
+import time
+import tempfile
+sys.path.insert(0, '.')
+from werkzeug.test import EnvironBuilder
+import app as web
+import cache
+import downloader
+import metrics
+import storage
+
+all_passed = True
+
+def check(name, condition, detail=''):
+    global all_passed
+    if condition:
+        print(f"[OK] {name}")
+    else:
+        print(f"[FAIL] {name} {detail}")
+        all_passed = False
+
+class ServerFileWrapper:
+    """wsgi.file_wrapper typé comme celui de gunicorn (qui teste isinstance(respiter, file_wrapper))"""
+
+    def __init__(self, filelike, blksize=8192):
+        self.filelike = filelike
+        self.blksize = blksize
+
+    def __iter__(self):
+        while True:
+            data = self.filelike.read(self.blksize)
+            if not data:
+                break
+            yield data
+
+    def close(self):
+        self.filelike.close()
+
+def call(path, headers=None, sendfile=False):
+    """Exécute la requête comme un serveur WSGI; retourne (statut, en-têtes, corps)"""
+    environ = EnvironBuilder(path=path, headers=headers or {}).get_environ()
+    environ['wsgi.file_wrapper'] = ServerFileWrapper
+    captured = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        captured['status'] = int(status.split()[0])
+        captured['headers'] = dict(response_headers)
+
+    respiter = web.app(environ, start_response)
+    try:
+        if sendfile and isinstance(respiter, environ['wsgi.file_wrapper']):
+            # Envoi zero-copy simulé: le serveur lit le fichier sans passer par read()
+            captured['sendfile'] = True
+            with open(respiter.filelike.name, 'rb') as f:
+                body = f.read()
+        else:
+            body = b''.join(respiter)
+    finally:
+        if hasattr(respiter, 'close'):
+            respiter.close()
+    return captured['status'], captured['headers'], body, captured.get('sendfile', False)
+
+upload_folder = tempfile.mkdtemp()
+web.app.config['UPLOAD_FOLDER'] = upload_folder
+content = bytes(range(256)) * 400
+with open(os.path.join(upload_folder, 'abc123.mp3'), 'wb') as f:
+    f.write(content)
+
+class TrackedFile(web.MeteredFile):
+    """MeteredFile qui garde trace des fichiers ouverts par /download"""
+    opened = []
+
+    def __init__(self, file, started):
+        super().__init__(file, started)
+        TrackedFile.opened.append(file)
+
+web.MeteredFile = TrackedFile
+
+print("Testing /download...\n")
+served = metrics.BYTES_SERVED.value(interface='web')
+status, headers, body, sendfile = call('/download/abc123?filename=Titre', sendfile=True)
+check("server file_wrapper class is used (sendfile possible)", sendfile)
+check("whole file is served", status == 200 and body == content and headers.get('Content-Length') == str(len(content)), status)
+check("download name is kept", 'Titre.mp3' in headers.get('Content-Disposition', ''), headers.get('Content-Disposition'))
+check("bytes sent by sendfile are counted", metrics.BYTES_SERVED.value(interface='web') - served == len(content),
+      metrics.BYTES_SERVED.value(interface='web') - served)
+
+served = metrics.BYTES_SERVED.value(interface='web')
+status, _, body, _ = call('/download/abc123')
+check("iterated response is counted", status == 200 and metrics.BYTES_SERVED.value(interface='web') - served == len(content))
+
+status, _, _, _ = call('/download/missing')
+check("unknown file gives 404", status == 404, status)
+
+print("\nTesting resumable downloads...\n")
+etag = headers.get('ETag')
+check("finished file has an ETag and accepts ranges", etag and headers.get('Accept-Ranges') == 'bytes', headers)
+
+served = metrics.BYTES_SERVED.value(interface='web')
+status, range_headers, body, _ = call('/download/abc123', {'Range': 'bytes=100-199'})
+check("Range gives 206 with the requested bytes", status == 206 and body == content[100:200], status)
+check("Content-Range describes the slice", range_headers.get('Content-Range') == f'bytes 100-199/{len(content)}', range_headers.get('Content-Range'))
+check("only the slice is counted", metrics.BYTES_SERVED.value(interface='web') - served == 100,
+      metrics.BYTES_SERVED.value(interface='web') - served)
+
+status, _, body, _ = call('/download/abc123', {'Range': 'bytes=-50'})
+check("suffix range gives the last bytes", status == 206 and body == content[-50:], status)
+
+status, _, body, _ = call('/download/abc123', {'Range': 'bytes=100-199', 'If-Range': etag})
+check("If-Range with the current ETag resumes", status == 206 and body == content[100:200], status)
+status, _, body, _ = call('/download/abc123', {'Range': 'bytes=100-199', 'If-Range': '"stale"'})
+check("If-Range with another ETag sends the whole file", status == 200 and body == content, status)
+
+TrackedFile.opened.clear()
+status, _, _, _ = call('/download/abc123', {'Range': f'bytes={len(content)}-'})
+check("unsatisfiable range gives 416", status == 416, status)
+check("416 closes the file", TrackedFile.opened and all(f.closed for f in TrackedFile.opened), TrackedFile.opened)
+
+served = metrics.BYTES_SERVED.value(interface='web')
+status, _, body, _ = call('/download/abc123', {'If-None-Match': etag})
+check("If-None-Match with the current ETag gives 304", status == 304 and body == b'', status)
+check("304 sends and counts no bytes", metrics.BYTES_SERVED.value(interface='web') == served)
+check("304 closes the file", TrackedFile.opened and all(f.closed for f in TrackedFile.opened), TrackedFile.opened)
+
+print("\nTesting batch progress...\n")
+check("playlist and batch workers come from app.config", downloader.PLAYLIST_WORKERS == web.app.config['PLAYLIST_WORKERS'])
+published = {}
+tracker = web.BatchProgress('b1', [{'url': 'u1'}, {'url': 'u2'}], published)
+try:
+    # Mise à jour telle qu'envoyée par le progress_hook YouTube (pas de 'status')
+    tracker['0'] = {'percent': 10, 'eta_seconds': 1, 'speed': 1, 'downloaded': 1, 'total': 10}
+    item = published['b1']['items'][0]
+    check("hook update without status is accepted", item['status'] == 'downloading' and item['percent'] == 10, item)
+except KeyError as e:
+    check("hook update without status is accepted", False, repr(e))
+tracker[1] = {'percent': 100, 'status': 'completed'}
+check("batch percent combines items", published['b1']['percent'] == 55 and published['b1']['completed_items'] == 1, published['b1'])
+
+print("\nTesting batch archive reservation...\n")
+reserved_during = []
+
+def fake_convert_item(url, source_type, custom_filename, audio_format, file_id, item_key, tracker, check_cache=True):
+    reserved_during.append(storage.stats()['reserved_bytes'])
+    path = os.path.join(upload_folder, f'{file_id}.mp3')
+    with open(path, 'wb') as f:
+        f.write(url.encode())
+    return path, f'Titre {item_key}'
+
+batch_items = [{'url': f'https://www.youtube.com/watch?v=batch{i}', 'source_type': 'youtube', 'format': 'mp3'} for i in range(3)]
+archive_bytes = sum(downloader.estimate_output_bytes(None, 'mp3') for _ in batch_items)
+convert_item = web.convert_item
+web.convert_item = fake_convert_item
+try:
+    reserved = storage.stats()['reserved_bytes']
+    web.process_batch('batch-reserve', batch_items, 'lot')
+    check("archive space is reserved while the batch runs", reserved_during and min(reserved_during) >= reserved + archive_bytes, reserved_during)
+    check("reservation is released with the finished archive", storage.stats()['reserved_bytes'] == reserved
+          and web.download_progress['batch-reserve']['status'] == 'completed', storage.stats())
+
+    reserve = storage.reserve
+    def full_reserve(nbytes, path=None):
+        raise storage.StorageFullError(nbytes, 0)
+    storage.reserve = full_reserve
+    try:
+        reserved_during.clear()
+        web.process_batch('batch-full', batch_items, 'lot')
+    finally:
+        storage.reserve = reserve
+    check("full storage fails the batch before converting", web.download_progress['batch-full']['status'] == 'error'
+          and not reserved_during and not os.path.exists(os.path.join(upload_folder, 'batch-full.zip')), web.download_progress['batch-full'])
+finally:
+    web.convert_item = convert_item
+
+print("\nTesting conversion coalescing...\n")
+web.download_progress['leader'] = {'status': 'downloading', 'percent': 5}
+check("first request registers itself", web.join_inflight('same-media', 'leader') is None)
+check("identical request joins the running conversion", web.join_inflight('same-media', 'follower') == 'leader')
+web.download_progress['leader'] = {'status': 'completed', 'percent': 100}
+check("finished conversion is replaced", web.join_inflight('same-media', 'next') is None and web.inflight['same-media']['progress_id'] == 'next')
+web.leave_inflight('same-media', 'leader')
+check("leaving does not drop another conversion's entry", web.inflight['same-media']['progress_id'] == 'next')
+web.leave_inflight('same-media', 'next')
+check("leaving frees the entry", 'same-media' not in web.inflight)
+
+# Un lecteur a vu l'entrée d'une conversion terminée; entre-temps le meneur l'a retirée et
+# une nouvelle conversion s'est inscrite: la suppression tardive du lecteur doit échouer
+web.join_inflight('raced-media', 'old-leader')
+web.download_progress['old-leader'] = {'status': 'completed', 'percent': 100}
+stale_version, _ = web.inflight.entry('raced-media')
+web.leave_inflight('raced-media', 'old-leader')
+web.download_progress['new-leader'] = {'status': 'downloading', 'percent': 5}
+check("new conversion registers after the old one left", web.join_inflight('raced-media', 'new-leader') is None)
+check("stale reader cannot remove the new leader", not web.inflight.discard('raced-media', stale_version)
+      and web.join_inflight('raced-media', 'follower') == 'new-leader')
+web.leave_inflight('raced-media', 'new-leader')
+
+print("\nTesting conversion cache...\n")
+cache.setup(tempfile.mkdtemp())
+conversions = []
+
+def fake_download_track(url, source_type, output_path, custom_filename=None, progress_id=None, progress_dict=None, audio_format='mp3'):
+    conversions.append(url)
+    with open(output_path, 'wb') as f:
+        f.write(b'converted')
+    return output_path, 'Titre'
+
+def convert(url):
+    body, status, _ = web.start_conversion({'url': url})
+    deadline = time.time() + 10
+    while web.download_progress.get(body['progress_id'], {}).get('status') not in web.TERMINAL_STATUSES and time.time() < deadline:
+        time.sleep(0.05)
+    return web.download_progress.get(body['progress_id'], {})
+
+download_track = downloader.download_track
+downloader.download_track = fake_download_track
+try:
+    hits, misses = metrics.CACHE_REQUESTS.value(result='hit'), metrics.CACHE_REQUESTS.value(result='miss')
+    first = convert('https://www.youtube.com/watch?v=cachetest01')
+    check("converted file is stored in the cache", first.get('status') == 'completed' and len(conversions) == 1, first)
+    check("one miss is counted per conversion", metrics.CACHE_REQUESTS.value(result='miss') - misses == 1
+          and metrics.CACHE_REQUESTS.value(result='hit') == hits, metrics.CACHE_REQUESTS.value(result='miss') - misses)
+    second = convert('https://youtu.be/cachetest01')
+    check("same media is served from the cache", second.get('status') == 'completed' and len(conversions) == 1
+          and metrics.CACHE_REQUESTS.value(result='hit') - hits == 1, second)
+finally:
+    downloader.download_track = download_track
+
+print("\n" + ("="*60))
+if all_passed:
+    print("[SUCCESS] All tests passed!")
+else:
+    print("[FAILED] Some tests failed!")
@@ -0,0 +1,165 @@
+import numpy as np
+
+# Analyse d'un mix complet (!find -scan): une trame d'analyse par seconde
+FRAME_SECONDS = 1
+FFT_SIZE = 2048
+BANDS = 24
+SILENCE_DB = -45.0        # trame silencieuse sous ce niveau (dBFS)
+CONTEXT_SECONDS = 8       # spectre moyen comparé avant / après chaque instant
+TRANSITION_STD = 1.5      # changement retenu au-delà de moyenne + 1,5 écart-type
+MIN_TRACK_SECONDS = 45    # deux transitions détectées sont espacées d'au moins 45s
+PROBE_OFFSET = 20         # sonde placée 20s après une transition (fin du fondu enchaîné)
+MAX_PROBE_GAP = 180       # sonde de contrôle toutes les 3 min sans transition détectée
+CHUNK_FRAMES = 600        # trames traitées par bloc: le PCM projeté n'est jamais chargé en entier
+
+class ScanPlan:
+    """Sondes choisies pour un mix: instants à envoyer à Shazam et transitions détectées (secondes)"""
+
+    def __init__(self, probes, boundaries, duration):
+        self.probes = probes
+        self.boundaries = boundaries
+        self.duration = duration
+
+def _band_edges(sample_rate):
+    # Bandes logarithmiques de ~50 Hz à la fréquence de Nyquist
+    first_bin = max(1, int(50 * FFT_SIZE / sample_rate))
+    edges = np.geomspace(first_bin, FFT_SIZE // 2 + 1, BANDS + 1).astype(int)
+    return np.unique(edges)
+
+def frame_features(buffer):
+    """Énergie (dBFS) et spectre en bandes (log) de chaque seconde du tampon PCM"""
+    frame = int(buffer.sample_rate * FRAME_SECONDS)
+    count = len(buffer.samples) // frame
+    edges = _band_edges(buffer.sample_rate)
+    window = np.hanning(FFT_SIZE).astype(np.float32)
+    offset = max(0, (frame - FFT_SIZE) // 2)
+
+    energy = np.empty(count, dtype=np.float32)
+    spectra = np.empty((count, len(edges) - 1), dtype=np.float32)
+    for first in range(0, count, CHUNK_FRAMES):
+        last = min(count, first + CHUNK_FRAMES)
+        block = np.asarray(buffer.samples[first * frame:last * frame], dtype=np.float32).reshape(last - first, frame)
+        block /= 32768.0
+        energy[first:last] = 10 * np.log10(np.mean(block ** 2, axis=1) + 1e-10)
+        # Spectre sur le centre de chaque seconde: suffisant pour suivre l'évolution du mix
+        magnitude = np.abs(np.fft.rfft(block[:, offset:offset + FFT_SIZE] * window, axis=1))
+        spectra[first:last] = np.log1p(np.add.reduceat(magnitude, edges[:-1], axis=1)[:, :len(edges) - 1])
+    return energy, spectra
+
+def spectral_change(spectra, context=CONTEXT_SECONDS):
+    """Distance cosinus entre les spectres moyens des `context` secondes avant et après chaque instant"""
+    count = len(spectra)
+    change = np.zeros(count, dtype=np.float32)
+    if count < 2 * context:
+        return change
+    sums = np.vstack([np.zeros((1, spectra.shape[1]), dtype=np.float64), np.cumsum(spectra, axis=0, dtype=np.float64)])
+    t = np.arange(context, count - context + 1)
+    before = sums[t] - sums[t - context]
+    after = sums[t + context] - sums[t]
+    norms = np.linalg.norm(before, axis=1) * np.linalg.norm(after, axis=1)
+    change[t] = 1 - np.sum(before * after, axis=1) / np.maximum(norms, 1e-9)
+    return change
+
+def detect_transitions(change, min_gap=MIN_TRACK_SECONDS, threshold_std=TRANSITION_STD):
+    """Pics de changement spectral, du plus marqué au moins marqué, espacés d'au moins min_gap secondes"""
+    active = change[change > 0]
+    if not len(active):
+        return []
+    threshold = active.mean() + threshold_std * active.std()
+    peaks = [i for i in range(1, len(change) - 1)
+             if change[i] > threshold and change[i] >= change[i - 1] and change[i] >= change[i + 1]]
+
+    selected = []
+    for i in sorted(peaks, key=lambda i: change[i], reverse=True):
+        if all(abs(i - j) >= min_gap for j in selected):
+            selected.append(i)
+    return sorted(selected)
+
+def _silence_ends(silent):
+    """Instants où le son reprend après un silence (fin d'un morceau, début du suivant)"""
+    return [i for i in range(1, len(silent)) if silent[i - 1] and not silent[i]]
+
+def plan_probes(buffer, window=10, max_gap=MAX_PROBE_GAP):
+    """Choisit les instants à reconnaître dans un mix complet.
+
+    Une sonde peu après chaque transition détectée (changement spectral ou reprise après
+    un silence), plus une sonde de contrôle toutes les max_gap secondes dans les longs
+    passages sans transition. Les fenêtres majoritairement silencieuses sont ignorées:
+    le nombre de sondes suit le nombre de morceaux au lieu d'une grille fixe.
+    """
+    energy, spectra = frame_features(buffer)
+    count = len(energy)
+    if count == 0:
+        return ScanPlan([], [], buffer.duration)
+
+    silent = energy < SILENCE_DB
+    transitions = detect_transitions(spectral_change(spectra))
+    boundaries = sorted(set([0] + transitions + _silence_ends(silent)))
+
+    probes = []
+    for i, start in enumerate(boundaries):
+        end = boundaries[i + 1] if i + 1 < len(boundaries) else count
+        length = end - start
+        if length < window and count >= window:
+            continue
+        timecode = start + min(PROBE_OFFSET, max(0, (length - window) // 2))
+        while True:
+            if np.mean(silent[timecode:timecode + window]) < 0.5:
+                probes.append(int(buffer.start + timecode))
+            timecode += max_gap
+            if timecode + window > end:
+                break
+    return ScanPlan(probes, [int(buffer.start + b) for b in boundaries], buffer.end)
+
+def build_tracklist(hits, boundaries=(), duration=None, window=10):
+    """Fusionne les reconnaissances consécutives d'un même morceau en plages horaires.
+
+    hits: [(timecode, résultat ou None)] dans l'ordre des timecodes. Une sonde sans
+    résultat n'interrompt pas un morceau reconnu avant et après elle. Le début de chaque
+    plage est ramené à la transition qui précède sa première sonde, la fin à la transition
+    qui suit sa dernière sonde (sans dépasser le morceau suivant).
+    """
+    tracklist = []
+    for timecode, hit in sorted(hits, key=lambda item: item[0]):
+        if not hit:
+            continue
+        key = (hit['title'].lower(), hit['artist'].lower())
+        if tracklist and tracklist[-1]['key'] == key:
+            tracklist[-1]['timecodes'].append(timecode)
+            continue
+        tracklist.append({
+            'key': key,
+            'title': hit['title'],
+            'artist': hit['artist'],
+            'shazam_url': hit.get('shazam_url'),
+            'cover_art': hit.get('cover_art'),
+            'timecodes': [timecode],
+        })
+
+    boundaries = sorted(boundaries)
+    previous_end = 0
+    for i, entry in enumerate(tracklist):
+        first, last = entry['timecodes'][0], entry['timecodes'][-1]
+        starts = [b for b in boundaries if previous_end <= b <= first]
+        entry['start'] = starts[-1] if starts else first
+
+        following = tracklist[i + 1]['timecodes'][0] if i + 1 < len(tracklist) else None
+        ends = [b for b in boundaries if b > last and (following is None or b <= following)]
+        if ends:
+            entry['end'] = ends[0]
+        elif following is not None:
+            entry['end'] = following
+        else:
+            entry['end'] = max(last + window, int(duration)) if duration else last + window
+        previous_end = entry['end']
+        del entry['key']
+    return tracklist
+
+def format_timestamp(seconds):
+    """90 -> '1:30', 3725 -> '1:02:05'"""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes}:{secs:02d}"